@@ -0,0 +1,27 @@
+"""Per-user locations for the application's caches and state."""
+import os
+import sys
+
+APP_NAME = 'funlight-converter'
+
+
+def _windows_base():
+    return os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+
+
+def cache_dir():
+    """Directory for data that can be rebuilt at any time (probe results, metadata)."""
+    if sys.platform == 'win32':
+        base = _windows_base()
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, APP_NAME)
+
+
+def data_dir():
+    """Directory for state that must survive restarts (e.g. the job journal)."""
+    if sys.platform == 'win32':
+        base = _windows_base()
+    else:
+        base = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    return os.path.join(base, APP_NAME)
@@ -0,0 +1,171 @@
+"""Shared download bandwidth limit with per-job priorities.
+
+All jobs draw from one token bucket refilled at ``limit`` bytes per
+second. A job pays for every chunk after yt-dlp read it (from the progress
+hook); when the bucket is empty the job's download thread waits, which
+in turn stops it from reading the socket. Waiting jobs are served in
+order of their virtual finish time (start-time fair queuing): every job
+advances its virtual clock by ``bytes / weight``, so under contention a
+job gets bandwidth in proportion to its weight, while a job that is alone,
+or whose peers cannot use their share, gets everything. ``limit=None``
+turns the bucket off and only the throughput metrics are kept.
+
+Priorities map to weights (``PRIORITY_WEIGHTS``); both the limit and a
+job's priority can be changed while downloads are running.
+
+Downloads that yt-dlp hands to ffmpeg (e.g. time ranges) report no
+per-chunk progress and are not throttled.
+"""
+import threading
+import time
+
+PRIORITY_WEIGHTS = {
+    'low': 1,
+    'normal': 4,
+    'high': 16,
+}
+
+# Seconds of traffic the bucket may save up while jobs are idle
+BURST_SECONDS = 0.25
+
+
+class BandwidthShare:
+    """One job's handle on the scheduler; ``consume`` is called per chunk."""
+
+    def __init__(self, scheduler, job_id, priority):
+        self.scheduler = scheduler
+        self.job_id = job_id
+        self.priority = priority
+        self.weight = PRIORITY_WEIGHTS[priority]
+        self.vtime = 0.0
+        self.bytes = 0
+        self.waited = 0.0
+        self.first = None  # monotonic time of the first and the latest chunk
+        self.last = None
+        self.cancelled = False
+
+    def consume(self, nbytes):
+        self.scheduler._consume(self, nbytes)
+
+    def cancel(self):
+        """Wake the job up if it is waiting for tokens."""
+        self.scheduler._cancel(self)
+
+    def close(self):
+        self.scheduler._unregister(self)
+
+    def stats(self):
+        return self.scheduler._stats(self)
+
+
+class BandwidthScheduler:
+    def __init__(self, limit=None):
+        self.limit = limit
+        self._tokens = 0.0
+        self._refilled = time.monotonic()
+        self._vclock = 0.0
+        self._shares = {}
+        self._waiting = []
+        self._cond = threading.Condition()
+
+    def register(self, job_id, priority='normal'):
+        share = BandwidthShare(self, job_id, priority)
+        with self._cond:
+            share.vtime = self._vclock
+            self._shares[job_id] = share
+        return share
+
+    def set_limit(self, limit):
+        """Cap the total download rate at ``limit`` bytes/s; None or 0 lifts the cap."""
+        with self._cond:
+            self._refill()
+            self.limit = limit or None
+            self._tokens = min(self._tokens, self._capacity())
+            self._cond.notify_all()
+
+    def set_priority(self, job_id, priority):
+        with self._cond:
+            share = self._shares.get(job_id)
+            if share is not None:
+                share.priority = priority
+                share.weight = PRIORITY_WEIGHTS[priority]
+                self._cond.notify_all()
+
+    def fair_share(self, share):
+        """Bytes/s ``share`` would get if every registered job downloaded at full speed."""
+        with self._cond:
+            return self._fair_share(share)
+
+    def stats(self):
+        """Throughput per job compared with its fair share of the cap."""
+        with self._cond:
+            shares = list(self._shares.values())
+        return [self._stats(share) for share in shares]
+
+    def _capacity(self):
+        return max(self.limit * BURST_SECONDS, 64 * 1024) if self.limit else 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.limit:
+            self._tokens = min(self._capacity(), self._tokens + (now - self._refilled) * self.limit)
+        self._refilled = now
+
+    def _fair_share(self, share):
+        if not self.limit:
+            return None
+        total = sum(s.weight for s in self._shares.values()) or share.weight
+        return self.limit * share.weight / total
+
+    def _consume(self, share, nbytes):
+        share.bytes += nbytes
+        share.last = time.monotonic()
+        if share.first is None:
+            share.first = share.last
+        if not self.limit:
+            return
+        with self._cond:
+            share.vtime = max(share.vtime, self._vclock) + nbytes / share.weight
+            self._waiting.append(share)
+            started = time.monotonic()
+            try:
+                while not share.cancelled and self.limit:
+                    self._refill()
+                    head = min(self._waiting, key=lambda s: s.vtime)
+                    if head is share and self._tokens > 0:
+                        # Pay the whole chunk; the bucket may go into debt
+                        self._tokens -= nbytes
+                        self._vclock = share.vtime
+                        break
+                    # The head sleeps until the debt is paid off, the others until it is served
+                    self._cond.wait(max(0.001, -self._tokens / self.limit) if head is share else 0.1)
+            finally:
+                self._waiting.remove(share)
+                share.last = time.monotonic()
+                share.waited += share.last - started
+                self._cond.notify_all()
+
+    def _cancel(self, share):
+        with self._cond:
+            share.cancelled = True
+            self._cond.notify_all()
+
+    def _unregister(self, share):
+        with self._cond:
+            self._shares.pop(share.job_id, None)
+            self._cond.notify_all()
+
+    def _stats(self, share):
+        elapsed = share.last - share.first if share.first is not None else 0.0
+        with self._cond:
+            fair_share = self._fair_share(share)
+        return {
+            'job': share.job_id,
+            'priority': share.priority,
+            'bytes': share.bytes,
+            'seconds': round(elapsed, 3),
+            'rate': round(share.bytes / elapsed) if elapsed > 0 else None,
+            'limit': self.limit,
+            'fair_share': round(fair_share) if fair_share else None,
+            'waited': round(share.waited, 3),
+        }
@@ -0,0 +1,278 @@
+"""End-to-end benchmark of download + conversion, without network access.
+
+Generates test media with ffmpeg's lavfi sources (progressive MP4, WebM,
+audio-only M4A, and HLS and DASH variants of the MP4), serves it from a
+local HTTP server (see ``media_server``) and runs ``ConversionEngine``
+over every media × format case. Each run happens in a fresh subprocess,
+so peak RSS and CPU time (including ffmpeg's) belong to that case alone.
+
+Per case the median of ``--repeat`` runs is recorded:
+
+  wall         - seconds from job start to result
+  ttfb         - seconds until the first media byte arrived
+  bytes_per_s  - download rate after extraction
+  rtf          - real-time factor of the conversion (seconds per media second)
+  peak_rss_mb  - peak RSS of the job process and of its largest child (ffmpeg)
+  cpu_s        - user + system time of the job process and its children
+
+    python benchmarks/bench_pipeline.py -o baseline.json
+    python benchmarks/bench_pipeline.py --compare baseline.json        # run and compare
+    python benchmarks/bench_pipeline.py --compare baseline.json new.json
+
+``--compare`` prints a table of changes and exits with status 1 if any
+metric got worse by more than ``--threshold`` percent.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from media_server import serve  # noqa: E402
+
+VIDEO = ['-f', 'lavfi', '-i', 'testsrc2=size=640x360:rate=25']
+AUDIO = ['-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100']
+H264_AAC = ['-c:v', 'libx264', '-preset', 'ultrafast', '-g', '50', '-c:a', 'aac', '-b:a', '128k']
+
+# name: (path below the duration directory, ffmpeg arguments, has video)
+MEDIA = {
+    'mp4': ('clip.mp4', VIDEO + AUDIO + H264_AAC + ['-movflags', '+faststart'], True),
+    'webm': ('clip.webm', VIDEO + AUDIO + ['-c:v', 'libvpx', '-deadline', 'realtime', '-cpu-used', '8',
+                                           '-b:v', '1M', '-c:a', 'libopus', '-b:a', '96k'], True),
+    'm4a': ('tone.m4a', AUDIO + ['-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart'], False),
+    # fMP4 segments: yt-dlp's fixup for MPEG-TS segments needs ffprobe
+    'hls': ('hls/index.m3u8', VIDEO + AUDIO + H264_AAC + [
+        '-f', 'hls', '-hls_time', '4', '-hls_playlist_type', 'vod', '-hls_segment_type', 'fmp4'], True),
+    'dash': ('dash/manifest.mpd', VIDEO + AUDIO + H264_AAC + [
+        '-map', '0:v', '-map', '1:a', '-f', 'dash', '-seg_duration', '4',
+        '-adaptation_sets', 'id=0,streams=v id=1,streams=a'], True),
+}
+
+FORMATS = ['MP3', 'WAV', 'AAC', 'MP4']
+
+# Metric: True if higher is better, and changes below the floor count as noise
+METRICS = {
+    'wall': (False, 0.05),
+    'ttfb': (False, 0.05),
+    'bytes_per_s': (True, 0),
+    'rtf': (False, 0.005),
+    'peak_rss_mb': (False, 5),
+    'cpu_s': (False, 0.05),
+}
+
+
+def default_media_dir():
+    return os.path.join(tempfile.gettempdir(), 'funlight-bench-media')
+
+
+def generate_media(media_dir, names, durations):
+    """Create the media files that do not exist yet; returns {(name, duration): relative path}."""
+    paths = {}
+    for duration in durations:
+        for name in names:
+            path, args, _ = MEDIA[name]
+            relative = f'{duration}s/{path}'
+            target = os.path.join(media_dir, relative)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                # Write into a scratch directory first so an interrupted run leaves no half-written media
+                scratch = tempfile.mkdtemp(dir=media_dir)
+                try:
+                    subprocess.run(['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', *args,
+                                    '-t', str(duration), os.path.join(scratch, os.path.basename(path))],
+                                   check=True)
+                    for entry in os.listdir(scratch):
+                        os.replace(os.path.join(scratch, entry), os.path.join(os.path.dirname(target), entry))
+                finally:
+                    shutil.rmtree(scratch, ignore_errors=True)
+            paths[name, duration] = relative
+    return paths
+
+
+def run_case(url, format_option, duration, streaming):
+    """Convert ``url`` in this process and return the case's metrics (``--run-case``)."""
+    from converter_engine import ConversionEngine, ConversionJob
+
+    output = tempfile.mkdtemp(prefix='funlight-bench-')
+    try:
+        engine = ConversionEngine(ConversionJob(url, output, format_option), streaming=streaming)
+        result = engine.run()
+        timings = result['timings']
+        transfer = timings['download'] - timings.get('extract', 0)
+        # A streamed conversion runs during the download and is timed as 'stream'
+        convert = timings.get('stream', timings.get('convert'))
+        metrics = {
+            'wall': timings['total'],
+            'ttfb': timings.get('first_byte'),
+            'bytes_per_s': engine.downloaded_bytes / transfer if transfer > 0 else None,
+            'rtf': convert / duration if convert is not None else None,
+        }
+    finally:
+        shutil.rmtree(output, ignore_errors=True)
+    if resource is not None:
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        unit = 1 if sys.platform == 'darwin' else 1024
+        metrics['peak_rss_mb'] = (own.ru_maxrss + children.ru_maxrss) * unit / (1024 * 1024)
+        metrics['cpu_s'] = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    return metrics
+
+
+def run_case_subprocess(url, format_option, duration, streaming):
+    cmd = [sys.executable, os.path.abspath(__file__), '--run-case', url, format_option, str(duration)]
+    if streaming:
+        cmd.append('--stream')
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f'exit code {proc.returncode}')
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def median_metrics(runs):
+    merged = {}
+    for name in METRICS:
+        values = [run[name] for run in runs if run.get(name) is not None]
+        merged[name] = round(statistics.median(values), 4) if values else None
+    return merged
+
+
+def machine_info():
+    import yt_dlp
+
+    ffmpeg = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.split('\n')[0]
+    return {
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': ffmpeg,
+        'yt_dlp': yt_dlp.version.__version__,
+    }
+
+
+def run_suite(args):
+    names = args.media.split(',')
+    durations = [int(d) for d in args.durations.split(',')]
+    formats = [f.upper() for f in args.formats.split(',')]
+    media_dir = args.media_dir or default_media_dir()
+    os.makedirs(media_dir, exist_ok=True)
+    print(f'Generating media in {media_dir}...', file=sys.stderr)
+    paths = generate_media(media_dir, names, durations)
+
+    cases = {}
+    with serve(media_dir) as base_url:
+        for (name, duration), relative in paths.items():
+            for format_option in formats:
+                if format_option == 'MP4' and not MEDIA[name][2]:
+                    continue
+                case = f'{name}-{duration}s/{format_option}'
+                runs = []
+                try:
+                    for _ in range(args.repeat):
+                        runs.append(run_case_subprocess(f'{base_url}/{relative}', format_option,
+                                                        duration, args.stream))
+                except RuntimeError as e:
+                    print(f'{case:20s} failed: {e}', file=sys.stderr)
+                    cases[case] = {'error': str(e)}
+                    continue
+                cases[case] = dict(median_metrics(runs), runs=len(runs))
+                print(f'{case:20s} ' + ' '.join(f'{key}={value}' for key, value in cases[case].items()
+                                                 if key in METRICS), file=sys.stderr)
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': machine_info(),
+        'config': {'repeat': args.repeat, 'stream': args.stream},
+        'cases': cases,
+    }
+
+
+def compare(baseline, current, threshold, metrics=METRICS):
+    """Print the change of every metric in ``metrics``; returns the list of regressions."""
+    regressions = []
+    if baseline.get('config') != current.get('config') or baseline.get('machine') != current.get('machine'):
+        print('Note: the baseline was recorded with a different configuration or machine')
+    for case, values in sorted(current['cases'].items()):
+        old = baseline['cases'].get(case)
+        if old is None or 'error' in old:
+            continue
+        if 'error' in values:
+            print(f'{case:20s} failed: {values["error"]}')
+            regressions.append((case, 'error'))
+            continue
+        changes = []
+        for name, (higher_is_better, floor) in metrics.items():
+            before, after = old.get(name), values.get(name)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            worse = change < -threshold if higher_is_better else change > threshold
+            if worse and abs(after - before) > floor:
+                regressions.append((case, name))
+                changes.append(f'{name} {change:+.1f}% REGRESSION')
+            else:
+                changes.append(f'{name} {change:+.1f}%')
+        print(f'{case:20s} ' + ', '.join(changes))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--media', default=','.join(MEDIA), help='media variants (default: all)')
+    parser.add_argument('--durations', default='10,60', help='media durations in seconds')
+    parser.add_argument('-f', '--formats', default=','.join(FORMATS))
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--stream', action='store_true', help='convert audio while downloading')
+    parser.add_argument('--media-dir', help='where generated media is kept between runs')
+    parser.add_argument('-o', '--output', help='write the results as JSON')
+    parser.add_argument('--compare', nargs='+', metavar='JSON',
+                        help='baseline, and optionally results to compare instead of running')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold in percent')
+    parser.add_argument('--run-case', nargs=3, metavar=('URL', 'FORMAT', 'DURATION'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        url, format_option, duration = args.run_case
+        print(json.dumps(run_case(url, format_option, float(duration), args.stream)))
+        return 0
+
+    if args.compare and len(args.compare) > 2:
+        parser.error('--compare takes a baseline and at most one result file')
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[1], encoding='utf-8') as f:
+            results = json.load(f)
+    else:
+        results = run_suite(args)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        elif not args.compare:
+            print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) above {args.threshold:g}%')
+            return 1
+        print('No regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
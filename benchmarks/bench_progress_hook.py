@@ -0,0 +1,126 @@
+"""Micro-benchmark of the per-callback cost of the yt-dlp progress hook.
+
+Feeds synthetic 'downloading' callbacks (as yt-dlp sends them per chunk)
+through each variant and prints the mean cost per callback:
+
+  legacy  - the old DownloadThread hook: percent + formatted status string
+            pushed to two signal emitters on every callback
+  percent - ConversionEngine without a bus, forwarding whole-percent changes
+  bus     - ConversionEngine writing into a ProgressBus
+
+The legacy hook runs twice: with plain callables (a lower bound) and, if
+PyQt5 is installed, with real signals on queued connections, which is
+what a DownloadThread paid per chunk before the UI even repainted.
+
+    python benchmarks/bench_progress_hook.py [-n CALLBACKS] [-r REPEAT]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from converter_engine import ConversionEngine, ConversionJob  # noqa: E402
+from progress_bus import ProgressBus  # noqa: E402
+
+TOTAL_BYTES = 500 * 1024 * 1024
+
+
+def make_events(count):
+    chunk = TOTAL_BYTES // count
+    return [{
+        'status': 'downloading',
+        'downloaded_bytes': chunk * (i + 1),
+        'total_bytes': TOTAL_BYTES,
+        'speed': 12.5 * 1024 * 1024,
+        'eta': count - i,
+    } for i in range(count)]
+
+
+def legacy_hook(progress_emit, status_emit):
+    def progress_hook(d):
+        if d['status'] == 'downloading':
+            try:
+                total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
+                downloaded = d.get('downloaded_bytes', 0)
+                if total > 0:
+                    progress = (downloaded / total) * 100
+                    progress_emit(int(progress))
+                    status_emit(f'Downloading: {progress:.1f}%')
+            except Exception:
+                status_emit('Downloading...')
+    return progress_hook
+
+
+def qt_legacy_hook():
+    try:
+        from PyQt5.QtCore import QCoreApplication, QObject, Qt, pyqtSignal
+    except ImportError:
+        return None
+
+    class Emitter(QObject):
+        progress = pyqtSignal(float)
+        status = pyqtSignal(str)
+
+    class Receiver(QObject):
+        def on_progress(self, value):
+            pass
+
+        def on_status(self, message):
+            pass
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    emitter, receiver = Emitter(), Receiver()
+    emitter.progress.connect(receiver.on_progress, Qt.QueuedConnection)
+    emitter.status.connect(receiver.on_status, Qt.QueuedConnection)
+    # Keep the objects (and the application) alive with the hook
+    hook = legacy_hook(emitter.progress.emit, emitter.status.emit)
+    hook.keepalive = (app, emitter, receiver)
+    return hook
+
+
+def engine_hook(progress_bus=None):
+    emitted = []
+    engine = ConversionEngine(ConversionJob('http://example.invalid/', '.', 'MP3'),
+                              on_progress=emitted.append, on_status=emitted.append,
+                              progress_bus=progress_bus, job_id=1)
+    engine._started = time.monotonic()
+    return engine.progress_hook
+
+
+def measure(hook, events, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for d in events:
+            hook(d)
+        best = min(best, time.perf_counter() - started)
+    return best / len(events)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--callbacks', type=int, default=100000)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    events = make_events(args.callbacks)
+    sink = []
+    variants = [
+        ('legacy', legacy_hook(sink.append, sink.append)),
+        ('legacy-qt', qt_legacy_hook()),
+        ('percent', engine_hook()),
+        ('bus', engine_hook(ProgressBus())),
+    ]
+    print(f'{args.callbacks} callbacks, best of {args.repeat}')
+    for name, hook in variants:
+        if hook is None:
+            print(f'{name:10s} skipped (PyQt5 not installed)')
+            continue
+        per_call = measure(hook, events, args.repeat)
+        print(f'{name:10s} {per_call * 1e9:8.0f} ns/callback')
+
+
+if __name__ == '__main__':
+    main()
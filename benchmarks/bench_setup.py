@@ -0,0 +1,115 @@
+"""Per-job setup latency with and without the YoutubeDL pool.
+
+Runs ``--jobs`` short jobs one after another against the local media
+server (see ``media_server``), once building a YoutubeDL per job as
+before ``ydl_pool`` and once borrowing from a ``YoutubeDLPool``. Each
+mode runs in a fresh process, so neither starts with the other's warm
+state. Per mode the medians over the jobs after the first are printed:
+
+  setup        - seconds to build or borrow the job's YoutubeDL
+  extract      - seconds of the extraction (the generic extractor probes the URL)
+  first_byte   - seconds from job start to the first media byte
+  total        - seconds from job start to result
+  connections  - TCP connections the server accepted per job
+
+    python benchmarks/bench_setup.py --jobs 30 -o setup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import default_media_dir, generate_media  # noqa: E402
+from media_server import MediaServer  # noqa: E402
+
+MODES = ['fresh', 'pooled']
+METRICS = ['setup', 'extract', 'first_byte', 'total']
+
+
+def run_mode(mode, url, jobs, format_option):
+    """Run ``jobs`` jobs in this process and return their timings (``--run-mode``)."""
+    from converter_engine import ConversionEngine, ConversionJob
+    from ydl_pool import YoutubeDLPool
+
+    output = tempfile.mkdtemp(prefix='funlight-bench-')
+    pool = YoutubeDLPool(cachedir=os.path.join(output, '.cache')) if mode == 'pooled' else None
+    timings = []
+    try:
+        for _ in range(jobs):
+            engine = ConversionEngine(ConversionJob(url, output, format_option), ydl_pool=pool)
+            timings.append(engine.run()['timings'])
+    finally:
+        if pool is not None:
+            pool.close()
+        shutil.rmtree(output, ignore_errors=True)
+    return timings
+
+
+def summarize(timings, connections):
+    # The first job also pays for imports and lazy initialisation in both modes
+    steady = timings[1:] or timings
+    summary = {}
+    for name in METRICS:
+        values = [t[name] for t in steady if t.get(name) is not None]
+        summary[name] = round(statistics.median(values), 4) if values else None
+    summary['first_setup'] = round(timings[0].get('setup', 0), 4)
+    summary['connections'] = round(connections / len(timings), 2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=20, help='jobs per mode')
+    parser.add_argument('--media', default='m4a', help='media variant from bench_pipeline (default: m4a)')
+    parser.add_argument('--duration', type=int, default=10, help='media duration in seconds')
+    parser.add_argument('-f', '--format', default='MP3')
+    parser.add_argument('--media-dir', help='where generated media is kept between runs')
+    parser.add_argument('-o', '--output', help='write the results as JSON')
+    parser.add_argument('--run-mode', nargs=2, metavar=('MODE', 'URL'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_mode:
+        mode, url = args.run_mode
+        print(json.dumps(run_mode(mode, url, args.jobs, args.format)))
+        return 0
+
+    media_dir = args.media_dir or default_media_dir()
+    os.makedirs(media_dir, exist_ok=True)
+    relative = generate_media(media_dir, [args.media], [args.duration])[args.media, args.duration]
+    server = MediaServer(media_dir)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    results = {}
+    try:
+        for mode in MODES:
+            before = server.connections
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--jobs', str(args.jobs),
+                                   '-f', args.format, '--run-mode', mode, f'{server.base_url}/{relative}'],
+                                  capture_output=True, text=True)
+            if proc.returncode != 0:
+                lines = proc.stderr.strip().splitlines()
+                print(f'{mode}: failed: {lines[-1] if lines else proc.returncode}', file=sys.stderr)
+                return 1
+            timings = json.loads(proc.stdout.strip().splitlines()[-1])
+            results[mode] = summarize(timings, server.connections - before)
+            print(f'{mode:8s} ' + ' '.join(f'{key}={value}' for key, value in results[mode].items()))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'modes': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
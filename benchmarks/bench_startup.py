@@ -0,0 +1,259 @@
+"""Start-up latency of the GUI and the command line, and what their imports cost.
+
+Every run starts a fresh interpreter against the local media server (see
+``media_server``) with a throw-away home directory, so journal, index and
+caches are the application's own. The first run of each case warms the
+OS file cache and compiles bytecode and is not counted; the medians of
+the other ``--runs`` are recorded, all in seconds since the process was
+spawned:
+
+  gui    import     - ``funlight_converter`` imported
+         window     - main window shown and its event loop running
+         first_job  - first job done, its URL added as soon as the window was up
+  cli    help       - ``funlight_cli.py --help`` exited
+         first_job  - ``funlight_cli.py`` exited after converting one URL
+
+The GUI runs on Qt's offscreen platform unless QT_QPA_PLATFORM is set.
+Alongside, ``python -X importtime`` lists the slowest direct imports of
+the GUI, CLI and daemon modules and which of yt-dlp and PyQt5 they load.
+
+    python benchmarks/bench_startup.py -o startup.json
+    python benchmarks/bench_startup.py --compare startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+ENTRY_POINTS = ['funlight_converter', 'funlight_cli', 'funlight_daemon']
+# Packages that should only be loaded by the entry points that need them
+HEAVY_PACKAGES = ['yt_dlp', 'PyQt5']
+
+# Metric: True if higher is better, and changes below the floor count as noise
+METRICS = {
+    'import': (False, 0.02),
+    'window': (False, 0.02),
+    'help': (False, 0.02),
+    'first_job': (False, 0.05),
+}
+
+
+def run_gui(url, output, started):
+    """Start the GUI in this process, add ``url`` once the window is up and print the marks (``--run-gui``)."""
+    marks = {}
+
+    def mark(name):
+        marks[name] = round(time.monotonic() - started, 4)
+
+    import funlight_converter
+    mark('import')
+    from PyQt5.QtCore import QTimer
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication(sys.argv[:1])
+    window = funlight_converter.show_window()
+    window.dir_input.setText(output)
+
+    def interactive():
+        mark('window')
+        marks['yt_dlp_at_window'] = 'yt_dlp' in sys.modules
+        window.url_input.setText(url)
+        window.start_download()
+
+    def job_changed(job_id):
+        job = window.job_queue.jobs.get(job_id)
+        if job is None or job.state in (funlight_converter.JOB_QUEUED, funlight_converter.JOB_RUNNING):
+            return
+        mark('first_job')
+        if job.state != funlight_converter.JOB_DONE:
+            marks['error'] = job.message
+        print(json.dumps(marks), flush=True)
+        # Skips the "queue finished" message box and the orderly shutdown, neither of which is timed
+        os._exit(0)
+
+    window.job_queue.job_changed.connect(job_changed)
+    QTimer.singleShot(0, interactive)
+    app.exec_()
+
+
+def spawn(args, env, stdin=None, timeout=300):
+    """Run ``args``; returns (seconds since spawn, the process's stdout)."""
+    started = time.monotonic()
+    env = dict(env, FUNLIGHT_BENCH_STARTED=repr(started))
+    proc = subprocess.run(args, input=stdin, capture_output=True, text=True, env=env, cwd=ROOT_DIR,
+                          timeout=timeout)
+    elapsed = time.monotonic() - started
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f'exit code {proc.returncode}')
+    return elapsed, proc.stdout
+
+
+def gui_run(url, env, scratch):
+    output = tempfile.mkdtemp(dir=scratch)
+    _, stdout = spawn([sys.executable, os.path.abspath(__file__), '--run-gui', url, output], env)
+    marks = json.loads(stdout.strip().splitlines()[-1])
+    if 'error' in marks:
+        raise RuntimeError(marks['error'])
+    return marks
+
+
+def cli_run(url, env, scratch, format_option):
+    output = tempfile.mkdtemp(dir=scratch)
+    cli = os.path.join(ROOT_DIR, 'funlight_cli.py')
+    help_seconds, _ = spawn([sys.executable, cli, '--help'], env)
+    job_seconds, stdout = spawn([sys.executable, cli, '-o', output, '-f', format_option], env, stdin=url + '\n')
+    events = [json.loads(line) for line in stdout.splitlines() if line.startswith('{')]
+    failed = [event for event in events if event.get('event') == 'error']
+    if failed:
+        raise RuntimeError(failed[0].get('error') or 'job failed')
+    return {'help': round(help_seconds, 4), 'first_job': round(job_seconds, 4)}
+
+
+def import_report(module, top):
+    """Total import time of ``module``, its ``top`` slowest direct imports and the ``HEAVY_PACKAGES`` it loads."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}, sys; '
+                           f'print(",".join(name for name in {HEAVY_PACKAGES!r} if name in sys.modules))'],
+                          capture_output=True, text=True, cwd=ROOT_DIR)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f'exit code {proc.returncode}'}
+    # "import time: self [us] | cumulative | name", children before their parent, nested by indentation
+    children, report = [], None
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if level == 1:
+            children.append((name, int(cumulative) / 1e6))
+        elif level == 0:
+            if name == module:
+                children.sort(key=lambda child: child[1], reverse=True)
+                report = {'total': round(int(cumulative) / 1e6, 4),
+                          'top': [[child, round(seconds, 4)] for child, seconds in children[:top]]}
+            children = []
+    if report is None:
+        return {'error': f'{module} not in the import time report'}
+    report['loads'] = [name for name in proc.stdout.strip().split(',') if name]
+    return report
+
+
+def run_suite(args):
+    # Imported here so the --run-gui process only imports what it measures
+    from bench_pipeline import default_media_dir, generate_media, machine_info
+    from media_server import MediaServer
+
+    media_dir = args.media_dir or default_media_dir()
+    os.makedirs(media_dir, exist_ok=True)
+    relative = generate_media(media_dir, [args.media], [args.duration])[args.media, args.duration]
+    scratch = tempfile.mkdtemp(prefix='funlight-startup-')
+    home = os.path.join(scratch, 'home')
+    os.makedirs(home)
+    env = dict(os.environ, HOME=home, USERPROFILE=home, LOCALAPPDATA=home,
+               XDG_CACHE_HOME=os.path.join(home, '.cache'), XDG_DATA_HOME=os.path.join(home, '.local', 'share'))
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    env.pop('FUNLIGHT_DAEMON_URL', None)
+
+    server = MediaServer(media_dir)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'{server.base_url}/{relative}'
+    cases = {}
+    try:
+        for case, run in [('gui', lambda: gui_run(url, env, scratch)),
+                          ('cli', lambda: cli_run(url, env, scratch, args.format))]:
+            try:
+                runs = [run() for _ in range(args.runs + 1)][1:]
+            except (RuntimeError, subprocess.TimeoutExpired) as e:
+                print(f'{case:4s} failed: {e}', file=sys.stderr)
+                cases[case] = {'error': str(e)}
+                continue
+            cases[case] = {name: round(statistics.median(run[name] for run in runs), 4)
+                           for name in METRICS if name in runs[0]}
+            cases[case]['runs'] = len(runs)
+            if case == 'gui':
+                cases[case]['yt_dlp_at_window'] = any(run['yt_dlp_at_window'] for run in runs)
+            print(f'{case:4s} ' + ' '.join(f'{key}={value}' for key, value in cases[case].items()
+                                            if key in METRICS), file=sys.stderr)
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    imports = {}
+    for module in ENTRY_POINTS:
+        imports[module] = report = import_report(module, args.top)
+        if 'error' in report:
+            print(f'{module}: import report failed: {report["error"]}', file=sys.stderr)
+            continue
+        print(f'{module}: {report["total"]:.3f}s to import, loads {", ".join(report["loads"]) or "neither"}',
+              file=sys.stderr)
+        for child, seconds in report['top']:
+            print(f'  {seconds:7.3f}s  {child}', file=sys.stderr)
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': machine_info(),
+        'config': {'runs': args.runs, 'media': args.media, 'duration': args.duration, 'format': args.format},
+        'cases': cases,
+        'imports': imports,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-r', '--runs', type=int, default=5, help='measured runs per case')
+    parser.add_argument('--media', default='m4a', help='media variant from bench_pipeline (default: m4a)')
+    parser.add_argument('--duration', type=int, default=10, help='media duration in seconds')
+    parser.add_argument('-f', '--format', default='MP3')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list per entry point')
+    parser.add_argument('--media-dir', help='where generated media is kept between runs')
+    parser.add_argument('-o', '--output', help='write the results as JSON')
+    parser.add_argument('--compare', nargs='+', metavar='JSON',
+                        help='baseline, and optionally results to compare instead of running')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold in percent')
+    parser.add_argument('--run-gui', nargs=2, metavar=('URL', 'OUTPUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_gui:
+        run_gui(*args.run_gui, float(os.environ['FUNLIGHT_BENCH_STARTED']))
+        return 1  # Only reached if the window closed before the job finished
+
+    if args.compare and len(args.compare) > 2:
+        parser.error('--compare takes a baseline and at most one result file')
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[1], encoding='utf-8') as f:
+            results = json.load(f)
+    else:
+        results = run_suite(args)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        elif not args.compare:
+            print(json.dumps(results, indent=2))
+
+    if args.compare:
+        from bench_pipeline import compare
+        with open(args.compare[0], encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold, METRICS)
+        if regressions:
+            print(f'{len(regressions)} regression(s) above {args.threshold:g}%')
+            return 1
+        print('No regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Local HTTP server for benchmark media.
+
+Serves a directory on 127.0.0.1 with ``Range`` support, so yt-dlp's
+HTTP downloader can resume and seek the same way it does against real
+hosts, and with the content types yt-dlp's generic extractor uses to
+recognise HLS playlists and DASH manifests. Connections are kept alive
+(HTTP/1.1), so a client that reuses them does fewer TCP handshakes, and
+``MediaServer.connections`` counts the accepted ones.
+
+    with serve('/tmp/media') as base_url:
+        ...  # e.g. base_url + '/clip.mp4'
+"""
+import contextlib
+import http.server
+import os
+import re
+import sys
+import threading
+
+CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.mpd': 'application/dash+xml',
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.m4a': 'audio/mp4',
+    '.webm': 'video/webm',
+}
+
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def guess_type(self, path):
+        return CONTENT_TYPES.get(os.path.splitext(path)[1]) or super().guess_type(path)
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.remaining = None
+            return super().send_head()
+        size = os.path.getsize(path)
+        f = open(path, 'rb')
+        match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start, end = max(0, size - int(match.group(2))), size - 1
+            if start >= size:
+                f.close()
+                self.send_error(416, 'Requested Range Not Satisfiable')
+                return None
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            f.seek(start)
+            self.remaining = end - start + 1
+        else:
+            self.send_response(200)
+            self.remaining = size
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(self.remaining))
+        self.end_headers()
+        return f
+
+    def copyfile(self, source, outputfile):
+        if self.remaining is None:
+            return super().copyfile(source, outputfile)
+        remaining = self.remaining
+        while remaining > 0:
+            chunk = source.read(min(64 * 1024, remaining))
+            if not chunk:
+                break
+            try:
+                outputfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading (e.g. after probing the head of a file)
+                return
+            remaining -= len(chunk)
+
+
+class MediaServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, directory, port=0):
+        handler = lambda *args, **kwargs: RangeRequestHandler(*args, directory=directory, **kwargs)
+        super().__init__(('127.0.0.1', port), handler)
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+    def handle_error(self, request, client_address):
+        # A client closing a kept-alive connection is not an error
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+@contextlib.contextmanager
+def serve(directory, port=0):
+    """Serve ``directory`` in a background thread and yield its base URL."""
+    server = MediaServer(directory, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.base_url
+    finally:
+        server.shutdown()
+        server.server_close()
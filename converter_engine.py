@@ -0,0 +1,1137 @@
+"""Download and conversion pipeline without any GUI dependencies.
+
+Everything here is plain Python plus yt-dlp so it can be driven from the
+Qt front end (``funlight_converter.py``) as well as from headless tools
+such as ``funlight_cli.py``. Do not import PyQt5 from this module.
+"""
+import contextlib
+import copy
+import os
+import re
+import time
+
+import yt_dlp
+
+from yt_dlp.extractor import gen_extractor_classes
+from yt_dlp.networking import HEADRequest, Request
+from yt_dlp.postprocessor.common import PostProcessor
+from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+from yt_dlp.utils import prepend_extension, replace_extension
+
+import remux_planner
+import toolchain as toolchain_module
+from splitter import SegmentSplitter, SplitError, split_segments
+from streaming import (HEAD_LIMIT, MP4_EXTS, STREAM_CHUNK, StreamError, StreamingTranscoder, moov_first,
+                       stream_source)
+from workspace import JobWorkspace
+
+FORMATS = ['MP3', 'WAV', 'AAC', 'MP4']
+
+# Default quality per format, matching the GUI presets
+DEFAULT_QUALITY = {
+    'MP3': '192',
+    'MP4': '720',
+}
+
+# Extension of the final file produced for each output format
+OUTPUT_EXTENSIONS = {
+    'MP3': 'mp3',
+    'WAV': 'wav',
+    'AAC': 'm4a',
+    'MP4': 'mp4',
+}
+
+
+class ConversionError(Exception):
+    """A job failed; the message is meant to be shown to the user."""
+
+
+class ConversionCancelled(Exception):
+    """A job was cancelled through ``ConversionEngine.cancel``."""
+
+
+class ConversionJob:
+    """What to fetch and produce; ``split`` cuts the media into parts (see ``splitter``)."""
+
+    def __init__(self, url, output_path, format_option, quality=None, start_time=None, end_time=None,
+                 split=None):
+        self.url = url
+        self.output_path = output_path
+        self.format_option = format_option
+        self.quality = quality
+        self.start_time = start_time
+        self.end_time = end_time
+        self.split = split
+
+
+def parse_targets(format_option):
+    """Split a job's ``format_option`` such as ``'MP3,WAV'`` into output formats, primary first."""
+    names = (name.strip().upper() for name in str(format_option).split(','))
+    targets = list(dict.fromkeys(name for name in names if name))
+    if not targets:
+        raise ConversionError('No output format selected.')
+    for target in targets:
+        if target not in remux_planner.TARGETS:
+            raise ConversionError(f'Unsupported output format: {target}')
+    return targets
+
+
+def target_quality(job, target):
+    """The job's quality setting for one of its targets.
+
+    ``job.quality`` is either per target (``'MP3=192,MP4=720'``) or a
+    single value, which belongs to the primary target. Targets without a
+    setting of their own use ``DEFAULT_QUALITY``.
+    """
+    quality = job.quality
+    if quality and '=' in str(quality):
+        settings = dict(part.split('=', 1) for part in str(quality).split(',') if '=' in part)
+        return settings.get(target) or DEFAULT_QUALITY.get(target)
+    if target == parse_targets(job.format_option)[0]:
+        return quality
+    return DEFAULT_QUALITY.get(target)
+
+
+# Fragments of a DASH/HLS stream fetched in parallel per job
+CONCURRENT_FRAGMENTS = 4
+
+# Encoders an ffmpeg build needs for each output format
+REQUIRED_ENCODERS = {
+    'MP3': 'libmp3lame',
+    'WAV': 'pcm_s16le',
+    'AAC': 'aac',
+    'MP4': 'aac',
+}
+
+
+def check_toolchain(toolchain, format_option):
+    """Raise ConversionError unless ``toolchain`` can produce ``format_option``."""
+    if toolchain is None:
+        raise ConversionError("FFmpeg not found. Install FFmpeg and add it to PATH "
+                              "(on Windows run setup_ffmpeg.py as administrator), "
+                              f"or point {toolchain_module.OVERRIDE_ENV} at the ffmpeg binary.")
+    for target in parse_targets(format_option):
+        encoder = REQUIRED_ENCODERS.get(target)
+        if encoder and not toolchain.has_encoder(encoder):
+            raise ConversionError(f"The installed FFmpeg ({toolchain.version}) has no {encoder} encoder, "
+                                  f"which is needed for {target}.")
+
+
+def time_range(job):
+    """Return ``(start, end)`` in seconds if the job is limited to a range, else None."""
+    if not job.start_time and not job.end_time:
+        return None
+    start = job.start_time or 0
+    end = job.end_time or float('inf')
+    if end <= start:
+        raise ConversionError('The end time must be after the start time.')
+    return start, end
+
+
+def output_template(job):
+    section = time_range(job)
+    if section is None:
+        return '%(title)s.%(ext)s'
+    start, end = section
+    end_label = '' if end == float('inf') else f'{end:g}'
+    return f'%(title)s [{start:g}-{end_label}s].%(ext)s'
+
+
+def archive_id(url):
+    """Return yt-dlp's download-archive id (``'<extractor> <id>'``) for ``url`` without extracting.
+
+    None when the matching extractor cannot tell the id from the URL alone.
+    """
+    for ie in gen_extractor_classes():
+        if ie.suitable(url):
+            temp_id = ie.get_temp_id(url)
+            return f'{ie.ie_key().lower()} {temp_id}' if temp_id is not None else None
+    return None
+
+
+def index_keys(job, video_id=None, target=None):
+    """Yield the ``output_index`` keys of a job's ``target`` output, cheapest first.
+
+    ``video_id`` is the archive id from an extraction; without it the id is
+    derived from the URL, and only once the URL key has been tried.
+    ``target`` defaults to the job's primary format.
+    """
+    target = target or parse_targets(job.format_option)[0]
+    section = time_range(job)
+    quality = target_quality(job, target) or DEFAULT_QUALITY.get(target) or ''
+    suffix = (f"{target} {quality} {'%g-%g' % section if section else 'full'} "
+              f'{os.path.realpath(job.output_path)}')
+    yield f'url {job.url} {suffix}'
+    video_id = video_id or archive_id(job.url)
+    if video_id:
+        yield f'{video_id} {suffix}'
+
+
+def build_ydl_opts(job, progress_hook=None, postprocessor_hook=None, post_hook=None, verbose=False,
+                   download_path=None, concurrent_fragments=CONCURRENT_FRAGMENTS):
+    """Build the yt-dlp options for a job.
+
+    Files are written to ``download_path`` (the job's scratch workspace)
+    when given, otherwise straight into the output directory.
+    """
+    # Basic options for all formats
+    ydl_opts = {
+        'outtmpl': os.path.join(download_path or job.output_path, output_template(job)),
+        'progress_hooks': [progress_hook] if progress_hook else [],
+        'postprocessor_hooks': [postprocessor_hook] if postprocessor_hook else [],
+        'post_hooks': [post_hook] if post_hook else [],
+        'quiet': not verbose,
+        'verbose': verbose,
+        'noprogress': not verbose,
+        'no_warnings': False,  # Show warnings
+        'ignoreerrors': False,  # Don't ignore errors
+        'no_color': True,
+        'prefer_ffmpeg': True,
+        'keepvideo': False,
+        'keep_fragments': False,
+        'concurrent_fragment_downloads': concurrent_fragments,
+    }
+
+    # Format specific options. The conversion itself is done by
+    # PlannedConversionPP, which copies every stream the target can carry.
+    # With several targets the download has to serve the most demanding one
+    targets = parse_targets(job.format_option)
+    primary = 'MP4' if 'MP4' in targets else targets[0]
+    format_sort = list(remux_planner.FORMAT_SORT[primary])
+    if primary == 'MP4':
+        # Quality settings for video
+        quality = target_quality(job, 'MP4')
+        if quality:
+            height = int(str(quality).replace('p', ''))
+            format_str = f'bestvideo[height<={height}]+bestaudio/best[height<={height}]/bestvideo+bestaudio/best'
+            format_sort.insert(0, f'res:{height}')
+        else:
+            format_str = 'bestvideo+bestaudio/best'
+    else:
+        format_str = 'bestaudio/best'
+    ydl_opts['format'] = format_str
+    ydl_opts['format_sort'] = format_sort
+
+    # Only fetch the requested window. yt-dlp hands sections to ffmpeg,
+    # which seeks with HTTP range requests or only pulls the covering
+    # HLS/DASH fragments; RangeCutPP picks keyframe or accurate cuts.
+    section = time_range(job)
+    if section is not None:
+        ydl_opts['download_ranges'] = yt_dlp.utils.download_range_func(None, [section])
+        ydl_opts['force_keyframes_at_cuts'] = False
+
+    return ydl_opts
+
+
+def describe_download_error(error_msg):
+    lowered = error_msg.lower()
+    if "requested format not available" in lowered or "requested format is not available" in lowered:
+        return "The requested video quality is not available. Try a lower quality setting."
+    elif "private video" in lowered:
+        return "This video is private and cannot be downloaded."
+    elif "copyright" in lowered:
+        return "This video is not available due to copyright restrictions."
+    return f"Download error: {error_msg}"
+
+
+def describe_error(error_msg):
+    if "ffmpeg" in error_msg.lower():
+        return "FFmpeg error. Please make sure FFmpeg is installed correctly and try again."
+    elif "unavailable" in error_msg.lower():
+        return "Video is unavailable. Please check if the video exists and is not private."
+    return error_msg
+
+
+def error_category(error_msg):
+    """Coarse category of a job's error message, for failure metrics."""
+    lowered = error_msg.lower()
+    if 'quality is not available' in lowered or ('format' in lowered and 'not available' in lowered):
+        return 'format'
+    if 'private' in lowered:
+        return 'private'
+    if 'copyright' in lowered:
+        return 'copyright'
+    if 'ffmpeg' in lowered or 'encoder' in lowered:
+        return 'ffmpeg'
+    if 'unavailable' in lowered or 'video information' in lowered:
+        return 'unavailable'
+    if any(word in lowered for word in ('http error', 'timed out', 'connection', 'network', 'resolve')):
+        return 'network'
+    return 'other'
+
+
+_BENCH_RE = re.compile(r'bench:\s+\d+ user\s+\d+ sys\s+(\d+) real (?:encode|flush)_\w+ (\d+)\.\d+')
+
+
+def encode_seconds(stderr):
+    """Wall time spent in each output's encoders, from ffmpeg's ``-benchmark_all`` log.
+
+    Returns ``{output_index: seconds}``. The log's counters are unsigned and
+    wrap around when ffmpeg's threads interleave, so they are summed signed.
+    """
+    totals = {}
+    for real, index in _BENCH_RE.findall(stderr):
+        real = int(real)
+        if real >= 1 << 63:
+            real -= 1 << 64
+        totals[int(index)] = totals.get(int(index), 0) + real
+    return {index: round(max(0, micros) / 1e6, 3) for index, micros in totals.items()}
+
+
+class PlannedConversionPP(FFmpegPostProcessor):
+    """Turns the downloaded file into the job's formats following remux plans.
+
+    ``targets`` maps every output format to its quality setting. All
+    targets that need ffmpeg are written by a single ffmpeg run with one
+    output per target, so the source is read and decoded only once.
+    ``on_plan(plan, stats)`` is called per target with the output's size
+    and timing. Every produced file is collected in ``files``.
+    """
+
+    def __init__(self, downloader, targets, toolchain, on_plan=None, threads=None):
+        super().__init__(downloader)
+        self.targets = targets
+        self.toolchain = toolchain
+        self.on_plan = on_plan or (lambda plan, stats: None)
+        # Encoder threads per output; None leaves it to ffmpeg, which uses every core
+        self.threads = threads
+        self.files = []
+
+    @classmethod
+    def pp_key(cls):
+        return 'PlannedConversion'
+
+    @PostProcessor._restrict_to(images=False)
+    def run(self, info):
+        path = info['filepath']
+        video_codec, audio_codec = info.get('vcodec'), info.get('acodec')
+        if video_codec is None or audio_codec is None:
+            # Generic downloads often carry no codec information
+            video_codec, audio_codec = remux_planner.probe_streams(path, self.toolchain)
+        produced = {}
+        outputs = []
+        for target, quality in self.targets.items():
+            plan = remux_planner.plan_conversion(target, info['ext'], video_codec, audio_codec,
+                                                 quality, self.toolchain)
+            if not plan.needs_ffmpeg:
+                self.to_screen(f'Not converting {path}; already {target}')
+                produced[target] = path
+                self.on_plan(plan, {'size': os.path.getsize(path), 'seconds': 0.0, 'encode_seconds': 0.0})
+                continue
+            new_path = replace_extension(path, plan.ext, info['ext'])
+            args = plan.args + ['-threads', str(self.threads)] if self.threads else plan.args
+            outputs.append((plan, new_path, prepend_extension(new_path, 'temp'), args))
+            produced[target] = new_path
+
+        if outputs:
+            for plan, _, _, _ in outputs:
+                self.to_screen(f'{plan.mode.capitalize()} to {plan.target}: {plan.summary()}')
+            # -benchmark_all lets a shared run report the time per output
+            input_opts = ['-benchmark_all'] if len(outputs) > 1 else []
+            started = time.monotonic()
+            stderr = self.real_run_ffmpeg([(path, input_opts)],
+                                          [(temp_path, args) for _, _, temp_path, args in outputs])
+            seconds = time.monotonic() - started
+            encode_times = encode_seconds(stderr) if input_opts else {0: round(seconds, 3)}
+            for index, (plan, new_path, temp_path, _) in enumerate(outputs):
+                os.replace(temp_path, new_path)
+                self.on_plan(plan, {'size': os.path.getsize(new_path), 'seconds': round(seconds, 3),
+                                    'encode_seconds': encode_times.get(index)})
+
+        files = [produced[target] for target in self.targets]
+        self.files.extend(files)
+        info['filepath'] = files[0]
+        info['ext'] = os.path.splitext(files[0])[1][1:]
+        return ([path] if path not in files else []), info
+
+
+def requested_downloads(info):
+    """Yield the info dict of every file yt-dlp downloaded for ``info``, playlists included."""
+    for _, download in downloaded_videos(info):
+        yield download
+
+
+def downloaded_videos(info):
+    """Like ``requested_downloads``, but yields ``(video, download)`` with the video's info dict.
+
+    The download dicts only describe the file; chapters, duration and the
+    like are in the video's.
+    """
+    if info.get('_type') in ('playlist', 'multi_video'):
+        for entry in info.get('entries') or []:
+            if entry:
+                yield from downloaded_videos(entry)
+    else:
+        for download in info.get('requested_downloads') or []:
+            yield info, download
+
+
+def estimate_full_size(info):
+    """Best guess of the bytes a full download of the selected formats needs."""
+    formats = info.get('requested_formats') or [info]
+    total = 0
+    for fmt in formats:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size and fmt.get('tbr') and info.get('duration'):
+            size = fmt['tbr'] * 1000 / 8 * info['duration']
+        if not size:
+            return None
+        total += size
+    return int(total)
+
+
+class RangeCutPP(PostProcessor):
+    """Chooses how a time-range download is cut, once the formats are known.
+
+    Streams that will be copied are cut on keyframes (no decode at all).
+    If the plan re-encodes the video anyway, ffmpeg is told to cut
+    accurately, since the frames get decoded in any case.
+    """
+
+    def __init__(self, downloader, targets, on_range=None):
+        super().__init__(downloader)
+        self.targets = targets
+        self.on_range = on_range or (lambda info, accurate, full_size: None)
+
+    @classmethod
+    def pp_key(cls):
+        return 'RangeCut'
+
+    def run(self, info):
+        if info.get('section_start') is None and info.get('section_end') is None:
+            return [], info
+        plans = [remux_planner.plan_conversion(target, info.get('ext'), info.get('vcodec'), info.get('acodec'))
+                 for target in self.targets]
+        accurate = any(s.kind == 'video' and s.action == 'transcode' for plan in plans for s in plan.streams)
+        # The params belong to this job, also on a pooled YoutubeDL
+        self._downloader.params['force_keyframes_at_cuts'] = accurate
+        self.on_range(info, accurate, estimate_full_size(info) or self._content_length(info))
+        return [], info
+
+    def _content_length(self, info):
+        # Direct links often have no size in the metadata; ask the server
+        total = 0
+        for fmt in info.get('requested_formats') or [info]:
+            if not re.match(r'^https?://', fmt.get('url') or '') or fmt.get('protocol') not in (None, 'http', 'https'):
+                return None
+            try:
+                with self._downloader.urlopen(HEADRequest(fmt['url'], headers=fmt.get('http_headers') or {})) as response:
+                    total += int(response.headers.get('Content-Length') or 0)
+            except (yt_dlp.utils.YoutubeDLError, OSError, ValueError):
+                return None
+        return total or None
+
+
+class ConversionEngine:
+    """Runs a single ``ConversionJob`` on the calling thread.
+
+    ``on_progress(percent)`` and ``on_status(message)`` are called from the
+    yt-dlp hooks. ``run`` returns a dict describing the result or raises
+    ``ConversionError`` / ``ConversionCancelled``.
+
+    ``run`` is ``download`` followed by ``convert``. A pipeline calls the two
+    separately, from different threads: ``download`` only fetches (and
+    merges) the media into the workspace, ``convert`` runs the conversion
+    with at most ``threads`` encoder threads and publishes the result (see
+    ``pipeline.ConversionStage``).
+
+    With a ``metadata_cache`` (see ``metadata_cache.MetadataCache``) the
+    extractor result is looked up there first, so retried or re-queued jobs
+    go straight to the download.
+
+    Each run works in its own ``workspace.JobWorkspace`` under
+    ``scratch_root`` and only the finished files are published into the
+    output directory.
+
+    With an ``output_index`` (see ``output_index.OutputIndex``) a job whose
+    output was already produced and is still intact finishes immediately
+    with ``skipped`` set in the result; new outputs are added to the index.
+
+    With a ``bandwidth`` scheduler (see ``bandwidth.BandwidthScheduler``)
+    every downloaded chunk is paid for from the shared bucket with the job's
+    ``priority``; the achieved throughput ends up in the result.
+
+    With a ``journal`` (see ``job_journal.JobJournal``) the job's phase,
+    workspace and outcome are recorded under ``journal_id``. A journaled
+    job keeps its workspace when it fails, and ``workspace_path`` reopens
+    such a workspace so the download resumes from the partial files;
+    ``suspend`` stops a job the same way, e.g. when the application quits.
+
+    With ``streaming`` audio-only jobs whose source is a single HTTP file
+    are piped into ffmpeg while downloading (see ``streaming``), so no
+    intermediate file is written and ``convert`` only publishes; sources that
+    cannot be streamed take the regular path.
+
+    With a ``ydl_pool`` (see ``ydl_pool.YoutubeDLPool``) the job borrows a
+    warm YoutubeDL instead of building its own, and returns it once the
+    conversion is over; ``timings['setup']`` holds the time either took.
+
+    A job with a ``split`` is downloaded whole and ``convert`` cuts it into
+    one file per chapter or cue (see ``splitter``), published into a folder
+    named after the video; such jobs bypass the output index and streaming.
+
+    With ``telemetry`` (see ``telemetry.Telemetry``) every phase of the job
+    is recorded in a trace, which goes to the telemetry's metrics (and
+    trace directory) when the job is over.
+
+    With a ``progress_bus`` (see ``progress_bus.ProgressBus``) per-chunk
+    progress only updates the job's snapshot there under ``job_id`` and
+    ``on_progress`` is not called; consumers read the bus at their own rate.
+    Without one, ``on_progress`` is called when the whole percentage changes.
+    """
+
+    def __init__(self, job, on_progress=None, on_status=None, verbose=False, metadata_cache=None,
+                 toolchain=None, progress_bus=None, job_id=None, scratch_root=None, journal=None,
+                 journal_id=None, workspace_path=None, output_index=None,
+                 concurrent_fragments=CONCURRENT_FRAGMENTS, bandwidth=None, priority='normal',
+                 streaming=False, telemetry=None, ydl_pool=None):
+        self.job = job
+        self.ydl_pool = ydl_pool
+        self.telemetry = telemetry
+        self.trace = None
+        self.streaming = streaming
+        self._streamed = False
+        self._extracted = None
+        self.bandwidth = bandwidth
+        self.priority = priority
+        self._share = None
+        self._share_seen = {}
+        self.concurrent_fragments = concurrent_fragments
+        self.output_index = output_index
+        self.scratch_root = scratch_root
+        self.journal = journal
+        self.journal_id = journal_id
+        self.workspace_path = workspace_path
+        self.toolchain = toolchain
+        self.progress_bus = progress_bus
+        self.job_id = job_id
+        self.on_progress = on_progress or (lambda percent: None)
+        self.on_status = on_status or (lambda message: None)
+        self.verbose = verbose
+        self.metadata_cache = metadata_cache
+        self.output_files = []
+        self.downloaded_bytes = 0
+        self.range_info = None
+        self.conversions = []
+        self.postprocessing = {}
+        self.bandwidth_stats = None
+        self._pp_started = {}
+        self.timings = {}
+        self._started = None
+        self._downloaded = None
+        self._info = None
+        self._ydl = None
+        self._splitter = None
+        self._workspace = None
+        self._toolchain = None
+        self._last_percent = None
+        self._cancel_requested = False
+        self._suspended = False
+
+    def cancel(self):
+        # Checked from the yt-dlp hooks, which run on the job's thread
+        self._cancel_requested = True
+        if self._share is not None:
+            self._share.cancel()
+        if self._splitter is not None:
+            self._splitter.cancel()
+
+    def suspend(self):
+        """Stop like ``cancel`` but keep the workspace and leave the job resumable in the journal."""
+        self._suspended = True
+        self.cancel()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_requested
+
+    def _check_cancelled(self):
+        if self._cancel_requested:
+            raise yt_dlp.utils.DownloadCancelled('Cancelled by user')
+
+    def progress_hook(self, d):
+        # Called for every chunk: keep the common path free of formatting
+        self._check_cancelled()
+        status = d['status']
+        if status == 'downloading':
+            downloaded = d.get('downloaded_bytes') or 0
+            if 'first_byte' not in self.timings and downloaded:
+                self.timings['first_byte'] = time.monotonic() - self._started
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            if self._share is not None:
+                self._pay_bandwidth(d.get('tmpfilename'), downloaded)
+            if self.progress_bus is not None:
+                self.progress_bus.update_download(self.job_id, downloaded, total, d.get('speed'), d.get('eta'))
+            elif total:
+                percent = int(downloaded * 100 / total)
+                if percent != self._last_percent:
+                    self._last_percent = percent
+                    self.on_progress(percent)
+                    self.on_status(f'Downloading: {percent}%')
+        elif status == 'finished':
+            self.downloaded_bytes += d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            self.on_status('Download finished, starting conversion...')
+            if self.progress_bus is not None:
+                self.progress_bus.update(self.job_id, phase='downloaded', downloaded_bytes=self.downloaded_bytes,
+                                         speed=None, eta=None)
+            else:
+                self._last_percent = None
+                self.on_progress(0)  # Reset progress for conversion phase
+        elif status == 'error':
+            raise ConversionError(f"Error during download: {d.get('error', 'Unknown error')}")
+
+    def _pay_bandwidth(self, filename, downloaded):
+        # downloaded_bytes is cumulative per file (and restarts with every file)
+        last = self._share_seen.get(filename, 0)
+        self._share_seen[filename] = downloaded
+        if downloaded > last:
+            self._share.consume(downloaded - last)
+            self._check_cancelled()
+
+    def postprocessor_hook(self, d):
+        self._check_cancelled()
+        name = d.get('postprocessor', 'unknown')
+        if d['status'] == 'started':
+            self._pp_started[name] = time.monotonic()
+            if self.trace is not None:
+                self.trace.begin(name, 'postprocessor')
+            self.on_status(f'Converting: {name}')
+            if self.progress_bus is not None:
+                self.progress_bus.update(self.job_id, phase='converting', postprocessor=name)
+            self._journal(phase='converting')
+        elif d['status'] == 'finished':
+            if self.trace is not None:
+                self.trace.end(name, 'postprocessor')
+            if name in self._pp_started:
+                elapsed = time.monotonic() - self._pp_started.pop(name)
+                self.postprocessing[name] = round(self.postprocessing.get(name, 0) + elapsed, 3)
+            self.on_status('Conversion step completed')
+
+    def record_range(self, info, accurate, full_size):
+        start = info.get('section_start') or 0
+        end = info.get('section_end')
+        self.range_info = {
+            'start': start,
+            'end': end,
+            'cut': 'accurate' if accurate else 'keyframe',
+            'full_bytes_estimate': full_size,
+        }
+        self.on_status(f'Downloading range {start:g}s-{"end" if end is None else f"{end:g}s"} '
+                       f'({self.range_info["cut"]} cut)')
+
+    def range_summary(self):
+        if self.range_info is None:
+            return None
+        summary = dict(self.range_info, downloaded_bytes=self.downloaded_bytes)
+        full = summary['full_bytes_estimate']
+        summary['bytes_saved'] = max(0, full - self.downloaded_bytes) if full else None
+        return summary
+
+    def record_plan(self, plan, stats):
+        self.conversions.append(dict(plan.summary(), **stats))
+        if plan.needs_ffmpeg:
+            self.on_status(f"{plan.target}: {plan.mode} finished in {stats['seconds']:.1f}s, "
+                           f"{stats['size'] / (1024 * 1024):.1f} MB")
+
+    def post_hook(self, filepath):
+        self.output_files.append(filepath)
+
+    def run(self):
+        result = self.download()
+        return result if result is not None else self.convert()
+
+    def download(self):
+        """First stage: fetch the media into the job's workspace.
+
+        Returns None when ``convert`` has to follow, or the final result if
+        there is nothing left to do (the output index already has the job).
+        """
+        if self.telemetry is not None:
+            self.trace = self.telemetry.new_trace(self.job_id, self.job.url)
+        self._set_phase('starting')
+        return self._guarded(self._download_stage)
+
+    def _download_stage(self):
+        result = self._fetch()
+        if result is not None:
+            self._set_phase('done', output_file=result['output_file'])
+            self._job_finished('skipped')
+        else:
+            self._set_phase('downloaded', downloaded_bytes=self.downloaded_bytes)
+        return result
+
+    def convert(self, threads=None):
+        """Second stage: convert the downloaded files and publish them."""
+        return self._guarded(lambda: self._convert_stage(threads))
+
+    def _convert_stage(self, threads):
+        result = self._finish(threads)
+        # Journal and telemetry write to disk too; their failures fail the job like any other
+        self._set_phase('done', output_file=result['output_file'], downloaded_bytes=self.downloaded_bytes)
+        self._job_finished('done', output_files=result['output_files'])
+        return result
+
+    def _guarded(self, step):
+        try:
+            return step()
+        except ConversionCancelled:
+            phase = 'interrupted' if self._suspended else 'cancelled'
+            self._record_outcome(phase)
+            raise
+        except ConversionError as e:
+            self._record_outcome('failed', str(e))
+            raise
+        except Exception as e:
+            error = ConversionError(describe_error(str(e)))
+            self._record_outcome('failed', str(error))
+            raise error from e
+
+    def _record_outcome(self, phase, error=None):
+        try:
+            if error is None:
+                self._set_phase(phase)
+            else:
+                self._set_phase(phase, error=error)
+            self._job_finished(phase, error=error)
+        except Exception:
+            pass  # The job's own outcome is what the caller needs to hear about
+
+    def _span(self, name, **args):
+        """Context manager timing a phase of the job in its trace."""
+        if self.trace is None:
+            return contextlib.nullcontext()
+        return self.trace.span(name, **args)
+
+    def _job_finished(self, outcome, error=None, output_files=()):
+        if self.telemetry is None or self.trace is None:
+            return
+        output_bytes = sum(os.path.getsize(path) for path in output_files if os.path.exists(path))
+        self.telemetry.job_finished(self.trace, outcome, error_category(error) if error else None,
+                                    self.downloaded_bytes, output_bytes)
+
+    def _set_phase(self, phase, **journal_fields):
+        if self.progress_bus is not None:
+            self.progress_bus.update(self.job_id, phase=phase, postprocessor=None)
+        self._journal(phase=phase, **journal_fields)
+
+    def _journal(self, **fields):
+        if self.journal is not None and self.journal_id is not None:
+            self.journal.update(self.journal_id, **fields)
+
+    def _extract(self, ydl):
+        """Return the unprocessed extractor result, from the cache if possible."""
+        if self._extracted is not None:
+            # Already extracted for an attempt to stream the job
+            ie_result, self._extracted = self._extracted, None
+            return ie_result, False
+        cache = self.metadata_cache
+        ie_result = cache.get(self.job.url) if cache is not None else None
+        if ie_result is not None:
+            self.on_status('Using cached video information')
+            return ie_result, True
+        self.on_status('Retrieving video information...')
+        self._set_phase('extracting')
+        started = time.monotonic()
+        with self._span('extract'):
+            ie_result = ydl.extract_info(self.job.url, download=False, process=False)
+        self.timings['extract'] = time.monotonic() - started
+        if ie_result is None:
+            raise ConversionError("Could not retrieve video information. Please check the URL.")
+        if cache is not None:
+            cache.put(self.job.url, ie_result)
+        return ie_result, False
+
+    def _download(self, ydl):
+        ie_result, cached = self._extract(ydl)
+
+        # Calculate estimated file size
+        if ie_result.get('filesize'):
+            size_mb = ie_result['filesize'] / (1024 * 1024)
+            self.on_status(f'Estimated file size: {size_mb:.1f} MB')
+
+        try:
+            # Format selection, download and post-processing all work on the
+            # extracted result, so the page is never extracted a second time
+            self.on_status('Starting download and conversion...')
+            with self._span('download'):
+                info = ydl.process_ie_result(ie_result, download=True)
+        except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError):
+            if not cached or self._cancel_requested:
+                raise
+            # The signed media URLs in a cached entry may have expired
+            self.metadata_cache.invalidate(self.job.url)
+            self.on_status('Cached video information is stale, extracting again...')
+            ie_result, _ = self._extract(ydl)
+            with self._span('download', retry=True):
+                info = ydl.process_ie_result(ie_result, download=True)
+        if info is None:
+            raise ConversionError("Could not retrieve video information. Please check the URL.")
+        return info
+
+    def _download_in(self, workspace, toolchain):
+        job = self.job
+        ydl_opts = build_ydl_opts(job, self.progress_hook, self.postprocessor_hook, self.post_hook,
+                                  verbose=self.verbose, download_path=workspace.path,
+                                  concurrent_fragments=self.concurrent_fragments)
+        ydl_opts['ffmpeg_location'] = toolchain.ffmpeg
+        if self.bandwidth is not None:
+            # Fixed, small reads keep the shared bucket's turns short
+            ydl_opts['buffersize'] = 256 * 1024
+            ydl_opts['noresizebuffer'] = True
+        self.on_status(f'Using FFmpeg {toolchain.version} from: {toolchain.ffmpeg}')
+
+        self.on_status('Starting download...')
+
+        if self.bandwidth is not None:
+            self._share = self.bandwidth.register(self.job_id if self.job_id is not None else id(self),
+                                                  self.priority)
+            if self._cancel_requested:
+                self._share.cancel()
+        try:
+            info = self._stream(ydl_opts) if self.streaming else None
+            return info if info is not None else self._download_with(ydl_opts)
+        finally:
+            if self._share is not None:
+                self.bandwidth_stats = self._share.stats()
+                self._share.close()
+
+    def _open_ydl(self, ydl_opts):
+        started = time.monotonic()
+        with self._span('ydl_setup', pooled=self.ydl_pool is not None):
+            ydl = self.ydl_pool.acquire(ydl_opts) if self.ydl_pool is not None else yt_dlp.YoutubeDL(ydl_opts)
+        self.timings['setup'] = self.timings.get('setup', 0) + time.monotonic() - started
+        return ydl
+
+    def _close_ydl(self, ydl):
+        if self.ydl_pool is not None:
+            self.ydl_pool.release(ydl)
+        else:
+            ydl.close()
+
+    def _release_ydl(self):
+        ydl, self._ydl = self._ydl, None
+        if ydl is not None:
+            self._close_ydl(ydl)
+
+    def _download_with(self, ydl_opts):
+        job = self.job
+        # The conversion runs later, in convert(), with the same downloader;
+        # it is closed or returned to the pool after that
+        ydl = self._ydl = self._open_ydl(ydl_opts)
+        ydl.add_post_processor(RangeCutPP(ydl, parse_targets(job.format_option), self.record_range),
+                               when='before_dl')
+        try:
+            return self._download(ydl)
+        except yt_dlp.utils.DownloadCancelled as e:
+            self._release_ydl()
+            raise ConversionCancelled('Cancelled') from e
+        except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as e:
+            self._release_ydl()
+            # process_ie_result raises extractor errors (e.g. no matching
+            # format) directly instead of wrapping them in DownloadError
+            if self._cancel_requested:
+                raise ConversionCancelled('Cancelled') from e
+            raise ConversionError(describe_download_error(str(e))) from e
+        except BaseException:
+            self._release_ydl()
+            raise
+
+    def _stream(self, ydl_opts):
+        """Download and convert in one go by piping the media into ffmpeg.
+
+        Returns the info dict, or None if the job cannot be streamed and
+        has to be downloaded to a file first.
+        """
+        job = self.job
+        targets = parse_targets(job.format_option)
+        if 'MP4' in targets or time_range(job) is not None or job.split:
+            return None
+        # YoutubeDL writes into its params; the regular download reuses ydl_opts
+        ydl = self._open_ydl(dict(ydl_opts))
+        try:
+            try:
+                ie_result, cached = self._extract(ydl)
+                info = ydl.process_ie_result(copy.deepcopy(ie_result), download=False)
+            except yt_dlp.utils.DownloadCancelled as e:
+                raise ConversionCancelled('Cancelled') from e
+            except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as e:
+                raise ConversionError(describe_download_error(str(e))) from e
+            if not cached:
+                # The regular download goes on from this extraction
+                self._extracted = ie_result
+            if not info or not stream_source(info):
+                return None
+            try:
+                return self._stream_from(ydl, info, targets)
+            except yt_dlp.utils.DownloadCancelled as e:
+                raise ConversionCancelled('Cancelled') from e
+            except (StreamError, yt_dlp.utils.YoutubeDLError, OSError) as e:
+                if self._cancel_requested:
+                    raise ConversionCancelled('Cancelled') from e
+                self.on_status(f'Streaming failed ({e}), downloading to a file instead')
+                return None
+        finally:
+            self._close_ydl(ydl)
+
+    def _stream_from(self, ydl, info, targets):
+        toolchain = self._toolchain
+        response = ydl.urlopen(Request(info['url'], headers=info.get('http_headers') or {}))
+        try:
+            total = int(response.headers.get('Content-Length') or 0) or info.get('filesize') or None
+            head = response.read(STREAM_CHUNK)
+            if info['ext'] in MP4_EXTS:
+                while moov_first(head) is None and len(head) < HEAD_LIMIT:
+                    chunk = response.read(STREAM_CHUNK)
+                    if not chunk:
+                        break
+                    head += chunk
+                if not moov_first(head):
+                    self.on_status('The source has its index at the end, downloading to a file instead')
+                    return None
+            video_codec, audio_codec = info.get('vcodec'), info.get('acodec')
+            if video_codec is None or audio_codec is None:
+                with self._span('probe'):
+                    video_codec, audio_codec = remux_planner.probe_streams(None, toolchain, head=head)
+            if not audio_codec:
+                return None
+
+            source = ydl.prepare_filename(info)
+            outputs = []
+            for target in targets:
+                plan = remux_planner.plan_conversion(target, info['ext'], video_codec, audio_codec,
+                                                     target_quality(self.job, target), toolchain)
+                path = replace_extension(source, plan.ext, info['ext'])
+                outputs.append((plan, path, prepend_extension(path, 'temp')))
+            transcoder = StreamingTranscoder(toolchain.ffmpeg, [(temp_path, plan.args)
+                                                                for plan, _, temp_path in outputs])
+            self.on_status(f"Streaming into {', '.join(targets)}")
+            started = time.monotonic()
+            downloaded = 0
+            chunk = head
+            try:
+                while chunk:
+                    transcoder.write(chunk)
+                    downloaded += len(chunk)
+                    elapsed = time.monotonic() - started
+                    speed = downloaded / elapsed if elapsed > 0 else None
+                    self.progress_hook({
+                        'status': 'downloading', 'downloaded_bytes': downloaded, 'total_bytes': total,
+                        'tmpfilename': info['url'], 'speed': speed,
+                        'eta': (total - downloaded) / speed if total and speed else None,
+                    })
+                    chunk = response.read(STREAM_CHUNK)
+                transcoder.finish()
+            except BaseException:
+                transcoder.abort()
+                for _, _, temp_path in outputs:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                raise
+        finally:
+            response.close()
+
+        seconds = time.monotonic() - started
+        self.timings['stream'] = seconds
+        if self.trace is not None:
+            self.trace.add('stream', started, started + seconds)
+        self.progress_hook({'status': 'finished', 'total_bytes': downloaded})
+        for plan, path, temp_path in outputs:
+            os.replace(temp_path, path)
+            self.record_plan(plan, {'size': os.path.getsize(path), 'seconds': round(seconds, 3),
+                                    'encode_seconds': None, 'streamed': True})
+        self.output_files = [path for _, path, _ in outputs]
+        self._streamed = True
+        return info
+
+    def _skip_if_indexed(self):
+        # Only skip if every target's output is still there
+        entries = []
+        for target in parse_targets(self.job.format_option):
+            entry = self.output_index.lookup(index_keys(self.job, target=target))
+            if entry is None:
+                return None
+            entries.append(entry)
+        entry = entries[0]
+        self.on_status(f'Already converted: {os.path.basename(entry.output_file)}')
+        self.timings['total'] = time.monotonic() - self._started
+        return {
+            'url': self.job.url,
+            'title': entry.title,
+            'format': self.job.format_option,
+            'output_file': entry.output_file,
+            'output_files': [entry.output_file for entry in entries],
+            'timings': {name: round(value, 3) for name, value in self.timings.items()},
+            'conversion': [],
+            'postprocessing': {},
+            'range': None,
+            'skipped': True,
+        }
+
+    def _convert_downloads(self, threads):
+        if self._streamed:
+            return  # Converted while downloading
+        job = self.job
+        targets = {target: target_quality(job, target) for target in parse_targets(job.format_option)}
+        pp = PlannedConversionPP(self._ydl, targets, self._toolchain, self.record_plan, threads=threads)
+        parts = []
+        try:
+            for video, download in downloaded_videos(self._info):
+                if job.split:
+                    files = self._split_download(video, download, targets, threads)
+                    if files is not None:
+                        parts.extend(files)
+                        continue
+                files_to_delete, download = pp.run(download)
+                for path in files_to_delete:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        except yt_dlp.utils.DownloadCancelled as e:
+            raise ConversionCancelled('Cancelled') from e
+        except yt_dlp.utils.PostProcessingError as e:
+            raise ConversionError(describe_error(str(e))) from e
+        if parts or pp.files:
+            self.output_files = parts + pp.files
+
+    def _split_download(self, video, download, targets, threads):
+        """Cut the file ``download`` of ``video`` into the parts of the job's ``split``.
+
+        The parts go into a folder named like the file. Returns their
+        paths, or None if the split names no parts for this file.
+        """
+        segments = split_segments(self.job.split, video)
+        if not segments:
+            self.on_status('No chapters or cues to split at, converting the whole file')
+            return None
+        path = download['filepath']
+        video_codec, audio_codec = download.get('vcodec'), download.get('acodec')
+        if video_codec is None or audio_codec is None:
+            video_codec, audio_codec = remux_planner.probe_streams(path, self._toolchain)
+        self._splitter = SegmentSplitter(self._toolchain, targets, threads, self.on_status)
+        if self._cancel_requested:
+            raise ConversionCancelled('Cancelled')
+        started = time.monotonic()
+        try:
+            files, sizes = self._splitter.split(path, segments, os.path.splitext(path)[0], download['ext'],
+                                                video_codec, audio_codec)
+        except SplitError as e:
+            if self._cancel_requested:
+                raise ConversionCancelled('Cancelled') from e
+            raise ConversionError(f'FFmpeg could not split the file: {e}') from e
+        seconds = round(time.monotonic() - started, 3)
+        for plan, size in sizes:
+            self.record_plan(plan, {'size': size, 'seconds': seconds, 'encode_seconds': None,
+                                    'parts': len(segments)})
+        return files
+
+    def _in_workspace(self, step):
+        """Run ``step``, cleaning up the workspace if it fails."""
+        try:
+            return step()
+        except ConversionError:
+            # A journaled job keeps its partial files so a retry can resume
+            if self.journal is None:
+                self._workspace.cleanup()
+            raise
+        except BaseException:
+            if not self._suspended:
+                self._workspace.cleanup()
+            raise
+
+    def _fetch(self):
+        job = self.job
+        self._started = time.monotonic()
+        if job.split and time_range(job) is not None:
+            raise ConversionError('A job can either be split or limited to a time range, not both.')
+        if self.output_index is not None and not job.split:
+            with self._span('index_lookup'):
+                result = self._skip_if_indexed()
+            if result is not None:
+                return result
+        with self._span('toolchain'):
+            toolchain = self.toolchain or toolchain_module.get_toolchain()
+            check_toolchain(toolchain, job.format_option)
+            toolchain.seed_yt_dlp()
+        self._toolchain = toolchain
+
+        os.makedirs(job.output_path, exist_ok=True)
+        workspace = JobWorkspace(job.output_path, self.scratch_root, path=self.workspace_path)
+        self._workspace = workspace
+        self.workspace_path = workspace.path
+        self._journal(workspace=workspace.path)
+        partial = workspace.partial_bytes()
+        if partial:
+            self.on_status(f'Resuming from {partial / (1024 * 1024):.1f} MB of partial data')
+        self._info = self._in_workspace(lambda: self._download_in(workspace, toolchain))
+        self._downloaded = time.monotonic()
+        self.timings['download'] = self._downloaded - self._started
+        return None
+
+    def _finish(self, threads=None):
+        job = self.job
+        info = self._info
+        workspace = self._workspace
+        # Time spent waiting for a free encoder between the two stages
+        self.timings['conversion_wait'] = time.monotonic() - self._downloaded
+        if self.trace is not None:
+            self.trace.add('conversion_wait', self._downloaded, time.monotonic())
+
+        def convert_and_publish():
+            if self._cancel_requested:
+                raise ConversionCancelled('Cancelled')
+            started = time.monotonic()
+            with self._span('convert', threads=threads):
+                self._convert_downloads(threads)
+            self.timings['convert'] = time.monotonic() - started
+            self.on_status('Publishing output...')
+            with self._span('publish'):
+                # Parts of a split job keep their folder
+                return [workspace.publish(path, os.path.relpath(path, workspace.path))
+                        for path in dict.fromkeys(self.output_files) if os.path.exists(path)]
+
+        try:
+            published = self._in_workspace(convert_and_publish)
+        finally:
+            self._release_ydl()
+        with self._span('cleanup'):
+            workspace.cleanup()
+
+        # Get the output file name of every target; the primary one is the job's output_file
+        outputs = {}
+        for target in parse_targets(job.format_option):
+            ext = OUTPUT_EXTENSIONS[target]
+            files = [path for path in published if path.endswith(f'.{ext}')]
+            outputs[target] = files[-1] if files else os.path.join(job.output_path, f"{info['title']}.{ext}")
+        output_file = next(iter(outputs.values()))
+
+        # Set the modification time of the output files to the current time
+        for path in published:
+            os.utime(path, None)
+
+        if (self.output_index is not None and not job.split and info.get('_type', 'video') == 'video'
+                and info.get('id')):
+            video_id = f"{info.get('extractor_key', info.get('extractor', '')).lower()} {info['id']}"
+            for target, path in outputs.items():
+                if os.path.exists(path):
+                    self.output_index.put(index_keys(job, video_id, target), path, info.get('title'))
+
+        section = self.range_summary()
+        if section and section['bytes_saved']:
+            self.on_status(f"Range download saved {section['bytes_saved'] / (1024 * 1024):.1f} MB")
+
+        self.on_status('Conversion completed successfully!')
+        self.timings['total'] = time.monotonic() - self._started
+        return {
+            'url': job.url,
+            'title': info.get('title'),
+            'format': job.format_option,
+            'output_file': output_file,
+            'output_files': published,
+            'timings': {name: round(value, 3) for name, value in self.timings.items()},
+            'conversion': self.conversions,
+            'postprocessing': self.postprocessing,
+            'range': self.range_summary(),
+            'bandwidth': self.bandwidth_stats,
+            'skipped': False,
+        }
@@ -0,0 +1,144 @@
+"""Client for the HTTP API of ``funlight_daemon``.
+
+    client = DaemonClient('http://127.0.0.1:8765')
+    submission = client.submit(['https://...'], format_option='MP3')
+    with client.events() as stream:
+        for record in stream:
+            ...  # the daemon's JSON events, e.g. {'event': 'done', 'job': 1, ...}
+
+Uses only the standard library and does not import PyQt5.
+"""
+import http.client
+import json
+import socket
+from urllib.parse import urlencode, urlsplit
+
+
+class DaemonError(Exception):
+    """The daemon answered with an error or could not be reached."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class EventStream:
+    """Iterates over the events of ``GET /events``; ``close`` may be called from another thread."""
+
+    def __init__(self, sock, response):
+        self._sock = sock
+        self._response = response
+        self._closed = False
+
+    def __iter__(self):
+        event, data = None, []
+        try:
+            for raw in self._response:
+                line = raw.decode('utf-8').rstrip('\r\n')
+                if line.startswith(':'):
+                    continue  # Keep-alive
+                if line.startswith('event:'):
+                    event = line[6:].strip()
+                elif line.startswith('data:'):
+                    data.append(line[5:].strip())
+                elif not line and data:
+                    record = json.loads('\n'.join(data))
+                    record.setdefault('event', event)
+                    yield record
+                    event, data = None, []
+        except (OSError, ValueError, http.client.HTTPException):
+            if not self._closed:
+                raise DaemonError('Event stream interrupted')
+
+    def close(self):
+        self._closed = True
+        try:
+            # Wakes up a thread blocked in the iteration
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._response.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DaemonClient:
+    def __init__(self, base_url, timeout=30.0):
+        url = urlsplit(base_url)
+        if url.scheme != 'http' or not url.hostname:
+            raise DaemonError(f'Not a daemon URL: {base_url!r}')
+        self.base_url = base_url.rstrip('/')
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.timeout = timeout
+
+    def submit(self, urls, output=None, format_option=None, quality=None, start=None, end=None,
+               priority=None, split=None):
+        """Queue jobs for ``urls`` (URLs or paths on the daemon's disk); returns the submission.
+
+        The daemon answers before playlists and folders are listed: ``submission(id)``
+        tells the ids of the jobs so far and whether the listing is done.
+        """
+        spec = {'urls': list(urls), 'output': output, 'format': format_option, 'quality': quality,
+                'start': start, 'end': end, 'priority': priority, 'split': split}
+        body = {key: value for key, value in spec.items() if value is not None}
+        return self._request('POST', '/jobs', body)
+
+    def submission(self, submission_id):
+        return self._request('GET', f'/submissions/{submission_id}')
+
+    def jobs(self, state=None):
+        return self._request('GET', '/jobs' + (f'?{urlencode({"state": state})}' if state else ''))['jobs']
+
+    def job(self, job_id):
+        return self._request('GET', f'/jobs/{job_id}')
+
+    def cancel(self, job_id):
+        return self._request('POST', f'/jobs/{job_id}/cancel')
+
+    def retry(self, job_id):
+        return self._request('POST', f'/jobs/{job_id}/retry')
+
+    def events(self, job_id=None):
+        """Open the event stream, of all jobs or only of ``job_id``."""
+        # No read timeout: the daemon sends a keep-alive comment every few seconds
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            connection.request('GET', '/events' + (f'?{urlencode({"job": job_id})}' if job_id else ''))
+            # The connection lets go of its socket once the response has arrived
+            sock = connection.sock
+            response = connection.getresponse()
+            sock.settimeout(None)
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise DaemonError(f'Cannot reach {self.base_url}: {e}')
+        if response.status != 200:
+            connection.close()
+            raise DaemonError(f'Event stream refused with status {response.status}', response.status)
+        return EventStream(sock, response)
+
+    def _request(self, method, path, body=None, timeout=None):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=timeout or self.timeout)
+        try:
+            payload = json.dumps(body).encode('utf-8') if body is not None else None
+            # The daemon only takes changes as JSON, also those without a body
+            headers = {'Content-Type': 'application/json'} if method != 'GET' else {}
+            connection.request(method, path, payload, headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            raise DaemonError(f'Cannot reach {self.base_url}: {e}')
+        finally:
+            connection.close()
+        try:
+            result = json.loads(data)
+        except ValueError:
+            raise DaemonError(f'Unexpected answer with status {response.status}', response.status)
+        if response.status >= 400:
+            raise DaemonError(result.get('error') or f'Status {response.status}', response.status)
+        return result
@@ -0,0 +1,391 @@
+"""Headless batch front end for the Funlight Converter.
+
+Reads URLs (one per line, ``#`` starts a comment) from a file or stdin,
+runs them through ``converter_engine`` on a pool of worker threads and
+writes one JSON object per line for every progress update and result.
+Playlist and channel URLs are expanded lazily into one job per video; a
+URL that cannot be listed is reported as ``failed`` without a job id.
+Lines naming a media file or folder on disk convert those files instead
+(see ``local_convert``); a folder's structure is repeated in the output
+directory.
+
+    python funlight_cli.py -i urls.txt -o ~/Music -f MP3 -q 192 -j 4 > events.jsonl
+
+With ``--journal`` every job is recorded in ``job_journal`` as it runs;
+``--resume`` first re-runs the jobs an earlier, interrupted run left
+unfinished, continuing their partial downloads. With ``--output-index``
+jobs whose output already exists and is unchanged are reported as
+``done`` with ``skipped: true`` without downloading anything; files on
+disk are skipped the same way while they are unchanged, or without an
+index while their outputs are newer than they are.
+
+Downloads and conversions run in separate pools (see ``pipeline``):
+``-j`` downloads at a time, ``--encoders`` conversions sharing
+``--encoder-threads`` CPU threads.
+
+``--split chapters`` cuts every video (or file) into one file per
+chapter, ``--split tracks.cue`` at the cues of a CUE sheet or a list of
+``mm:ss Title`` lines (see ``splitter``).
+
+``--trace-dir`` writes a Chrome trace (chrome://tracing, Perfetto) of
+every job's phases; ``--metrics-port`` serves job, byte, failure and
+latency metrics in the Prometheus text format on 127.0.0.1 (see
+``telemetry``).
+
+Jobs borrow warm YoutubeDL instances from a ``ydl_pool`` that share
+their connections; yt-dlp's cache lives in ``--ydl-cache-dir``.
+
+This module must not import PyQt5.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from yt_dlp.utils import parse_bytes
+
+from bandwidth import BandwidthScheduler, PRIORITY_WEIGHTS
+from converter_engine import (FORMATS, DEFAULT_QUALITY, CONCURRENT_FRAGMENTS, ConversionEngine,
+                              ConversionJob, ConversionError, ConversionCancelled, parse_targets)
+from job_journal import JobJournal, default_journal_path
+from local_convert import LocalConversion, collect_files, file_output_name
+from metadata_cache import MetadataCache
+from output_index import OutputIndex, default_index_path
+from pipeline import ConversionStage, default_workers
+from playlist_expander import PlaylistExpander
+from progress_bus import ProgressBus
+from splitter import SPLIT_CHAPTERS, parse_cues
+from telemetry import MetricsServer, Telemetry
+from ydl_pool import YoutubeDLPool, default_cachedir
+import toolchain
+
+
+class EventWriter:
+    """Serialises JSON-lines events from several worker threads."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        record = {'event': event, 'time': round(time.time(), 3), **fields}
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+
+def write_progress(events, snapshots):
+    for snapshot in snapshots:
+        if snapshot.phase in ('downloading', 'downloaded', 'converting'):
+            events.emit('progress', job=snapshot.job_id, phase=snapshot.phase,
+                        percent=round(snapshot.percent, 1), downloaded_bytes=snapshot.downloaded_bytes,
+                        total_bytes=snapshot.total_bytes, speed=snapshot.speed, eta=snapshot.eta,
+                        postprocessor=snapshot.postprocessor)
+
+
+def write_journal(journal, snapshots):
+    journal.record_progress((snapshot.job_id, snapshot.phase, snapshot.downloaded_bytes, snapshot.total_bytes)
+                            for snapshot in snapshots if snapshot.phase in ('downloading', 'downloaded'))
+
+
+def read_urls(stream):
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def run_job(job_id, job, events, finished, conversion_stage=None, on_engine=None, **engine_options):
+    """Run one job and report it; ``engine_options`` go to ConversionEngine.
+
+    ``finished(ok)`` is called once the job is over. With a
+    ``conversion_stage`` only the download runs here and the job finishes
+    on the stage's worker thread. ``on_engine(engine)`` is called before
+    the job starts, e.g. to keep the engine for cancelling it.
+    """
+    def on_status(message):
+        events.emit('status', job=job_id, message=message)
+
+    report = start_job(job_id, job, events, finished)
+    if engine_options.get('journal') is not None:
+        engine_options['journal_id'] = job_id
+    engine = ConversionEngine(job, on_status=on_status, job_id=job_id, **engine_options)
+    if on_engine is not None:
+        on_engine(engine)
+    try:
+        result = engine.run() if conversion_stage is None else engine.download()
+    except (ConversionCancelled, ConversionError) as e:
+        report(None, e)
+        return
+    if result is None:
+        # Downloaded; blocks while the conversion buffer is full
+        conversion_stage.submit(engine, report)
+    else:
+        report(result, None)
+
+
+def run_local_job(job_id, job, events, finished, conversion_stage, name=None, output_index=None, journal=None,
+                  on_engine=None):
+    """Convert the file ``job.url`` on the conversion stage unless its outputs are up to date."""
+    report = start_job(job_id, job, events, finished)
+    conversion = LocalConversion(job, name, output_index=output_index, journal=journal, journal_id=job_id,
+                                 on_status=lambda message: events.emit('status', job=job_id, message=message))
+    if on_engine is not None:
+        on_engine(conversion)
+    if conversion.up_to_date():
+        report(conversion.skip(), None)
+    else:
+        conversion_stage.submit(conversion, report)
+
+
+def start_job(job_id, job, events, finished):
+    """Emit ``started`` and return the ``report(result, error)`` callback of the job."""
+    def report(result, error):
+        if isinstance(error, ConversionCancelled):
+            events.emit('cancelled', job=job_id, url=job.url)
+        elif error is not None:
+            events.emit('failed', job=job_id, url=job.url, error=str(error),
+                        seconds=round(time.monotonic() - started, 3))
+        else:
+            events.emit('done', job=job_id, seconds=round(time.monotonic() - started, 3), **result)
+        finished(error is None)
+
+    events.emit('started', job=job_id, url=job.url)
+    started = time.monotonic()
+    return report
+
+
+def parse_formats(value):
+    try:
+        return ','.join(parse_targets(value))
+    except ConversionError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_split(value):
+    """``'chapters'``, or the text of the cue list in the file ``value``."""
+    if value.lower() == SPLIT_CHAPTERS:
+        return SPLIT_CHAPTERS
+    try:
+        with open(value, encoding='utf-8-sig') as f:
+            text = f.read()
+    except OSError as e:
+        raise argparse.ArgumentTypeError(f'cannot read cue list: {e}')
+    if not parse_cues(text):
+        raise argparse.ArgumentTypeError(f'no cues found in {value!r}')
+    return text
+
+
+def parse_rate(value):
+    rate = parse_bytes(value)
+    if rate is None:
+        raise argparse.ArgumentTypeError(f'invalid rate: {value!r} (use e.g. 500K or 4M)')
+    return rate
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Download and convert media without a GUI.')
+    parser.add_argument('-i', '--input', default=None,
+                        help="file with one URL per line, '-' for stdin (default, "
+                             "unless --resume is given and stdin is a terminal)")
+    parser.add_argument('-o', '--output', default=os.getcwd(), help='output directory')
+    parser.add_argument('-f', '--format', default='MP3', type=parse_formats,
+                        help=f"output format, or several separated by commas ({', '.join(FORMATS)}); "
+                             'every format is produced from a single download')
+    parser.add_argument('-q', '--quality', default=None,
+                        help='MP3 bitrate in kbit/s or MP4 height (e.g. 192, 720); '
+                             'per format for several formats, e.g. MP3=192,MP4=720')
+    parser.add_argument('-j', '--jobs', default=min(4, os.cpu_count() or 1), type=int,
+                        help='number of jobs to run in parallel')
+    parser.add_argument('--start', type=int, default=None, help='start time in seconds')
+    parser.add_argument('--end', type=int, default=None, help='end time in seconds')
+    parser.add_argument('--split', type=parse_split, default=None, metavar='chapters|CUEFILE',
+                        help="cut each video into one file per chapter ('chapters') or per cue of a "
+                             'CUE sheet or a list of "mm:ss Title" lines')
+    parser.add_argument('--events', default='-',
+                        help="file to append JSON-lines events to, '-' for stdout (default)")
+    parser.add_argument('--metadata-cache', default=None, metavar='PATH',
+                        help='SQLite file to keep extracted metadata in between runs')
+    parser.add_argument('--metadata-ttl', type=int, default=1800,
+                        help='seconds before cached metadata is extracted again (default: 1800)')
+    parser.add_argument('--progress-interval', type=float, default=1.0, metavar='SECONDS',
+                        help='how often to write progress events per job (default: 1.0)')
+    parser.add_argument('--scratch-dir', default=None, metavar='PATH',
+                        help='where jobs keep their intermediate files, e.g. a tmpfs '
+                             '(default: a hidden folder in the output directory)')
+    parser.add_argument('--journal', nargs='?', const=default_journal_path(), default=None, metavar='PATH',
+                        help='record jobs in a SQLite journal so an interrupted run can be resumed '
+                             f'(default path: {default_journal_path()})')
+    parser.add_argument('--resume', action='store_true',
+                        help='first run the unfinished jobs from the journal (implies --journal)')
+    parser.add_argument('--output-index', nargs='?', const=default_index_path(), default=None, metavar='PATH',
+                        help='skip jobs whose output was already produced and is unchanged '
+                             f'(default path: {default_index_path()})')
+    parser.add_argument('--concurrent-fragments', type=int, default=CONCURRENT_FRAGMENTS, metavar='N',
+                        help='fragments of a DASH/HLS stream to download in parallel per job '
+                             f'(default: {CONCURRENT_FRAGMENTS})')
+    parser.add_argument('--limit-rate', type=parse_rate, default=None, metavar='RATE',
+                        help='total download rate of all jobs together in bytes/s, e.g. 500K or 4M')
+    parser.add_argument('--priority', default='normal', choices=list(PRIORITY_WEIGHTS),
+                        help='bandwidth priority of the jobs read from the input (default: normal)')
+    parser.add_argument('--encoders', type=int, default=default_workers(), metavar='N',
+                        help='conversions to run in parallel, independent of --jobs '
+                             f'(default: {default_workers()})')
+    parser.add_argument('--encoder-threads', type=int, default=os.cpu_count() or 1, metavar='N',
+                        help='CPU threads shared by all running conversions '
+                             f'(default: {os.cpu_count() or 1})')
+    parser.add_argument('--conversion-buffer', type=int, default=None, metavar='N',
+                        help='downloaded jobs that may wait for a free encoder before downloads '
+                             'pause (default: twice --encoders)')
+    parser.add_argument('--stream', action='store_true',
+                        help='for audio formats, feed single-file sources into ffmpeg while downloading '
+                             'instead of writing them to disk first')
+    parser.add_argument('--trace-dir', default=None, metavar='PATH',
+                        help='write a Chrome trace-event file of every job to this directory')
+    parser.add_argument('--metrics-port', type=int, default=None, metavar='PORT',
+                        help='serve Prometheus metrics on http://127.0.0.1:PORT/metrics while running')
+    parser.add_argument('--ydl-cache-dir', default=None, metavar='PATH',
+                        help="where yt-dlp keeps signature functions and tokens between runs "
+                             f"(default: {default_cachedir()})")
+    parser.add_argument('--ffmpeg', default=None, metavar='PATH',
+                        help='ffmpeg binary or directory to use instead of searching PATH')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='let yt-dlp log to stderr')
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.split and (args.start or args.end):
+        parser.error('--split cannot be combined with --start/--end')
+    quality = args.quality or DEFAULT_QUALITY.get(args.format)
+    os.makedirs(args.output, exist_ok=True)
+    toolchain.set_override(args.ffmpeg)
+
+    if args.resume and args.journal is None:
+        args.journal = default_journal_path()
+    if args.input is None and not (args.resume and sys.stdin.isatty()):
+        args.input = '-'
+
+    events_stream = sys.stdout if args.events == '-' else open(args.events, 'a', encoding='utf-8')
+    if args.input is None:
+        input_stream = None  # Only resuming from an interactive shell
+    else:
+        input_stream = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    if args.verbose and events_stream is sys.stdout:
+        # Keep stdout machine readable
+        sys.stdout = sys.stderr
+    events = EventWriter(events_stream)
+    metadata_cache = MetadataCache(ttl=args.metadata_ttl, path=args.metadata_cache)
+    progress_bus = ProgressBus(args.progress_interval)
+    progress_bus.subscribe(lambda snapshots: write_progress(events, snapshots))
+    journal = JobJournal(args.journal) if args.journal else None
+    if journal is not None:
+        journal.prune()
+        # Journal ids double as job ids so events can be matched across runs
+        progress_bus.subscribe(lambda snapshots: write_journal(journal, snapshots))
+    output_index = OutputIndex(args.output_index) if args.output_index else None
+    progress_bus.start()
+    telemetry = Telemetry(trace_dir=args.trace_dir)
+    # One warm YoutubeDL per download slot, plus one for the playlist expansion
+    ydl_pool = YoutubeDLPool(max_idle=max(1, args.jobs) + 1, cachedir=args.ydl_cache_dir)
+    metrics_server = MetricsServer(telemetry.metrics, args.metrics_port).start() if args.metrics_port else None
+    if metrics_server is not None:
+        events.emit('metrics', url=metrics_server.url)
+
+    engine_options = dict(verbose=args.verbose, metadata_cache=metadata_cache, progress_bus=progress_bus,
+                          scratch_root=args.scratch_dir, journal=journal, output_index=output_index,
+                          concurrent_fragments=args.concurrent_fragments,
+                          bandwidth=BandwidthScheduler(args.limit_rate), priority=args.priority,
+                          streaming=args.stream, telemetry=telemetry, ydl_pool=ydl_pool)
+    expander = PlaylistExpander(verbose=args.verbose, metadata_cache=metadata_cache, ydl_pool=ydl_pool)
+    stage = ConversionStage(args.encoders, args.encoder_threads, args.conversion_buffer)
+    # Playlists are expanded only as fast as jobs start, so a channel with
+    # thousands of videos never sits in memory as a whole. Jobs waiting for
+    # or in the conversion stage hold a slot as well.
+    slots = threading.BoundedSemaphore(max(1, args.jobs) * 2 + stage.workers + stage.buffer_size)
+    results = []
+
+    def job_finished(ok):
+        results.append(ok)
+        slots.release()
+
+    def job_done(future, job_id, url):
+        error = future.exception()
+        if error is not None:
+            # run_job reports its own failures; this is one it did not expect
+            events.emit('failed', job=job_id, url=url, error=str(error) or type(error).__name__)
+            job_finished(False)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+            def submit(job_id, job, **options):
+                slots.acquire()
+                events.emit('queued', job=job_id, url=job.url)
+                future = pool.submit(run_job, job_id, job, events, job_finished, conversion_stage=stage,
+                                     **engine_options, **options)
+                future.add_done_callback(lambda future: job_done(future, job_id, job.url))
+
+            def submit_file(job_id, job, name=None):
+                # Files need no download; they go straight to the conversion stage
+                slots.acquire()
+                events.emit('queued', job=job_id, url=job.url)
+                run_local_job(job_id, job, events, job_finished, stage, name, output_index, journal)
+
+            if args.resume:
+                for entry in journal.interrupted():
+                    job = ConversionJob(entry.url, entry.output_path, entry.format_option, entry.quality,
+                                        entry.start_time, entry.end_time, entry.split)
+                    journal.claim(entry.id)
+                    if os.path.isfile(entry.url):
+                        submit_file(entry.id, job, file_output_name(entry.url))
+                    else:
+                        submit(entry.id, job, workspace_path=entry.workspace)
+            job_ids = itertools.count(1)
+            for url in read_urls(input_stream or ()):
+                try:
+                    if os.path.exists(url):
+                        for source, output_dir, name in collect_files([url], args.output):
+                            job = ConversionJob(source, output_dir, args.format, quality, split=args.split)
+                            submit_file(journal.add(job) if journal is not None else next(job_ids), job, name)
+                        continue
+                    for entry_url in expander.expand(url):
+                        if entry_url != url:
+                            events.emit('expanded', url=url, entry=entry_url)
+                        job = ConversionJob(entry_url, args.output, args.format, quality, args.start, args.end,
+                                            args.split)
+                        submit(journal.add(job) if journal is not None else next(job_ids), job)
+                except Exception as e:
+                    # Without a job id: the URL itself could not be listed (jobs listed before keep running)
+                    results.append(False)
+                    events.emit('failed', url=url, error=f'Could not list {url}: {e}')
+        stage.close()
+    finally:
+        progress_bus.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        metadata_cache.close()
+        ydl_pool.close()
+        if journal is not None:
+            journal.close()
+        if output_index is not None:
+            output_index.close()
+        if input_stream not in (None, sys.stdin):
+            input_stream.close()
+
+    failed = results.count(False)
+    events.emit('summary', total=len(results), done=len(results) - failed, failed=failed,
+                conversion=stage.stats(), ydl_pool=ydl_pool.stats())
+    if args.events != '-':
+        events_stream.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,221 +1,939 @@
 import os
 import sys
-import yt_dlp
+import itertools
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from urllib.parse import urlparse
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                            QHBoxLayout, QLabel, QLineEdit, QPushButton, 
                            QComboBox, QProgressBar, QFileDialog, QMessageBox,
-                           QSpinBox, QCheckBox, QGroupBox, QSlider)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize
+                           QSpinBox, QCheckBox, QGroupBox, QSlider,
+                           QTableView, QHeaderView, QAbstractItemView)
+from PyQt5.QtCore import Qt, QThread, QObject, QTimer, pyqtSignal, pyqtSlot, QSize
 from PyQt5.QtGui import QFont, QPalette, QColor, QIcon, QDragEnterEvent, QDropEvent
 
+# converter_engine, local_convert and playlist_expander pull in yt-dlp, which
+# takes longer to import than the rest of the application together; they are
+# imported where jobs run and preloaded once the window is up (preload_engine)
+from bandwidth import BandwidthScheduler, PRIORITY_WEIGHTS
+from daemon_client import DaemonClient, DaemonError
+from job_journal import JobJournal
+from job_model import JobTableModel
+from metadata_cache import MetadataCache
+from output_index import OutputIndex
+from pipeline import ConversionStage
+from progress_bus import ProgressBus
+from splitter import SPLIT_CHAPTERS
+from telemetry import MetricsServer, Telemetry
+from ydl_pool import YoutubeDLPool
+
 # Suppress deprecation warnings
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-class DownloadThread(QThread):
+class JobThread(QThread):
+    """Base of the threads that run a job's ``engine`` for the JobQueue.
+
+    The engine is built in ``run``, so starting a job does not import the
+    engine modules on the GUI thread. A cancel or suspend that comes before
+    the engine exists is passed on to it once it does.
+    """
     progress = pyqtSignal(float)
+    downloaded = pyqtSignal()
     finished = pyqtSignal()
     error = pyqtSignal(str)
     status = pyqtSignal(str)
+    cancelled = pyqtSignal()
 
-    def __init__(self, url, output_path, format_option, quality, start_time=None, end_time=None):
+    def __init__(self, job_id):
         super().__init__()
+        self.job_id = job_id
+        self.result = None
+        self.engine = None
+        self._stop = None
+        self._engine_lock = threading.Lock()
+
+    def cancel(self):
+        self._stop_engine('cancel')
+
+    def suspend(self):
+        self._stop_engine('suspend')
+
+    def _stop_engine(self, method):
+        with self._engine_lock:
+            self._stop = method
+            engine = self.engine
+        if engine is not None:
+            getattr(engine, method)()
+
+    def _set_engine(self, engine):
+        with self._engine_lock:
+            self.engine = engine
+            method = self._stop
+        if method is not None:
+            getattr(engine, method)()
+
+    def _report(self, result, error):
+        # Also called on a conversion worker thread
+        from converter_engine import ConversionCancelled
+        self.result = result
+        if isinstance(error, ConversionCancelled):
+            self.status.emit('Cancelled')
+            self.cancelled.emit()
+        elif error is not None:
+            self.error.emit(str(error))
+        else:
+            self.finished.emit()
+
+class DownloadThread(JobThread):
+    """Runs one job; with a ``conversion_stage`` only its download.
+
+    The downloaded job is handed to the stage (``downloaded`` is emitted
+    then) and ``finished``/``error``/``cancelled`` follow from the stage's
+    worker thread once the conversion is over.
+    """
+
+    def __init__(self, url, output_path, format_option, quality, start_time=None, end_time=None,
+                 metadata_cache=None, progress_bus=None, job_id=None, journal=None, journal_id=None,
+                 workspace_path=None, output_index=None, bandwidth=None, priority='normal',
+                 conversion_stage=None, streaming=False, telemetry=None, ydl_pool=None, split=None):
+        super().__init__(job_id)
         self.url = url
         self.output_path = output_path
         self.format_option = format_option
         self.quality = quality
         self.start_time = start_time
         self.end_time = end_time
+        self.split = split
+        self.conversion_stage = conversion_stage
+        self.engine_options = dict(metadata_cache=metadata_cache, progress_bus=progress_bus, job_id=job_id,
+                                   journal=journal, journal_id=journal_id, workspace_path=workspace_path,
+                                   output_index=output_index, bandwidth=bandwidth, priority=priority,
+                                   streaming=streaming, telemetry=telemetry, ydl_pool=ydl_pool)
 
-    def progress_hook(self, d):
-        if d['status'] == 'downloading':
+    def run(self):
+        from converter_engine import ConversionCancelled, ConversionEngine, ConversionError, ConversionJob
+        job = ConversionJob(self.url, self.output_path, self.format_option, self.quality, self.start_time,
+                            self.end_time, self.split)
+        try:
+            self._set_engine(ConversionEngine(job, self.progress.emit, self.status.emit, verbose=True,
+                                              **self.engine_options))
+            if self.conversion_stage is None:
+                result = self.engine.run()
+            else:
+                result = self.engine.download()
+        except (ConversionCancelled, ConversionError) as e:
+            self._report(None, e)
+            return
+        if result is None:
+            self.status.emit('Waiting for a free encoder...')
+            # Blocks while the stage's buffer is full
+            self.conversion_stage.submit(self.engine, self._report)
+            self.downloaded.emit()
+            return
+        self._report(result, None)
+
+class LocalFileThread(JobThread):
+    """Converts a file on disk on the ``conversion_stage``, or skips it if it is up to date."""
+
+    def __init__(self, path, output_path, format_option, quality, output_name, conversion_stage,
+                 job_id=None, journal=None, journal_id=None, output_index=None, split=None):
+        super().__init__(job_id)
+        self.url = path
+        self.output_path = output_path
+        self.format_option = format_option
+        self.quality = quality
+        # None for a resumed file: the name collect_files would have given it
+        self.output_name = output_name
+        self.split = split
+        self.conversion_stage = conversion_stage
+        self.journal = journal
+        self.journal_id = journal_id
+        self.output_index = output_index
+
+    def run(self):
+        from converter_engine import ConversionError, ConversionJob
+        from local_convert import LocalConversion, file_output_name
+        job = ConversionJob(self.url, self.output_path, self.format_option, self.quality, split=self.split)
+        try:
+            name = self.output_name if self.output_name is not None else file_output_name(self.url)
+            self._set_engine(LocalConversion(job, name, output_index=self.output_index,
+                                             on_status=self.status.emit, journal=self.journal,
+                                             journal_id=self.journal_id))
+            if self.engine.up_to_date():
+                self._report(self.engine.skip(), None)
+                return
+        except Exception as e:
+            # E.g. the file vanished; the job must still end, or it keeps its slot
+            self._report(None, ConversionError(f'Could not convert {os.path.basename(self.url)}: {e}'))
+            return
+        self.status.emit('Waiting for a free encoder...')
+        self.conversion_stage.submit(self.engine, self._report)
+        self.downloaded.emit()
+
+class ExpandThread(QThread):
+    """Expands playlist/channel URLs and hands their videos to the queue one by one.
+
+    At most ``max_pending`` of the emitted entries may wait in the queue;
+    the queue returns a slot with ``release_slot`` whenever one of them
+    starts, so the playlist is only listed as fast as it is worked off.
+    A URL whose listing fails is reported with ``failed`` and skipped.
+    """
+    entry = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, urls, metadata_cache=None, max_pending=16, ydl_pool=None):
+        super().__init__()
+        self.urls = urls
+        self.metadata_cache = metadata_cache
+        self.ydl_pool = ydl_pool
+        # Built in run(), so a URL added right after start-up does not wait for yt-dlp on the GUI thread
+        self.expander = None
+        self.cancelled = False
+        self._slots = threading.Semaphore(max_pending)
+
+    def release_slot(self):
+        self._slots.release()
+
+    def cancel(self):
+        self.cancelled = True
+        if self.expander is not None:
+            self.expander.cancel()
+        self._slots.release()  # Wake up a run() waiting for a slot
+
+    def run(self):
+        from playlist_expander import PlaylistExpander
+        self.expander = PlaylistExpander(metadata_cache=self.metadata_cache, ydl_pool=self.ydl_pool)
+        if self.cancelled:
+            return
+        for url in self.urls:
             try:
-                total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
-                downloaded = d.get('downloaded_bytes', 0)
-                if total > 0:
-                    progress = (downloaded / total) * 100
-                    self.progress.emit(int(progress))
-                    self.status.emit(f'Downloading: {progress:.1f}%')
+                for entry_url in self.expander.expand(url):
+                    self._slots.acquire()
+                    if self.cancelled:
+                        return
+                    self.entry.emit(entry_url)
             except Exception as e:
-                self.status.emit('Downloading...')
-        elif d['status'] == 'finished':
-            self.status.emit('Download finished, starting conversion...')
-            self.progress.emit(0)  # Reset progress for conversion phase
-        elif d['status'] == 'error':
-            self.error.emit(f"Error during download: {d.get('error', 'Unknown error')}")
-
-    def postprocessor_hook(self, d):
-        if d['status'] == 'started':
-            self.status.emit(f'Converting: {d.get("postprocessor", "unknown")}')
-        elif d['status'] == 'finished':
-            self.status.emit('Conversion step completed')
+                self.failed.emit(url, str(e))
+
+class FileScanThread(QThread):
+    """Lists the media files in dropped files and folders for the queue.
+
+    Works like ExpandThread: at most ``max_pending`` listed files wait in
+    the queue, so a large library is walked as fast as it is converted.
+    A path that cannot be listed is reported with ``failed`` and skipped.
+    """
+    entry = pyqtSignal(str, str, str)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, paths, output_path, max_pending=16):
+        super().__init__()
+        self.paths = paths
+        self.output_path = output_path
+        self.cancelled = False
+        self._slots = threading.Semaphore(max_pending)
+
+    def release_slot(self):
+        self._slots.release()
+
+    def cancel(self):
+        self.cancelled = True
+        self._slots.release()
 
     def run(self):
-        try:
-            # Check if ffmpeg is available
+        from local_convert import collect_files
+        for scanned in self.paths:
             try:
-                import subprocess
-                subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
-            except:
-                self.error.emit("FFmpeg is not found in system PATH. Please make sure FFmpeg is installed correctly.")
-                return
+                for path, output_dir, name in collect_files([scanned], self.output_path):
+                    self._slots.acquire()
+                    if self.cancelled:
+                        return
+                    self.entry.emit(path, output_dir, name)
+            except Exception as e:
+                self.failed.emit(scanned, str(e))
 
-            # Basic options for all formats
-            ydl_opts = {
-                'outtmpl': os.path.join(self.output_path, '%(title)s.%(ext)s'),
-                'progress_hooks': [self.progress_hook],
-                'postprocessor_hooks': [self.postprocessor_hook],
-                'quiet': False,  # Enable output for debugging
-                'verbose': True,  # Enable verbose output
-                'no_warnings': False,  # Show warnings
-                'ignoreerrors': False,  # Don't ignore errors
-                'no_color': True,
-                'prefer_ffmpeg': True,
-                'keepvideo': True,
-            }
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+
+def url_host(url):
+    host = (urlparse(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+class Job:
+    # Large batches keep tens of thousands of these around
+    __slots__ = ('id', 'url', 'host', 'output_path', 'format_option', 'quality', 'start_time', 'end_time',
+                 'state', 'progress', 'message', 'attempts', 'thread', 'source', 'priority', 'journal_id',
+                 'workspace', 'local', 'output_name', 'split')
+
+    def __init__(self, job_id, url, output_path, format_option, quality, start_time=None, end_time=None):
+        self.id = job_id
+        self.url = url
+        self.host = url_host(url)
+        self.output_path = output_path
+        self.format_option = format_option
+        self.quality = quality
+        self.start_time = start_time
+        self.end_time = end_time
+        self.state = JOB_QUEUED
+        self.progress = 0
+        self.message = 'Queued'
+        self.attempts = 0
+        self.thread = None
+        self.source = None
+        self.priority = 'normal'
+        self.journal_id = None
+        self.workspace = None
+        # Set for files on disk, with the name of their outputs if known
+        self.local = False
+        self.output_name = None
+        self.split = None
+
+
+class JobQueue(QObject):
+    """Runs queued jobs on a bounded pool of DownloadThreads.
+
+    At most ``max_workers`` jobs run at once and at most ``per_host_limit``
+    of them may talk to the same host. Jobs are started in submission order,
+    skipping over jobs whose host is already at its cap. Extracted metadata
+    is shared between jobs through ``metadata_cache`` so retries skip the
+    extraction step.
+
+    Download progress does not travel through Qt signals: the threads write
+    into a ProgressBus and a timer drains it every ``progress_interval``
+    seconds, emitting ``job_changed`` for the jobs that moved followed by
+    one ``progress_tick``.
+
+    All downloads share one ``bandwidth`` scheduler: ``set_bandwidth_limit``
+    caps their total rate and each job's priority sets its weight.
+    ``set_streaming`` lets audio jobs convert while they download.
+
+    URLs given to ``submit_urls`` are expanded on an ExpandThread, so
+    every video of a playlist or channel becomes its own job as soon as it
+    is listed. ``submit_files`` does the same for files and folders on
+    disk (see ``local_convert``); their jobs go straight to the conversion
+    stage on a LocalFileThread, and files whose outputs are up to date
+    finish as already converted. A path that cannot be listed is reported
+    with ``error``.
+
+    Conversions run on a separate ``conversion_stage`` (see ``pipeline``):
+    a job gives up its download slot as soon as its files are downloaded,
+    so the next download starts while it waits for or runs its encode.
+
+    With a ``journal`` every job is recorded there and the drained progress
+    is written to it in one batch per tick; ``resume_interrupted`` re-queues
+    the jobs a previous session did not finish, and ``shutdown`` stops the
+    running jobs so that they can be resumed. With an ``output_index`` jobs
+    whose output already exists finish without downloading.
+
+    Finished jobs let go of their thread (and with it the engine and its
+    yt-dlp info) and move into a history of at most ``history_limit``
+    jobs; the oldest ones beyond that are dropped with ``job_removed``.
+
+    Every job is traced into ``telemetry`` (see ``telemetry``); its
+    metrics can be served with a ``MetricsServer``.
+
+    Jobs and playlist expansions borrow their YoutubeDL from one
+    ``ydl_pool`` (see ``ydl_pool``), so extractors, connections and
+    yt-dlp's cache stay warm between jobs.
+    """
+    job_changed = pyqtSignal(int)
+    job_added = pyqtSignal(int)
+    job_removed = pyqtSignal(int)
+    progress_tick = pyqtSignal()
+    idle = pyqtSignal()
+    error = pyqtSignal(str)
+
+    def __init__(self, max_workers=3, per_host_limit=2, metadata_cache=None, progress_interval=0.1,
+                 journal=None, output_index=None, telemetry=None, history_limit=20000, parent=None):
+        super().__init__(parent)
+        self.history_limit = history_limit
+        self.telemetry = telemetry if telemetry is not None else Telemetry()
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.metadata_cache = metadata_cache if metadata_cache is not None else MetadataCache()
+        self.journal = journal
+        self.output_index = output_index
+        self.bandwidth = BandwidthScheduler()
+        self.conversion_stage = ConversionStage()
+        self.ydl_pool = YoutubeDLPool()
+        self.streaming = False
+        self.progress_bus = ProgressBus(progress_interval)
+        self._progress_timer = QTimer(self)
+        self._progress_timer.timeout.connect(self._drain_progress)
+        self._progress_timer.start(int(progress_interval * 1000))
+        self.jobs = {}
+        self._pending = deque()
+        # Queued jobs per host, so scheduling can stop once every host is at its cap
+        self._pending_hosts = {}
+        self._history = OrderedDict()
+        # Threads of finished jobs that may still be winding down
+        self._retiring = []
+        self._running = {}
+        self._converting = {}
+        self._expansions = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, url, output_path, format_option, quality, start_time=None, end_time=None,
+               journal_id=None, workspace=None, source=None, priority='normal', output_name=None, split=None,
+               local=False):
+        job = Job(next(self._ids), url, output_path, format_option, quality, start_time, end_time)
+        job.local = local or output_name is not None
+        job.output_name = output_name
+        job.split = split
+        job.workspace = workspace
+        job.source = source
+        job.priority = priority
+        if self.journal is not None:
+            # The journal reads the fields a ConversionJob has, which a Job has too
+            job.journal_id = journal_id or self.journal.add(job)
+        self.jobs[job.id] = job
+        self._enqueue(job)
+        self.job_added.emit(job.id)
+        self._schedule()
+        return job.id
+
+    def submit_urls(self, urls, output_path, format_option, quality, start_time=None, end_time=None,
+                    priority='normal', split=None):
+        """Queue one job per video behind ``urls``, expanding playlists in the background."""
+        thread = ExpandThread(urls, self.metadata_cache, max_pending=max(4, self.max_workers * 2),
+                              ydl_pool=self.ydl_pool)
+        self._expansions[thread] = (output_path, format_option, quality, start_time, end_time, priority, split)
+        thread.entry.connect(self._on_entry)
+        thread.failed.connect(self._on_expand_failed)
+        thread.finished.connect(self._on_expanded)
+        thread.start()
+
+    def submit_files(self, paths, output_path, format_option, quality, split=None):
+        """Queue one conversion per media file in ``paths``, listing folders in the background."""
+        thread = FileScanThread(paths, output_path, max_pending=max(16, self.max_workers * 4))
+        self._expansions[thread] = (format_option, quality, split)
+        thread.entry.connect(self._on_file_entry)
+        thread.failed.connect(self._on_scan_failed)
+        thread.finished.connect(self._on_expanded)
+        thread.start()
+
+    def resume_interrupted(self):
+        """Queue the jobs the journal lists as unfinished; returns how many."""
+        if self.journal is None:
+            return 0
+        entries = self.journal.interrupted()
+        for entry in entries:
+            self.journal.claim(entry.id)
+            # Files on disk are converted again; downloads resume from their workspace
+            self.submit(entry.url, entry.output_path, entry.format_option, entry.quality,
+                        entry.start_time, entry.end_time, journal_id=entry.id, workspace=entry.workspace,
+                        split=entry.split, local=os.path.isfile(entry.url))
+        return len(entries)
+
+    def set_max_workers(self, count):
+        self.max_workers = max(1, count)
+        self._schedule()
+
+    def set_per_host_limit(self, count):
+        self.per_host_limit = max(1, count)
+        self._schedule()
+
+    def set_bandwidth_limit(self, bytes_per_second):
+        self.bandwidth.set_limit(bytes_per_second or None)
+
+    def set_streaming(self, enabled):
+        """Stream audio conversions of jobs started from now on."""
+        self.streaming = enabled
+
+    def set_priority(self, job_id, priority):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        job.priority = priority
+        self.bandwidth.set_priority(job_id, priority)
+        self.job_changed.emit(job_id)
+
+    def set_progress_interval(self, seconds):
+        self.progress_bus.set_interval(seconds)
+        self._progress_timer.setInterval(int(self.progress_bus.interval * 1000))
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        if job.state == JOB_QUEUED:
+            self._dequeue(job)
+            self._cancel_queued(job)
+            self._check_idle()
+        elif job.state == JOB_RUNNING and job.thread is not None:
+            job.message = 'Cancelling...'
+            job.thread.cancel()
+            self.job_changed.emit(job.id)
+
+    def retry(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or job.state not in (JOB_FAILED, JOB_CANCELLED):
+            return
+        job.progress = 0
+        self._history.pop(job_id, None)
+        self._enqueue(job)
+        self._journal(job, phase='queued')
+        self._set_state(job, JOB_QUEUED, 'Queued')
+        self._schedule()
+
+    def cancel_all(self):
+        for thread in list(self._expansions):
+            thread.cancel()
+        # Queued jobs in one go; cancelling them one by one would search the queue for each
+        queued, self._pending = self._pending, deque()
+        self._pending_hosts.clear()
+        for job_id in queued:
+            self._cancel_queued(self.jobs[job_id])
+        for job_id in list(self._running) + list(self._converting):
+            self.cancel(job_id)
+        self._check_idle()
+
+    def shutdown(self):
+        """Stop all running jobs, leaving them and the queued ones resumable, and wait for the threads."""
+        for thread in list(self._expansions):
+            thread.cancel()
+            thread.wait()
+        self._pending.clear()
+        self._pending_hosts.clear()
+        for job in self.jobs.values():
+            if job.thread is not None:
+                job.thread.suspend()
+        for job in self.jobs.values():
+            if job.thread is not None:
+                job.thread.wait()
+        for thread in self._retiring:
+            thread.wait()
+        # Suspended jobs waiting for an encoder drop out right away
+        self.conversion_stage.close()
+        self.ydl_pool.close()
+
+    def active_count(self):
+        return len(self._running) + len(self._converting) + len(self._pending) + len(self._expansions)
+
+    def _host_load(self):
+        load = {}
+        for job_id in self._running:
+            host = self.jobs[job_id].host
+            load[host] = load.get(host, 0) + 1
+        return load
+
+    def _enqueue(self, job):
+        self._pending.append(job.id)
+        self._pending_hosts[job.host] = self._pending_hosts.get(job.host, 0) + 1
+
+    def _dequeue(self, job):
+        self._pending.remove(job.id)
+        count = self._pending_hosts[job.host] - 1
+        if count:
+            self._pending_hosts[job.host] = count
+        else:
+            del self._pending_hosts[job.host]
+
+    def _schedule(self):
+        free = self.max_workers - len(self._running)
+        if free <= 0 or not self._pending:
+            return
+        load = self._host_load()
+        waiting = dict(self._pending_hosts)
+        # Hosts that can still take a job; with a long queue for one busy
+        # host the scan ends here instead of walking the whole queue
+        open_hosts = {host for host in waiting if load.get(host, 0) < self.per_host_limit}
+        starting = []
+        for job_id in self._pending:
+            if len(starting) >= free or not open_hosts:
+                break
+            job = self.jobs[job_id]
+            if job.host not in open_hosts:
+                continue
+            starting.append(job)
+            load[job.host] = load.get(job.host, 0) + 1
+            waiting[job.host] -= 1
+            if load[job.host] >= self.per_host_limit or not waiting[job.host]:
+                open_hosts.discard(job.host)
+        for job in starting:
+            self._dequeue(job)
+            self._start(job)
+
+    def _start(self, job):
+        self._release_source(job)
+        job.attempts += 1
+        if job.local:
+            thread = LocalFileThread(job.url, job.output_path, job.format_option, job.quality, job.output_name,
+                                     self.conversion_stage, job.id, self.journal, job.journal_id,
+                                     self.output_index, job.split)
+        else:
+            thread = DownloadThread(job.url, job.output_path, job.format_option, job.quality,
+                                    job.start_time, job.end_time, self.metadata_cache,
+                                    self.progress_bus, job.id, self.journal, job.journal_id, job.workspace,
+                                    self.output_index, self.bandwidth, job.priority, self.conversion_stage,
+                                    self.streaming, self.telemetry, self.ydl_pool, job.split)
+        thread.status.connect(self._on_status)
+        thread.downloaded.connect(self._on_downloaded)
+        thread.finished.connect(self._on_finished)
+        thread.error.connect(self._on_error)
+        thread.cancelled.connect(self._on_cancelled)
+        job.thread = thread
+        self._running[job.id] = thread
+        self._set_state(job, JOB_RUNNING, 'Starting...')
+        thread.start()
+
+    def _job_for_sender(self):
+        thread = self.sender()
+        job = self.jobs.get(getattr(thread, 'job_id', None))
+        # Ignore late signals from the thread of an earlier attempt
+        return job if job is not None and job.thread is thread else None
 
-            # Format specific options
-            if self.format_option == 'MP3':
-                ydl_opts.update({
-                    'format': 'bestaudio/best',
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': self.quality,
-                    }],
-                })
-            elif self.format_option == 'WAV':
-                ydl_opts.update({
-                    'format': 'bestaudio/best',
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'wav',
-                    }],
-                })
-            elif self.format_option == 'AAC':
-                ydl_opts.update({
-                    'format': 'bestaudio/best',
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'aac',
-                    }],
-                })
-            elif self.format_option == 'MP4':
-                # For videos, first download best quality and then convert
-                ext = self.format_option.lower()
-                
-                # Quality settings for video
-                if self.quality:
-                    height = int(self.quality.replace('p', ''))
-                    format_str = f'bestvideo[height<={height}]+bestaudio/best[height<={height}]'
-                else:
-                    format_str = 'bestvideo+bestaudio/best'
-
-                ydl_opts.update({
-                    'format': format_str,
-                    'merge_output_format': ext,
-                    'postprocessors': [{
-                        'key': 'FFmpegVideoConvertor',
-                        'preferedformat': ext,
-                    }],
-                    'postprocessor_args': [
-                        '-c:v', 'copy',           # Kopieren des Video-Streams ohne Neukodierung
-                        '-c:a', 'aac',            # Audio-Codec
-                        '-b:a', '192k',           # Audio-Bitrate
-                        '-ar', '48000',           # Audio Sample Rate
-                        '-movflags', '+faststart',
-                        '-threads', 'auto',
-                        '-r', '30',               # Set frame rate to 30 fps
-                    ]
-                })
-
-                # Ensure we keep the temporary files for debugging
-                ydl_opts['keepvideo'] = True
-                ydl_opts['keep_fragments'] = True
-
-            # Try to find ffmpeg in common locations
-            ffmpeg_paths = [
-                r'C:\ffmpeg\bin',
-                r'C:\Program Files\ffmpeg\bin',
-                os.path.expanduser('~\\AppData\\Local\\Microsoft\\WinGet\\Packages\\Gyan.FFmpeg_Microsoft.Winget.Source_8wekyb3d8bbwe\\ffmpeg-7.1-full_build\\bin'),
-                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ffmpeg', 'bin'),
-                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'venv', 'Scripts')
-            ]
-
-            ffmpeg_found = False
-            for path in ffmpeg_paths:
-                if os.path.exists(os.path.join(path, 'ffmpeg.exe')):
-                    ydl_opts['ffmpeg_location'] = path
-                    ffmpeg_found = True
-                    self.status.emit(f'Using FFmpeg from: {path}')
+    def _set_state(self, job, state, message=None):
+        job.state = state
+        if message is not None:
+            job.message = message
+        self.job_changed.emit(job.id)
+
+    def _release(self, job, state, message):
+        # A job emits exactly one of finished/error/cancelled, but guard
+        # against a late signal from a thread that was already released
+        thread = self._running.pop(job.id, None) or self._converting.pop(job.id, None)
+        if thread is None:
+            return
+        self.progress_bus.remove(job.id)
+        # A failed journaled job keeps its workspace; a retry resumes from it
+        engine = job.thread.engine
+        if state != JOB_FAILED or self.journal is None:
+            job.workspace = None
+        elif engine is not None:
+            job.workspace = engine.workspace_path
+        # The thread may still be returning from run(); keep it alive until it has
+        self._retiring.append(job.thread)
+        job.thread = None
+        self._set_state(job, state, message)
+        self._archive(job)
+        self._schedule()
+        self._check_idle()
+
+    def _cancel_queued(self, job):
+        self._release_source(job)
+        self._journal(job, phase='cancelled')
+        self._set_state(job, JOB_CANCELLED, 'Cancelled')
+        self._archive(job)
+
+    def _archive(self, job):
+        """Move a finished job into the history, dropping the oldest ones beyond ``history_limit``."""
+        self._history[job.id] = None
+        self._history.move_to_end(job.id)
+        while len(self._history) > self.history_limit:
+            job_id, _ = self._history.popitem(last=False)
+            del self.jobs[job_id]
+            self.job_removed.emit(job_id)
+
+    def _journal(self, job, **fields):
+        if self.journal is not None and job.journal_id is not None:
+            self.journal.update(job.journal_id, **fields)
+
+    def _release_source(self, job):
+        if job.source is not None:
+            job.source.release_slot()
+            job.source = None
+
+    def _check_idle(self):
+        if not self._running and not self._converting and not self._pending and not self._expansions:
+            self.idle.emit()
+
+    @pyqtSlot(str)
+    def _on_entry(self, url):
+        thread = self.sender()
+        params = self._expansions.get(thread)
+        if params is None or thread.cancelled:
+            return
+        output_path, format_option, quality, start_time, end_time, priority, split = params
+        self.submit(url, output_path, format_option, quality, start_time, end_time, source=thread,
+                    priority=priority, split=split)
+
+    @pyqtSlot(str, str, str)
+    def _on_file_entry(self, path, output_dir, output_name):
+        thread = self.sender()
+        params = self._expansions.get(thread)
+        if params is None or thread.cancelled:
+            return
+        format_option, quality, split = params
+        self.submit(path, output_dir, format_option, quality, source=thread, output_name=output_name,
+                    split=split)
+
+    @pyqtSlot(str, str)
+    def _on_expand_failed(self, url, message):
+        # Shown as a failed job, which Retry runs as a single download
+        params = self._expansions.get(self.sender())
+        if params is None:
+            return
+        output_path, format_option, quality, start_time, end_time, priority, split = params
+        job = Job(next(self._ids), url, output_path, format_option, quality, start_time, end_time)
+        job.priority = priority
+        job.split = split
+        job.state = JOB_FAILED
+        job.message = f'Could not list {url}: {message}'
+        self.jobs[job.id] = job
+        self.job_added.emit(job.id)
+        self._archive(job)
+
+    @pyqtSlot(str, str)
+    def _on_scan_failed(self, path, message):
+        self.error.emit(f'Could not list {path}: {message}')
+
+    @pyqtSlot()
+    def _on_expanded(self):
+        self._expansions.pop(self.sender(), None)
+        self._check_idle()
+
+    def _drain_progress(self):
+        if self._retiring:
+            self._retiring = [thread for thread in self._retiring if not thread.isFinished()]
+        changed = self.progress_bus.drain()
+        journal_rows = []
+        for snapshot in changed:
+            job = self.jobs.get(snapshot.job_id)
+            if job is None or job.state != JOB_RUNNING:
+                continue
+            job.progress = int(snapshot.percent)
+            if snapshot.phase in ('downloading', 'converting'):
+                job.message = snapshot.describe()
+            if job.journal_id is not None and snapshot.phase in ('downloading', 'downloaded'):
+                journal_rows.append((job.journal_id, snapshot.phase, snapshot.downloaded_bytes,
+                                     snapshot.total_bytes))
+            self.job_changed.emit(job.id)
+        if journal_rows:
+            self.journal.record_progress(journal_rows)
+        if changed:
+            self.progress_tick.emit()
+
+    @pyqtSlot(str)
+    def _on_status(self, message):
+        job = self._job_for_sender()
+        if job is not None:
+            job.message = message
+            self.job_changed.emit(job.id)
+
+    @pyqtSlot()
+    def _on_downloaded(self):
+        job = self._job_for_sender()
+        # The conversion may already have finished and released the job
+        if job is None or self._running.pop(job.id, None) is None:
+            return
+        self._converting[job.id] = job.thread
+        self._schedule()
+
+    @pyqtSlot()
+    def _on_finished(self):
+        job = self._job_for_sender()
+        if job is not None:
+            job.progress = 100
+            skipped = (job.thread.result or {}).get('skipped')
+            self._release(job, JOB_DONE, 'Already converted' if skipped else 'Completed')
+
+    @pyqtSlot(str)
+    def _on_error(self, error_message):
+        job = self._job_for_sender()
+        if job is not None:
+            self._release(job, JOB_FAILED, error_message)
+
+    @pyqtSlot()
+    def _on_cancelled(self):
+        job = self._job_for_sender()
+        if job is not None:
+            self._release(job, JOB_CANCELLED, 'Cancelled')
+
+class EventStreamThread(QThread):
+    """Follows a daemon's event stream and forwards its events.
+
+    After (re)connecting it emits ``{'event': 'snapshot', 'jobs': [...]}``
+    with the daemon's job list, then every event as it arrives. A lost
+    connection is retried every few seconds.
+    """
+    event = pyqtSignal(object)
+    disconnected = pyqtSignal(str)
+
+    def __init__(self, client, retry_interval=3.0):
+        super().__init__()
+        self.client = client
+        self.retry_interval = retry_interval
+        self._stop = threading.Event()
+        self._stream = None
+
+    def stop(self):
+        self._stop.set()
+        stream = self._stream
+        if stream is not None:
+            stream.close()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                # Subscribe before listing, so no event falls in between
+                self._stream = self.client.events()
+                if self._stop.is_set():
                     break
+                self.event.emit({'event': 'snapshot', 'jobs': self.client.jobs()})
+                for record in self._stream:
+                    self.event.emit(record)
+                    if record['event'] == 'overflow':
+                        break  # Too far behind: list the jobs again
+            except DaemonError as e:
+                if not self._stop.is_set():
+                    self.disconnected.emit(str(e))
+            finally:
+                if self._stream is not None:
+                    self._stream.close()
+                    self._stream = None
+            self._stop.wait(self.retry_interval)
 
-            if not ffmpeg_found:
-                self.error.emit("FFmpeg not found. Please run setup_ffmpeg.py as administrator to install FFmpeg.")
-                return
 
-            self.status.emit('Starting download...')
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                try:
-                    # First, try to extract video information
-                    self.status.emit('Retrieving video information...')
-                    info = ydl.extract_info(self.url, download=False)
-                    if info is None:
-                        self.error.emit("Could not retrieve video information. Please check the URL.")
-                        return
-                    
-                    # Calculate estimated file size
-                    if 'filesize' in info:
-                        size_mb = info['filesize'] / (1024 * 1024)
-                        self.status.emit(f'Estimated file size: {size_mb:.1f} MB')
-                    
-                    # Then proceed with download
-                    self.status.emit('Starting download and conversion...')
-                    ydl.download([self.url])
-                    
-                except yt_dlp.utils.DownloadError as e:
-                    error_msg = str(e)
-                    if "requested format not available" in error_msg.lower():
-                        self.error.emit("The requested video quality is not available. Try a lower quality setting.")
-                    elif "private video" in error_msg.lower():
-                        self.error.emit("This video is private and cannot be downloaded.")
-                    elif "copyright" in error_msg.lower():
-                        self.error.emit("This video is not available due to copyright restrictions.")
-                    else:
-                        self.error.emit(f"Download error: {error_msg}")
-                    return
-                except Exception as e:
-                    self.error.emit(f"An error occurred: {str(e)}")
-                    return
-
-            # Get the output file name
-            output_file = os.path.join(self.output_path, f"{info['title']}.{ext}")
-
-            # Clean up temporary files after conversion
-            files_to_delete = [os.path.join(self.output_path, f) for f in os.listdir(self.output_path) if f.endswith('.tmp') or f.endswith('.part') or f.endswith('.frag')]
-            for file in files_to_delete:
-                self.status.emit(f'Attempting to delete: {file}')  # Debugging output
-                if os.path.exists(file):
-                    os.remove(file)
-                    self.status.emit(f'Deleted temporary file: {file}')
-                else:
-                    self.status.emit(f'File not found for deletion: {file}')  # Additional debugging output
-
-            # Set the modification time of the output file to the current time
-            if os.path.exists(output_file):
-                os.utime(output_file, None)  # Set to current time
-
-            self.status.emit('Conversion completed successfully!')
-            self.finished.emit()
-            
-        except Exception as e:
-            error_msg = str(e)
-            if "ffmpeg" in error_msg.lower():
-                error_msg = "FFmpeg error. Please make sure FFmpeg is installed correctly and try again."
-            elif "unavailable" in error_msg.lower():
-                error_msg = "Video is unavailable. Please check if the video exists and is not private."
-            self.error.emit(error_msg)
+class RemoteJobQueue(QObject):
+    """Stand-in for JobQueue that leaves the jobs to a ``funlight_daemon``.
+
+    Offers the same signals and ``jobs`` as JobQueue, so the window and
+    JobTableModel work unchanged; the jobs and their state come from the
+    daemon's event stream. Requests run on short-lived threads and report
+    failures through ``error``. Concurrency, bandwidth, streaming, the
+    journal and the output index are set on the daemon's command line, so
+    the setters do nothing here.
+    """
+    job_changed = pyqtSignal(int)
+    job_added = pyqtSignal(int)
+    job_removed = pyqtSignal(int)
+    progress_tick = pyqtSignal()
+    idle = pyqtSignal()
+    error = pyqtSignal(str)
+
+    def __init__(self, client, parent=None):
+        super().__init__(parent)
+        self.client = client
+        self.journal = None
+        self.output_index = None
+        self.telemetry = Telemetry()
+        self.jobs = {}
+        self._events = EventStreamThread(client)
+        self._events.event.connect(self._on_event)
+        self._events.disconnected.connect(
+            lambda message: self.error.emit(f'Daemon not reachable: {message}'))
+        self._events.start()
+
+    def submit_urls(self, urls, output_path, format_option, quality, start_time=None, end_time=None,
+                    priority='normal', split=None):
+        self._request(self.client.submit, urls, output_path, format_option, quality, start_time, end_time,
+                      priority, split)
+
+    def submit_files(self, paths, output_path, format_option, quality, split=None):
+        # The paths must exist on the daemon's machine
+        self._request(self.client.submit, paths, output_path, format_option, quality, split=split)
+
+    def resume_interrupted(self):
+        return 0
+
+    def set_max_workers(self, count):
+        pass
+
+    def set_per_host_limit(self, count):
+        pass
+
+    def set_bandwidth_limit(self, bytes_per_second):
+        pass
+
+    def set_streaming(self, enabled):
+        pass
+
+    def set_priority(self, job_id, priority):
+        pass
+
+    def set_progress_interval(self, seconds):
+        pass
+
+    def cancel(self, job_id):
+        self._request(self.client.cancel, job_id)
+
+    def retry(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None and job.state in (JOB_FAILED, JOB_CANCELLED):
+            self._request(self.client.retry, job_id)
+
+    def cancel_all(self):
+        for job in list(self.jobs.values()):
+            if job.state in (JOB_QUEUED, JOB_RUNNING):
+                self.cancel(job.id)
+
+    def shutdown(self):
+        """Stop following the daemon; its jobs keep running."""
+        self._events.stop()
+        self._events.wait()
+
+    def active_count(self):
+        return sum(1 for job in self.jobs.values() if job.state in (JOB_QUEUED, JOB_RUNNING))
+
+    def _request(self, call, *args):
+        def run():
+            try:
+                call(*args)
+            except DaemonError as e:
+                self.error.emit(str(e))
+        threading.Thread(target=run, daemon=True).start()
+
+    def _add(self, record):
+        job = Job(record['id'], record['url'], record['output'], record['format'], record.get('quality'))
+        self.jobs[job.id] = job
+        self.job_added.emit(job.id)
+        return job
+
+    @pyqtSlot(object)
+    def _on_event(self, record):
+        event = record['event']
+        if event == 'snapshot':
+            listed = {entry['id']: entry for entry in record['jobs']}
+            for job_id in [job_id for job_id in self.jobs if job_id not in listed]:
+                del self.jobs[job_id]
+                self.job_removed.emit(job_id)
+            for entry in listed.values():
+                job = self.jobs.get(entry['id']) or self._add(entry)
+                job.state = entry['state']
+                job.progress = int(entry['percent'])
+                job.message = entry['message']
+                self.job_changed.emit(job.id)
+            self.progress_tick.emit()
+            return
+        job_id = record.get('job')
+        job = self.jobs.get(job_id)
+        if event == 'queued':
+            if job is None:
+                job = self._add({'id': job_id, **record})
+            job.state, job.progress, job.message = JOB_QUEUED, 0, 'Queued'
+        elif job is None:
+            return
+        elif event == 'removed':
+            del self.jobs[job_id]
+            self.job_removed.emit(job_id)
+            return
+        elif event == 'started':
+            job.state, job.message = JOB_RUNNING, 'Starting...'
+        elif event in ('status', 'progress'):
+            if event == 'progress':
+                job.progress = int(record['percent'])
+            job.message = record['message']
+        elif event == 'done':
+            job.state, job.progress = JOB_DONE, 100
+            job.message = 'Already converted' if record.get('skipped') else 'Completed'
+        elif event == 'failed':
+            job.state, job.message = JOB_FAILED, record['error']
+        elif event == 'cancelled':
+            job.state, job.message = JOB_CANCELLED, 'Cancelled'
+        else:
+            return
+        self.job_changed.emit(job_id)
+        if event == 'progress':
+            self.progress_tick.emit()
+        elif event in (JOB_DONE, JOB_FAILED, JOB_CANCELLED) and not self.active_count():
+            self.idle.emit()
 
 class FunlightConverter(QMainWindow):
     def __init__(self):
@@ -326,7 +1044,7 @@ class FunlightConverter(QMainWindow):
         # URL input with paste button
         url_layout = QHBoxLayout()
         self.url_input = QLineEdit()
-        self.url_input.setPlaceholderText('Enter YouTube URL here or drag & drop a video link...')
+        self.url_input.setPlaceholderText('Enter YouTube URLs here (separated by spaces) or drag & drop video links...')
         paste_button = QPushButton('Paste')
         paste_button.clicked.connect(self.paste_url)
         url_layout.addWidget(self.url_input)
@@ -343,6 +1061,15 @@ class FunlightConverter(QMainWindow):
         self.format_combo.addItems(['MP3', 'WAV', 'AAC', 'MP4'])
         self.format_combo.currentTextChanged.connect(self.update_quality_options)
         format_layout.addWidget(self.format_combo)
+        # Further formats made from the same download in the same ffmpeg run
+        extra_layout = QHBoxLayout()
+        extra_layout.addWidget(QLabel('Also:'))
+        self.extra_format_checks = {}
+        for name in ['MP3', 'WAV', 'AAC', 'MP4']:
+            check = QCheckBox(name)
+            self.extra_format_checks[name] = check
+            extra_layout.addWidget(check)
+        format_layout.addLayout(extra_layout)
         format_group.setLayout(format_layout)
         settings_layout.addWidget(format_group)
 
@@ -373,6 +1100,11 @@ class FunlightConverter(QMainWindow):
         time_range_layout.addWidget(self.end_time)
         
         time_layout.addLayout(time_range_layout)
+        self.split_check = QCheckBox('Split into chapters')
+        self.split_check.setToolTip('Save one file per chapter of the video, from a single download')
+        self.split_check.toggled.connect(lambda checked: (self.start_time.setDisabled(checked),
+                                                          self.end_time.setDisabled(checked)))
+        time_layout.addWidget(self.split_check)
         time_group.setLayout(time_layout)
         settings_layout.addWidget(time_group)
 
@@ -407,8 +1139,69 @@ class FunlightConverter(QMainWindow):
         status_group.setLayout(status_layout)
         layout.addWidget(status_group)
 
+        # Job queue
+        queue_group = QGroupBox('Queue')
+        queue_layout = QVBoxLayout()
+
+        queue_settings_layout = QHBoxLayout()
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 16)
+        self.workers_spin.setValue(min(4, os.cpu_count() or 1))
+        self.host_limit_spin = QSpinBox()
+        self.host_limit_spin.setRange(1, 16)
+        self.host_limit_spin.setValue(2)
+        queue_settings_layout.addWidget(QLabel('Parallel jobs:'))
+        queue_settings_layout.addWidget(self.workers_spin)
+        queue_settings_layout.addWidget(QLabel('Per host:'))
+        queue_settings_layout.addWidget(self.host_limit_spin)
+        self.bandwidth_spin = QSpinBox()
+        self.bandwidth_spin.setRange(0, 10000)
+        self.bandwidth_spin.setSuffix(' MB/s')
+        self.bandwidth_spin.setSpecialValueText('Unlimited')
+        queue_settings_layout.addWidget(QLabel('Bandwidth:'))
+        queue_settings_layout.addWidget(self.bandwidth_spin)
+        self.priority_combo = QComboBox()
+        self.priority_combo.addItems([priority.capitalize() for priority in PRIORITY_WEIGHTS])
+        self.priority_combo.setCurrentText('Normal')
+        self.priority_combo.setToolTip('Priority of new jobs; changing it also applies to the selected jobs')
+        self.priority_combo.activated.connect(self.prioritize_selected)
+        queue_settings_layout.addWidget(QLabel('Priority:'))
+        queue_settings_layout.addWidget(self.priority_combo)
+        self.stream_check = QCheckBox('Stream audio')
+        self.stream_check.setToolTip('Convert audio jobs while downloading, without a temporary file')
+        queue_settings_layout.addWidget(self.stream_check)
+        queue_settings_layout.addStretch()
+        cancel_button = QPushButton('Cancel')
+        cancel_button.clicked.connect(self.cancel_selected)
+        retry_button = QPushButton('Retry')
+        retry_button.clicked.connect(self.retry_selected)
+        queue_settings_layout.addWidget(cancel_button)
+        queue_settings_layout.addWidget(retry_button)
+        queue_layout.addLayout(queue_settings_layout)
+
+        filter_layout = QHBoxLayout()
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText('Filter by URL or status...')
+        self.filter_state_combo = QComboBox()
+        self.filter_state_combo.addItems(['All', JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_CANCELLED])
+        filter_layout.addWidget(self.filter_input)
+        filter_layout.addWidget(self.filter_state_combo)
+        queue_layout.addLayout(filter_layout)
+
+        self.job_table = QTableView()
+        self.job_table.verticalHeader().setVisible(False)
+        # Fixed row heights spare the view from measuring every row
+        self.job_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.job_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.job_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.job_table.setWordWrap(False)
+        queue_layout.addWidget(self.job_table)
+
+        queue_group.setLayout(queue_layout)
+        layout.addWidget(queue_group)
+
         # Download button
-        self.download_button = QPushButton('Start Download')
+        self.download_button = QPushButton('Add to Queue')
         self.download_button.setMinimumHeight(40)
         self.download_button.clicked.connect(self.start_download)
         layout.addWidget(self.download_button)
@@ -418,7 +1211,33 @@ class FunlightConverter(QMainWindow):
         os.makedirs(default_output, exist_ok=True)
         self.dir_input.setText(default_output)
 
-        self.download_thread = None
+        daemon_url = os.environ.get('FUNLIGHT_DAEMON_URL')
+        if daemon_url:
+            # Attach to a running funlight_daemon instead of running the jobs here
+            self.job_queue = RemoteJobQueue(DaemonClient(daemon_url), parent=self)
+        else:
+            self.job_queue = JobQueue(self.workers_spin.value(), self.host_limit_spin.value(),
+                                      journal=open_journal(), output_index=open_output_index(),
+                                      telemetry=Telemetry(trace_dir=os.environ.get('FUNLIGHT_TRACE_DIR')),
+                                      parent=self)
+        self.job_queue.error.connect(self.update_status)
+        self.job_model = JobTableModel(self.job_queue, parent=self)
+        self.job_model.updated.connect(self.jobs_updated)
+        self.job_table.setModel(self.job_model)
+        header = self.job_table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.Stretch)
+        header.setSectionResizeMode(4, QHeaderView.Stretch)
+        # Start unsorted (in submission order) until a header is clicked
+        header.setSortIndicator(-1, Qt.AscendingOrder)
+        self.job_table.setSortingEnabled(True)
+        self.filter_input.textChanged.connect(self.apply_job_filter)
+        self.filter_state_combo.currentIndexChanged.connect(self.apply_job_filter)
+        self.job_queue.idle.connect(self.queue_finished)
+        self.workers_spin.valueChanged.connect(self.job_queue.set_max_workers)
+        self.host_limit_spin.valueChanged.connect(self.job_queue.set_per_host_limit)
+        self.bandwidth_spin.valueChanged.connect(
+            lambda value: self.job_queue.set_bandwidth_limit(value * 1024 * 1024))
+        self.stream_check.toggled.connect(self.job_queue.set_streaming)
 
     def update_quality_options(self):
         self.quality_combo.clear()
@@ -434,10 +1253,15 @@ class FunlightConverter(QMainWindow):
         self.url_input.setText(clipboard.text())
 
     def dragEnterEvent(self, event):
-        if event.mimeData().hasText():
+        if event.mimeData().hasUrls() or event.mimeData().hasText():
             event.acceptProposedAction()
 
     def dropEvent(self, event):
+        # Files and folders from a file manager are converted right away
+        paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+        if paths:
+            self.convert_local_files(paths)
+            return
         url = event.mimeData().text()
         self.url_input.setText(url)
 
@@ -446,9 +1270,8 @@ class FunlightConverter(QMainWindow):
         if dir_path:
             self.dir_input.setText(dir_path)
 
-    def start_download(self):
-        url = self.url_input.text().strip()
-        output_path = self.dir_input.text()
+    def selected_format(self):
+        """The format option and quality chosen in the settings."""
         format_option = self.format_combo.currentText()
         
         # Convert quality string to number
@@ -456,26 +1279,76 @@ class FunlightConverter(QMainWindow):
         if format_option in ['MP4']:
             quality = quality.replace('p', '')  # Remove 'p' from resolution
         
-        start_time = self.start_time.value() if self.start_time.value() > 0 else None
-        end_time = self.end_time.value() if self.end_time.value() > 0 else None
+        extra_formats = [name for name, check in self.extra_format_checks.items()
+                         if check.isChecked() and name != format_option]
+        if extra_formats:
+            # The quality setting belongs to the main format; the others use their defaults
+            quality = f'{format_option}={quality}' if quality else None
+            format_option = ','.join([format_option] + extra_formats)
+        return format_option, quality
+
+    def convert_local_files(self, paths):
+        output_path = self.dir_input.text()
+        if not output_path:
+            QMessageBox.warning(self, 'Error', 'Please select an output directory')
+            return
+        format_option, quality = self.selected_format()
+        self.status_label.setText(f'Converting {len(paths)} dropped file(s) or folder(s)')
+        self.job_queue.submit_files(paths, output_path, format_option, quality, self.selected_split())
+
+    def start_download(self):
+        urls = self.url_input.text().split()
+        output_path = self.dir_input.text()
+        format_option, quality = self.selected_format()
+
+        split = self.selected_split()
+        start_time = self.start_time.value() if self.start_time.value() > 0 and not split else None
+        end_time = self.end_time.value() if self.end_time.value() > 0 and not split else None
 
-        if not url:
+        if not urls:
             QMessageBox.warning(self, 'Error', 'Please enter a YouTube URL')
             return
         if not output_path:
             QMessageBox.warning(self, 'Error', 'Please select an output directory')
             return
 
-        self.download_button.setEnabled(False)
-        self.progress_bar.setValue(0)
-        self.status_label.setText('Initializing...')
+        self.url_input.clear()
+        self.status_label.setText(f'Queued {len(urls)} URL(s)')
+        self.job_queue.submit_urls(urls, output_path, format_option, quality, start_time, end_time,
+                                   self.priority_combo.currentText().lower(), split)
+
+    def selected_split(self):
+        return SPLIT_CHAPTERS if self.split_check.isChecked() else None
+
+    def selected_job_ids(self):
+        return [self.job_model.job_id(index.row()) for index in self.job_table.selectionModel().selectedRows()]
+
+    def apply_job_filter(self):
+        state = self.filter_state_combo.currentText()
+        self.job_model.set_filter(self.filter_input.text(), None if state == 'All' else state)
 
-        self.download_thread = DownloadThread(url, output_path, format_option, quality, start_time, end_time)
-        self.download_thread.progress.connect(self.update_progress)
-        self.download_thread.finished.connect(self.download_finished)
-        self.download_thread.error.connect(self.download_error)
-        self.download_thread.status.connect(self.update_status)
-        self.download_thread.start()
+    def cancel_selected(self):
+        for job_id in self.selected_job_ids():
+            self.job_queue.cancel(job_id)
+
+    def retry_selected(self):
+        for job_id in self.selected_job_ids():
+            self.job_queue.retry(job_id)
+
+    def prioritize_selected(self):
+        priority = self.priority_combo.currentText().lower()
+        for job_id in self.selected_job_ids():
+            self.job_queue.set_priority(job_id, priority)
+
+    def jobs_updated(self, job_id):
+        # Called once per batch of job changes, with the last job that changed
+        job = self.job_queue.jobs.get(job_id)
+        if job is not None:
+            self.status_label.setText(f'[#{job.id}] {job.message}')
+        self.update_overall_progress()
+
+    def update_overall_progress(self):
+        self.update_progress(self.job_model.overall_progress())
 
     def update_progress(self, percentage):
         self.progress_bar.setValue(int(percentage))
@@ -483,22 +1356,101 @@ class FunlightConverter(QMainWindow):
     def update_status(self, status):
         self.status_label.setText(status)
 
-    def download_finished(self):
-        self.download_button.setEnabled(True)
-        self.status_label.setText('Download completed successfully!')
-        self.progress_bar.setValue(100)
-        QMessageBox.information(self, 'Success', 'Download completed successfully!')
+    def queue_finished(self):
+        states = [job.state for job in self.job_queue.jobs.values()]
+        done = states.count(JOB_DONE)
+        failed = states.count(JOB_FAILED)
+        self.status_label.setText(f'Queue finished: {done} completed, {failed} failed')
+        if failed:
+            QMessageBox.warning(self, 'Queue finished',
+                                f'{done} download(s) completed, {failed} failed. '
+                                'Select failed jobs and press Retry to run them again.')
+        elif done:
+            QMessageBox.information(self, 'Success', f'{done} download(s) completed successfully!')
+
+    def offer_resume(self):
+        journal = self.job_queue.journal
+        if journal is None:
+            return
+        interrupted = journal.interrupted()
+        if not interrupted:
+            return
+        answer = QMessageBox.question(self, 'Resume downloads',
+                                      f'{len(interrupted)} download(s) from the last session did not finish. '
+                                      'Resume them now?', QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+        if answer == QMessageBox.Yes:
+            count = self.job_queue.resume_interrupted()
+            self.status_label.setText(f'Resumed {count} download(s)')
+        else:
+            for entry in interrupted:
+                journal.abandon(entry.id)
+
+    def closeEvent(self, event):
+        # Unfinished jobs stay in the journal and are offered again on the next start
+        self.job_queue.shutdown()
+        if self.job_queue.journal is not None:
+            self.job_queue.journal.close()
+        if self.job_queue.output_index is not None:
+            self.job_queue.output_index.close()
+        super().closeEvent(event)
 
-    def download_error(self, error_message):
-        self.download_button.setEnabled(True)
-        self.status_label.setText('Error: ' + error_message)
-        QMessageBox.critical(self, 'Error', f'Download failed: {error_message}')
+def open_journal():
+    """Open the per-user job journal, or return None if it cannot be used."""
+    try:
+        journal = JobJournal()
+        journal.prune()
+    except (OSError, sqlite3.Error):
+        return None
+    return journal
 
-def main():
-    app = QApplication(sys.argv)
+def open_output_index():
+    """Open the per-user output index, or return None if it cannot be used."""
+    try:
+        return OutputIndex()
+    except (OSError, sqlite3.Error):
+        return None
+
+def start_metrics_server(metrics):
+    """Serve ``metrics`` on the port in FUNLIGHT_METRICS_PORT, if it is set."""
+    port = os.environ.get('FUNLIGHT_METRICS_PORT')
+    if not port:
+        return None
+    try:
+        return MetricsServer(metrics, int(port)).start()
+    except (ValueError, OSError) as e:
+        print(f'Metrics endpoint not available: {e}', file=sys.stderr)
+        return None
+
+def preload_engine():
+    """Import the modules that run jobs on a background thread; returns the thread.
+
+    A job started before they are loaded waits for this import instead
+    of starting its own.
+    """
+    def load():
+        import converter_engine, local_convert, playlist_expander  # noqa: F401
+
+    thread = threading.Thread(target=load, name='preload-engine', daemon=True)
+    thread.start()
+    return thread
+
+def show_window():
+    """Create and show the main window; the job engine loads once it is on screen."""
     converter = FunlightConverter()
     converter.show()
-    sys.exit(app.exec_())
+    QTimer.singleShot(0, converter.offer_resume)
+    if isinstance(converter.job_queue, JobQueue):
+        QTimer.singleShot(0, preload_engine)
+    return converter
+
+def main():
+    app = QApplication(sys.argv)
+    converter = show_window()
+    metrics_server = start_metrics_server(converter.job_queue.telemetry.metrics)
+    status = app.exec_()
+    if metrics_server is not None:
+        metrics_server.stop()
+    sys.exit(status)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,735 @@
+"""Long-running converter service with a local HTTP/JSON API.
+
+Runs the same pipeline as ``funlight_cli`` (downloads on a thread pool,
+conversions on a ``pipeline.ConversionStage``) for jobs that other tools
+submit over HTTP, on 127.0.0.1 or a Unix socket:
+
+    python funlight_daemon.py -o ~/Music --port 8765
+    curl -H 'Content-Type: application/json' -d '{"urls": ["https://..."], "format": "MP3,WAV"}' \
+         http://127.0.0.1:8765/jobs
+    curl -N http://127.0.0.1:8765/events
+
+    POST /jobs              submit {"urls": [...], "output", "format", "quality",
+                            "start", "end", "priority", "split"}; answers right away
+                            with the submission, whose playlists are listed meanwhile
+    GET  /submissions/ID    a submission: "listing", "listed" or "failed", and its job ids
+    GET  /jobs[?state=S]    all jobs (the last ``--history`` finished ones are kept)
+    GET  /jobs/ID           one job, with its result or error
+    POST /jobs/ID/cancel    (also DELETE /jobs/ID)
+    POST /jobs/ID/retry     run a failed or cancelled job again
+    GET  /events[?job=ID]   Server-Sent Events with the CLI's JSON events
+    GET  /metrics           Prometheus metrics (see ``telemetry``)
+
+The API is for programs of the local user, not for web pages: requests
+with an ``Origin`` header or a foreign ``Host`` are refused with 403, and
+POST and DELETE requests must be sent as ``application/json``.
+
+Paths of files or folders on the daemon's disk are converted like in the
+CLI (see ``local_convert``). The asyncio loop only does the I/O: an event
+subscriber is a coroutine and a bounded queue, not a thread, so thousands
+of idle subscribers cost little. A subscriber that falls more than
+``--subscriber-buffer`` events behind is disconnected and can resync with
+``GET /jobs``.
+
+Like in the CLI, only a bounded number of jobs is queued or running at a
+time: listing a long playlist or a large folder pauses until jobs finish,
+and a retried job stays queued until one does.
+The jobs of a submission carry its id, a ``listed`` event ends the listing.
+
+With ``--journal`` the jobs running at shutdown are suspended and
+``--resume`` picks them up on the next start.
+
+This module must not import PyQt5.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from bandwidth import BandwidthScheduler, PRIORITY_WEIGHTS
+from converter_engine import DEFAULT_QUALITY, ConversionError, ConversionJob, parse_targets
+from funlight_cli import parse_formats, parse_rate, run_job, run_local_job, write_journal
+from job_journal import JobJournal, default_journal_path
+from local_convert import collect_files, file_output_name
+from metadata_cache import MetadataCache
+from output_index import OutputIndex, default_index_path
+from pipeline import ConversionStage, default_workers
+from playlist_expander import PlaylistExpander
+from progress_bus import ProgressBus
+from splitter import SPLIT_CHAPTERS, parse_cues
+from telemetry import Telemetry
+from ydl_pool import YoutubeDLPool, default_cachedir
+import toolchain
+
+DEFAULT_PORT = 8765
+FINAL_STATES = ('done', 'failed', 'cancelled')
+# Job state after each event that changes it
+EVENT_STATES = {'queued': 'queued', 'started': 'running', 'done': 'done', 'failed': 'failed',
+                'cancelled': 'cancelled'}
+MAX_BODY = 1024 * 1024
+SUBMISSION_HISTORY = 1000
+HEARTBEAT = 15.0
+STATUS_TEXT = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+               405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large', 415: 'Unsupported Media Type',
+               500: 'Internal Server Error'}
+LOOPBACK_NAMES = ('127.0.0.1', 'localhost', '[::1]')
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Subscriber:
+    """An event stream client: a bounded queue filled on the event loop."""
+
+    def __init__(self, job_id=None, buffer=1000):
+        self.job_id = job_id
+        self.queue = asyncio.Queue(buffer)
+        self.overflowed = False
+
+    def offer(self, record):
+        if self.job_id is not None and record.get('job') != self.job_id:
+            return
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def close(self):
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class JobService:
+    """The daemon's jobs, their runs and the subscribers to their events.
+
+    ``emit`` may be called from any thread (it has the signature of
+    ``funlight_cli.EventWriter.emit``); everything else runs on ``loop``.
+    """
+
+    def __init__(self, loop, output_path, format_option, quality, jobs, stage, engine_options,
+                 expander, journal=None, output_index=None, history_limit=20000, subscriber_buffer=1000):
+        self.loop = loop
+        self.output_path = output_path
+        self.format_option = format_option
+        self.quality = quality
+        self.stage = stage
+        self.engine_options = engine_options
+        self.expander = expander
+        self.journal = journal
+        self.output_index = output_index
+        self.history_limit = history_limit
+        self.subscriber_buffer = subscriber_buffer
+        self.jobs = OrderedDict()
+        self._specs = {}
+        self._history = OrderedDict()
+        self._subscribers = set()
+        self._workers = ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix='job')
+        self._expansions = ThreadPoolExecutor(max_workers=2, thread_name_prefix='expand')
+        self._ids = itertools.count(1)
+        self._submissions = OrderedDict()
+        self._submission_ids = itertools.count(1)
+        # Jobs queued or running at once, as in the CLI; each holds a slot until its first final state
+        self._slots = threading.BoundedSemaphore(max(1, jobs) * 2 + stage.workers + stage.buffer_size)
+        self._holding = set()
+        # Retried jobs waiting for a slot, which they get before new submissions
+        self._retries = deque()
+        self._lock = threading.Lock()
+        self._engines = {}
+        # Job id -> number of its current run, so a stale run of a retried job does nothing
+        self._attempts = {}
+        self._cancelled = set()
+        self._closed = False
+
+    # Events
+
+    def emit(self, event, **fields):
+        record = {'event': event, 'time': round(time.time(), 3), **fields}
+        self.loop.call_soon_threadsafe(self._publish, record)
+
+    def write_progress(self, snapshots):
+        for snapshot in snapshots:
+            if snapshot.phase in ('downloading', 'downloaded', 'converting'):
+                self.emit('progress', job=snapshot.job_id, phase=snapshot.phase,
+                          percent=round(snapshot.percent, 1), downloaded_bytes=snapshot.downloaded_bytes,
+                          total_bytes=snapshot.total_bytes, speed=snapshot.speed, eta=snapshot.eta,
+                          message=snapshot.describe())
+
+    def subscribe(self, job_id=None):
+        subscriber = Subscriber(job_id, self.subscriber_buffer)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    def _publish(self, record):
+        job_id = record.get('job')
+        job = self.jobs.get(job_id) if job_id is not None else None
+        event = record['event']
+        if event == 'listed':
+            submission = self._submissions.get(record['submission'])
+            if submission is not None:
+                submission.update(state='failed' if record.get('error') else 'listed', error=record.get('error'))
+        if job is not None:
+            state = EVENT_STATES.get(event)
+            if state is not None:
+                job['state'] = state
+            if event == 'queued':
+                job.update(percent=0, message='Queued', result=None, error=None)
+                self._history.pop(job_id, None)
+            elif event == 'started':
+                job['message'] = 'Starting...'
+            elif event == 'status':
+                job['message'] = record['message']
+            elif event == 'progress':
+                job.update(percent=record['percent'], message=record['message'])
+            elif event == 'done':
+                result = {key: value for key, value in record.items() if key not in ('event', 'time', 'job')}
+                job.update(percent=100, result=result,
+                           message='Already converted' if result.get('skipped') else 'Completed')
+            elif event == 'failed':
+                job.update(error=record['error'], message=record['error'])
+            elif event == 'cancelled':
+                job['message'] = 'Cancelled'
+            job['updated'] = record['time']
+        for subscriber in list(self._subscribers):
+            subscriber.offer(record)
+        if job is not None and event in FINAL_STATES:
+            with self._lock:
+                self._engines.pop(job_id, None)
+            if job_id in self._holding:
+                self._holding.discard(job_id)
+                self._release_slot()
+            self._archive(job_id)
+
+    def _archive(self, job_id):
+        self._history[job_id] = None
+        while len(self._history) > self.history_limit:
+            old_id, _ = self._history.popitem(last=False)
+            self.jobs.pop(old_id, None)
+            self._specs.pop(old_id, None)
+            self._attempts.pop(old_id, None)
+            self._publish({'event': 'removed', 'time': round(time.time(), 3), 'job': old_id})
+
+    # Jobs
+
+    async def submit(self, spec):
+        """Start listing the jobs of a submission (see the module docstring); returns the submission."""
+        params = self._parse_spec(spec)
+        output = params[1]
+        try:
+            await self.loop.run_in_executor(None, lambda: os.makedirs(output, exist_ok=True))
+        except OSError as e:
+            raise ApiError(400, f"Cannot create the output directory {output}: {e.strerror or e}")
+        submission_id = next(self._submission_ids)
+        submission = self._submissions[submission_id] = {
+            'id': submission_id, 'state': 'listing', 'jobs': [], 'error': None, 'submitted': round(time.time(), 3)}
+        while len(self._submissions) > SUBMISSION_HISTORY:
+            self._submissions.popitem(last=False)
+        self._expansions.submit(self._expand, submission_id, params)
+        return submission
+
+    def submission(self, submission_id):
+        submission = self._submissions.get(submission_id)
+        if submission is None:
+            raise ApiError(404, f'No submission {submission_id}')
+        return submission
+
+    def _parse_spec(self, spec):
+        if not isinstance(spec, dict):
+            raise ApiError(400, 'Expected a JSON object')
+        urls = spec.get('urls', [spec['url']] if 'url' in spec else None)
+        if not urls or not isinstance(urls, list) or not all(isinstance(url, str) and url for url in urls):
+            raise ApiError(400, "'urls' must be a non-empty list of URLs or paths")
+        try:
+            format_option = ','.join(parse_targets(spec.get('format') or self.format_option))
+        except ConversionError as e:
+            raise ApiError(400, str(e))
+        quality = spec.get('quality')
+        if quality is None:
+            quality = self.quality if format_option == self.format_option else None
+            quality = quality or DEFAULT_QUALITY.get(format_option)
+        priority = spec.get('priority', 'normal')
+        if priority not in PRIORITY_WEIGHTS:
+            raise ApiError(400, f"'priority' must be one of {', '.join(PRIORITY_WEIGHTS)}")
+        start, end = spec.get('start'), spec.get('end')
+        if not all(value is None or isinstance(value, int) for value in (start, end)):
+            raise ApiError(400, "'start' and 'end' must be whole seconds")
+        output = spec.get('output') or self.output_path
+        if not isinstance(output, str):
+            raise ApiError(400, "'output' must be a directory path")
+        split = spec.get('split')
+        if split is not None:
+            if not isinstance(split, str) or (split != SPLIT_CHAPTERS and not parse_cues(split)):
+                raise ApiError(400, f"'split' must be '{SPLIT_CHAPTERS}' or a cue list")
+            if start is not None or end is not None:
+                raise ApiError(400, "'split' cannot be combined with 'start' and 'end'")
+        quality = str(quality) if quality is not None else None
+        return urls, output, format_option, quality, start, end, priority, split
+
+    def _expand(self, submission_id, params):
+        # On an expansion thread; jobs start while a playlist is still being listed
+        urls, output, format_option, quality, start, end, priority, split = params
+        count = 0
+        try:
+            for url in urls:
+                if os.path.exists(url):
+                    for source, output_dir, name in collect_files([url], output):
+                        job = ConversionJob(source, output_dir, format_option, quality, split=split)
+                        if self._add(job, name=name, submission=submission_id) is None:
+                            return
+                        count += 1
+                    continue
+                for entry_url in self.expander.expand(url):
+                    if entry_url != url:
+                        self.emit('expanded', submission=submission_id, url=url, entry=entry_url)
+                    job = ConversionJob(entry_url, output, format_option, quality, start, end, split)
+                    if self._add(job, priority=priority, submission=submission_id) is None:
+                        return
+                    count += 1
+        except Exception as e:
+            self.emit('listed', submission=submission_id, jobs=count, error=str(e))
+        else:
+            self.emit('listed', submission=submission_id, jobs=count)
+
+    def _acquire_slot(self):
+        # Waits for a job to finish; gives up once the service shuts down
+        while not self._slots.acquire(timeout=0.5):
+            if self._closed:
+                return False
+        if self._closed:
+            self._slots.release()
+            return False
+        return True
+
+    def _release_slot(self):
+        while self._retries:
+            job_id = self._retries.popleft()
+            job = self.jobs.get(job_id)
+            # Skip retries cancelled while they waited
+            if job is not None and job['state'] == 'queued' and job_id not in self._holding:
+                self._holding.add(job_id)
+                self._start(job_id)
+                return
+        self._slots.release()
+
+    def _add(self, job, job_id=None, **options):
+        """Register and queue a job from any thread once a slot is free; returns its id, or None when closing."""
+        if not self._acquire_slot():
+            return None
+        if job_id is None:
+            job_id = self.journal.add(job) if self.journal is not None else next(self._ids)
+        self.loop.call_soon_threadsafe(self._enqueue, job_id, job, options)
+        return job_id
+
+    def _enqueue(self, job_id, job, options):
+        if self._closed:
+            self._slots.release()
+            return  # Left queued in the journal for --resume
+        self._specs[job_id] = (job, options)
+        self._holding.add(job_id)
+        submission = self._submissions.get(options.get('submission'))
+        if submission is not None:
+            submission['jobs'].append(job_id)
+        self.jobs[job_id] = {'id': job_id, 'url': job.url, 'format': job.format_option, 'quality': job.quality,
+                             'output': job.output_path, 'state': 'queued', 'percent': 0, 'message': 'Queued',
+                             'result': None, 'error': None, 'submitted': round(time.time(), 3),
+                             'submission': options.get('submission')}
+        self._start(job_id)
+
+    def _start(self, job_id):
+        attempt = self._attempts[job_id] = self._attempts.get(job_id, 0) + 1
+        with self._lock:
+            self._cancelled.discard(job_id)
+        self._publish_queued(job_id)
+        self._workers.submit(self._run, job_id, attempt)
+
+    def _publish_queued(self, job_id):
+        job, _ = self._specs[job_id]
+        self._publish({'event': 'queued', 'time': round(time.time(), 3), 'job': job_id, 'url': job.url,
+                       'format': job.format_option, 'output': job.output_path})
+
+    def _run(self, job_id, attempt):
+        # On a worker thread
+        spec = self._specs.get(job_id)
+        with self._lock:
+            if spec is None or job_id in self._cancelled or self._attempts.get(job_id) != attempt:
+                return
+        job, options = spec
+
+        def on_engine(engine):
+            with self._lock:
+                self._engines[job_id] = engine
+                cancelled = job_id in self._cancelled
+            if cancelled:
+                engine.cancel()
+
+        finished = lambda ok: None  # The final event updates the job
+        try:
+            if options.get('name') is not None:
+                run_local_job(job_id, job, self, finished, self.stage, options['name'], self.output_index,
+                              self.journal, on_engine=on_engine)
+            else:
+                run_job(job_id, job, self, finished, conversion_stage=self.stage, on_engine=on_engine,
+                        priority=options.get('priority', 'normal'), workspace_path=options.get('workspace'),
+                        **self.engine_options)
+        except Exception as e:
+            self.emit('failed', job=job_id, url=job.url, error=str(e))
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ApiError(404, f'No job {job_id}')
+        return job
+
+    def list(self, state=None):
+        return [job for job in self.jobs.values() if state is None or job['state'] == state]
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job['state'] in FINAL_STATES:
+            return job
+        with self._lock:
+            self._cancelled.add(job_id)
+            engine = self._engines.get(job_id)
+        if engine is not None:
+            engine.cancel()  # Reported as 'cancelled' once the engine stops
+        elif job['state'] == 'queued':
+            if self.journal is not None:
+                self.journal.update(job_id, phase='cancelled')
+            self._publish({'event': 'cancelled', 'time': round(time.time(), 3), 'job': job_id, 'url': job['url']})
+        return job
+
+    def retry(self, job_id):
+        job = self.get(job_id)
+        if job['state'] not in ('failed', 'cancelled'):
+            raise ApiError(409, f"Job {job_id} is {job['state']}")
+        conversion_job, options = self._specs[job_id]
+        if self.journal is not None and options.get('name') is None:
+            # A failed journaled download resumes from its workspace
+            entry = self.journal.get(job_id)
+            options['workspace'] = entry.workspace if entry is not None else None
+            self.journal.update(job_id, phase='queued')
+        if self._slots.acquire(blocking=False):
+            self._holding.add(job_id)
+            self._start(job_id)
+        else:
+            # Bounded like new jobs: runs once another job gives up its slot
+            self._retries.append(job_id)
+            with self._lock:
+                self._cancelled.discard(job_id)
+            self._publish_queued(job_id)
+        return job
+
+    def resume_interrupted(self):
+        """Queue the jobs the journal lists as unfinished; returns how many.
+
+        Waits for free slots like a submission, so it must not run on the loop.
+        """
+        entries = self.journal.interrupted()
+        for count, entry in enumerate(entries):
+            self.journal.claim(entry.id)
+            job = ConversionJob(entry.url, entry.output_path, entry.format_option, entry.quality,
+                                entry.start_time, entry.end_time, entry.split)
+            if os.path.isfile(entry.url):
+                options = {'name': file_output_name(entry.url)}
+            else:
+                options = {'workspace': entry.workspace}
+            if self._add(job, entry.id, **options) is None:
+                return count  # The rest stays in the journal for the next start
+        return len(entries)
+
+    def shutdown(self):
+        """Suspend the running jobs (resumable with a journal) and wait for the threads."""
+        self._closed = True
+        for subscriber in list(self._subscribers):
+            subscriber.close()
+        self._expansions.shutdown(wait=False, cancel_futures=True)
+        self.expander.cancel()
+        with self._lock:
+            self._cancelled.update(self.jobs)
+            engines = list(self._engines.values())
+        for engine in engines:
+            engine.suspend()
+        self._workers.shutdown(wait=True, cancel_futures=True)
+        self.stage.close()
+
+
+class ApiServer:
+    """Minimal HTTP/1.1 front of a ``JobService``; one request per connection.
+
+    Web pages can send requests to 127.0.0.1 too, so requests from a
+    browser (with an ``Origin`` header) are refused, and so are ``Host``
+    headers other than ``hosts`` (against DNS rebinding). Requests that
+    change anything must be ``application/json``, which a page cannot send
+    without the browser asking first. ``hosts`` None skips the ``Host``
+    check, e.g. on a Unix socket.
+    """
+
+    def __init__(self, service, metrics, hosts=None):
+        self.service = service
+        self.metrics = metrics
+        self.hosts = hosts
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                method, path, query, headers, body = await self._read_request(reader)
+                self._check_client(method, headers)
+                await self._route(writer, method, path, query, body)
+            except ApiError as e:
+                await self._respond(writer, e.status, {'error': str(e)})
+            except (ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                await self._respond(writer, 400, {'error': 'Malformed request'})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) != 3:
+            raise ValueError('bad request line')
+        method, target, _ = request_line
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= 100:
+                raise ApiError(400, 'Too many headers')
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length') or 0)
+        if length > MAX_BODY:
+            raise ApiError(413, 'Request body too large')
+        body = await reader.readexactly(length) if length else b''
+        url = urlsplit(target)
+        return method.upper(), url.path.rstrip('/') or '/', parse_qs(url.query), headers, body
+
+    def _check_client(self, method, headers):
+        if 'origin' in headers:
+            raise ApiError(403, 'Requests from web pages are not accepted')
+        if self.hosts is not None and headers.get('host', '').lower() not in self.hosts:
+            raise ApiError(403, 'Unexpected Host header')
+        content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+        if method not in ('GET', 'HEAD') and content_type != 'application/json':
+            raise ApiError(415, 'Requests that change jobs must be application/json')
+
+    async def _route(self, writer, method, path, query, body):
+        service = self.service
+        parts = path.strip('/').split('/')
+        if parts == ['jobs']:
+            if method == 'GET':
+                state = query.get('state', [None])[0]
+                return await self._respond(writer, 200, {'jobs': service.list(state)})
+            if method == 'POST':
+                try:
+                    spec = json.loads(body or b'{}')
+                except ValueError:
+                    raise ApiError(400, 'The body must be JSON')
+                return await self._respond(writer, 202, await service.submit(spec))
+            raise ApiError(405, f'{method} not allowed')
+        if len(parts) == 2 and parts[0] == 'submissions':
+            if method != 'GET':
+                raise ApiError(405, f'{method} not allowed')
+            return await self._respond(writer, 200, service.submission(_job_id(parts[1], 'submission')))
+        if len(parts) in (2, 3) and parts[0] == 'jobs':
+            job_id = _job_id(parts[1])
+            action = parts[2] if len(parts) == 3 else None
+            if action is None and method == 'GET':
+                return await self._respond(writer, 200, service.get(job_id))
+            if (action == 'cancel' and method == 'POST') or (action is None and method == 'DELETE'):
+                return await self._respond(writer, 200, service.cancel(job_id))
+            if action == 'retry' and method == 'POST':
+                return await self._respond(writer, 200, service.retry(job_id))
+            raise ApiError(405 if action in (None, 'cancel', 'retry') else 404, f'{method} {path} not supported')
+        if parts == ['events'] and method == 'GET':
+            job_id = query.get('job', [None])[0]
+            return await self._stream_events(writer, _job_id(job_id) if job_id is not None else None)
+        if parts == ['metrics'] and method == 'GET':
+            return await self._respond(writer, 200, self.metrics.render(), 'text/plain; version=0.0.4')
+        if parts == [''] and method == 'GET':
+            states = {}
+            for job in service.jobs.values():
+                states[job['state']] = states.get(job['state'], 0) + 1
+            return await self._respond(writer, 200, {'service': 'funlight', 'jobs': states})
+        raise ApiError(404, f'No resource {path}')
+
+    async def _respond(self, writer, status, payload, content_type='application/json'):
+        if content_type == 'application/json':
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        else:
+            body = payload.encode('utf-8')
+        writer.write(f'HTTP/1.1 {status} {STATUS_TEXT.get(status, "")}\r\n'
+                     f'Content-Type: {content_type}; charset=utf-8\r\n'
+                     f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + body)
+        await writer.drain()
+
+    async def _stream_events(self, writer, job_id):
+        subscriber = self.service.subscribe(job_id)
+        try:
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                         b'Cache-Control: no-cache\r\nConnection: close\r\n\r\n')
+            await writer.drain()
+            while not subscriber.overflowed:
+                try:
+                    record = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    writer.write(b': keep-alive\n\n')
+                else:
+                    if record is None:
+                        break  # Shutting down
+                    data = json.dumps(record, ensure_ascii=False)
+                    writer.write(f"event: {record['event']}\ndata: {data}\n\n".encode('utf-8'))
+                await writer.drain()
+            if subscriber.overflowed:
+                writer.write(b'event: overflow\ndata: {}\n\n')
+                await writer.drain()
+        finally:
+            self.service.unsubscribe(subscriber)
+
+
+def _job_id(text, kind='job'):
+    try:
+        return int(text)
+    except ValueError:
+        raise ApiError(404, f'No {kind} {text}')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Run the converter as a service with a local HTTP API.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--socket', default=None, metavar='PATH',
+                        help='listen on a Unix socket instead of a TCP port')
+    parser.add_argument('-o', '--output', default=os.getcwd(), help='output directory of jobs that name none')
+    parser.add_argument('-f', '--format', default='MP3', type=parse_formats,
+                        help='format of jobs that name none, e.g. MP3 or MP3,WAV (default: MP3)')
+    parser.add_argument('-q', '--quality', default=None, help='quality of jobs that name no format or quality')
+    parser.add_argument('-j', '--jobs', default=min(4, os.cpu_count() or 1), type=int,
+                        help='number of jobs to run in parallel')
+    parser.add_argument('--encoders', type=int, default=default_workers(), metavar='N',
+                        help=f'conversions to run in parallel (default: {default_workers()})')
+    parser.add_argument('--encoder-threads', type=int, default=os.cpu_count() or 1, metavar='N',
+                        help=f'CPU threads shared by all running conversions (default: {os.cpu_count() or 1})')
+    parser.add_argument('--conversion-buffer', type=int, default=None, metavar='N',
+                        help='downloaded jobs that may wait for a free encoder (default: twice --encoders)')
+    parser.add_argument('--limit-rate', type=parse_rate, default=None, metavar='RATE',
+                        help='total download rate of all jobs together in bytes/s, e.g. 500K or 4M')
+    parser.add_argument('--stream', action='store_true', help='convert audio formats while downloading')
+    parser.add_argument('--journal', nargs='?', const=default_journal_path(), default=None, metavar='PATH',
+                        help='record jobs in a SQLite journal so they survive a restart '
+                             f'(default path: {default_journal_path()})')
+    parser.add_argument('--resume', action='store_true',
+                        help='run the unfinished jobs from the journal on start (implies --journal)')
+    parser.add_argument('--output-index', nargs='?', const=default_index_path(), default=None, metavar='PATH',
+                        help=f'skip jobs whose output is unchanged (default path: {default_index_path()})')
+    parser.add_argument('--metadata-cache', default=None, metavar='PATH',
+                        help='SQLite file to keep extracted metadata in between runs')
+    parser.add_argument('--scratch-dir', default=None, metavar='PATH',
+                        help="where jobs keep their intermediate files (default: in the output directory)")
+    parser.add_argument('--progress-interval', type=float, default=1.0, metavar='SECONDS',
+                        help='how often to send progress events per job (default: 1.0)')
+    parser.add_argument('--history', type=int, default=20000, metavar='N',
+                        help='finished jobs to keep for GET /jobs (default: 20000)')
+    parser.add_argument('--subscriber-buffer', type=int, default=1000, metavar='N',
+                        help='events an event stream may fall behind before it is closed (default: 1000)')
+    parser.add_argument('--trace-dir', default=None, metavar='PATH',
+                        help='write a Chrome trace-event file of every job to this directory')
+    parser.add_argument('--ydl-cache-dir', default=None, metavar='PATH',
+                        help=f'where yt-dlp keeps its cache (default: {default_cachedir()})')
+    parser.add_argument('--ffmpeg', default=None, metavar='PATH',
+                        help='ffmpeg binary or directory to use instead of searching PATH')
+    parser.add_argument('-v', '--verbose', action='store_true', help='let yt-dlp log to stderr')
+    return parser
+
+
+async def serve(args):
+    loop = asyncio.get_running_loop()
+    if args.resume and args.journal is None:
+        args.journal = default_journal_path()
+    journal = JobJournal(args.journal) if args.journal else None
+    if journal is not None:
+        journal.prune()
+    output_index = OutputIndex(args.output_index) if args.output_index else None
+    metadata_cache = MetadataCache(path=args.metadata_cache)
+    telemetry = Telemetry(trace_dir=args.trace_dir)
+    ydl_pool = YoutubeDLPool(max_idle=max(1, args.jobs) + 2, cachedir=args.ydl_cache_dir)
+    progress_bus = ProgressBus(args.progress_interval)
+    engine_options = dict(verbose=args.verbose, metadata_cache=metadata_cache, progress_bus=progress_bus,
+                          scratch_root=args.scratch_dir, journal=journal, output_index=output_index,
+                          bandwidth=BandwidthScheduler(args.limit_rate), streaming=args.stream,
+                          telemetry=telemetry, ydl_pool=ydl_pool)
+    stage = ConversionStage(args.encoders, args.encoder_threads, args.conversion_buffer)
+    expander = PlaylistExpander(verbose=args.verbose, metadata_cache=metadata_cache, ydl_pool=ydl_pool)
+    service = JobService(loop, args.output, args.format, args.quality, args.jobs, stage, engine_options,
+                         expander, journal, output_index, args.history, args.subscriber_buffer)
+    progress_bus.subscribe(service.write_progress)
+    if journal is not None:
+        progress_bus.subscribe(lambda snapshots: write_journal(journal, snapshots))
+    progress_bus.start()
+
+    api = ApiServer(service, telemetry.metrics)
+    if args.socket:
+        server = await asyncio.start_unix_server(api.handle, path=args.socket)
+        address = f'unix:{args.socket}'
+    else:
+        server = await asyncio.start_server(api.handle, args.host, args.port)
+        host, port = server.sockets[0].getsockname()[:2]
+        address = f'http://{host}:{port}'
+        names = set(LOOPBACK_NAMES) | {f'[{host}]' if ':' in host else host}
+        api.hosts = {f'{name}:{port}' for name in names} | (names if port == 80 else set())
+    print(f'Listening on {address}', file=sys.stderr, flush=True)
+    if args.resume:
+        loop.run_in_executor(None, service.resume_interrupted)
+
+    stopping = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stopping.set)
+        except (NotImplementedError, AttributeError):
+            pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+    try:
+        await stopping.wait()
+    finally:
+        server.close()
+        print('Shutting down', file=sys.stderr, flush=True)
+        await loop.run_in_executor(None, service.shutdown)
+        progress_bus.stop()
+        ydl_pool.close()
+        metadata_cache.close()
+        if journal is not None:
+            journal.close()
+        if output_index is not None:
+            output_index.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    os.makedirs(args.output, exist_ok=True)
+    toolchain.set_override(args.ffmpeg)
+    try:
+        return asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""Crash-safe record of queued and running jobs.
+
+Every job gets a row in a SQLite database (WAL mode) holding its exact
+parameters, its current phase, the scratch workspace its partial files live
+in and how far the download got. The phase changes a handful of times per
+job; byte counts arrive in batches at progress-bus frequency
+(``record_progress``), one transaction per batch, so the journal never sees
+per-chunk traffic. With ``synchronous=NORMAL`` a WAL commit does not wait
+for fsync, and a crash loses at most the last batch, never the database.
+
+After a crash or a killed process, ``interrupted()`` lists the jobs that
+never reached a final phase and whose owning process is gone (the GUI and
+the CLI may share one journal). Running such a job again with its recorded
+``workspace`` lets yt-dlp continue its ``.part`` files instead of starting
+from zero.
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+from app_paths import data_dir
+
+FINAL_PHASES = ('done', 'failed', 'cancelled')
+
+
+def default_journal_path():
+    return os.path.join(data_dir(), 'jobs.sqlite3')
+
+
+def _process_alive(pid):
+    if pid is None or pid == os.getpid():
+        return pid is not None
+    if sys.platform == 'win32':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        try:
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JournalEntry:
+    __slots__ = ('id', 'url', 'output_path', 'format_option', 'quality', 'start_time', 'end_time',
+                 'phase', 'workspace', 'downloaded_bytes', 'total_bytes', 'output_file', 'error',
+                 'pid', 'created', 'updated', 'split')
+
+    def __init__(self, row):
+        for name, value in zip(self.__slots__, row):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f'JournalEntry({self.id!r}, {self.url!r}, phase={self.phase!r})'
+
+
+class JobJournal:
+    def __init__(self, path=None):
+        self.path = path or default_journal_path()
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL, '
+                         'output_path TEXT NOT NULL, format_option TEXT NOT NULL, quality TEXT, '
+                         'start_time INTEGER, end_time INTEGER, phase TEXT NOT NULL, workspace TEXT, '
+                         'downloaded_bytes INTEGER NOT NULL DEFAULT 0, total_bytes INTEGER, '
+                         'output_file TEXT, error TEXT, pid INTEGER, created REAL NOT NULL, '
+                         'updated REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_phase ON jobs (phase)')
+        columns = [row[1] for row in self._db.execute('PRAGMA table_info(jobs)')]
+        if 'split' not in columns:
+            # Journals written before jobs could be split
+            self._db.execute('ALTER TABLE jobs ADD COLUMN split TEXT')
+        self._db.commit()
+
+    def add(self, job):
+        """Record a new ``ConversionJob`` (or an object with its fields) as queued and return its journal id."""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                'INSERT INTO jobs (url, output_path, format_option, quality, start_time, end_time, '
+                'phase, pid, created, updated, split) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job.url, job.output_path, job.format_option, job.quality, job.start_time, job.end_time,
+                 'queued', os.getpid(), now, now, job.split))
+            self._db.commit()
+            return cursor.lastrowid
+
+    def update(self, journal_id, **fields):
+        """Set columns of one job, e.g. ``phase`` or ``workspace``."""
+        fields['updated'] = time.time()
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock:
+            self._db.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), journal_id))
+            self._db.commit()
+
+    def record_progress(self, rows):
+        """Store ``(journal_id, phase, downloaded_bytes, total_bytes)`` rows in one transaction."""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                'UPDATE jobs SET phase = ?, downloaded_bytes = ?, total_bytes = ?, updated = ? '
+                'WHERE id = ? AND phase NOT IN (?, ?, ?)',
+                [(phase, downloaded, total, now, journal_id, *FINAL_PHASES)
+                 for journal_id, phase, downloaded, total in rows])
+            self._db.commit()
+
+    def get(self, journal_id):
+        with self._lock:
+            row = self._db.execute('SELECT * FROM jobs WHERE id = ?', (journal_id,)).fetchone()
+        return JournalEntry(row) if row else None
+
+    def interrupted(self):
+        """Jobs that were queued or running when their process ended."""
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM jobs WHERE phase NOT IN (?, ?, ?) ORDER BY id',
+                                    FINAL_PHASES).fetchall()
+        return [entry for entry in map(JournalEntry, rows) if not _process_alive(entry.pid)]
+
+    def claim(self, journal_id):
+        """Take over an interrupted job for this process and mark it queued."""
+        self.update(journal_id, phase='queued', pid=os.getpid())
+
+    def abandon(self, journal_id):
+        """Give up on an unfinished job: mark it cancelled and delete its partial files."""
+        entry = self.get(journal_id)
+        self.update(journal_id, phase='cancelled')
+        if entry is not None and entry.workspace:
+            shutil.rmtree(entry.workspace, ignore_errors=True)
+
+    def prune(self, max_age=7 * 24 * 3600):
+        """Forget finished jobs older than ``max_age`` seconds and delete their leftover workspaces."""
+        cutoff = time.time() - max_age
+        with self._lock:
+            rows = self._db.execute('SELECT id, workspace FROM jobs WHERE phase IN (?, ?, ?) AND updated < ?',
+                                    (*FINAL_PHASES, cutoff)).fetchall()
+            self._db.executemany('DELETE FROM jobs WHERE id = ?', [(row[0],) for row in rows])
+            self._db.commit()
+        for _, workspace in rows:
+            if workspace:
+                shutil.rmtree(workspace, ignore_errors=True)
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,280 @@
+"""Table model of the job queue for the Qt front end.
+
+``JobTableModel`` shows the jobs of a ``JobQueue`` in a ``QTableView``.
+It reads the queue's ``Job`` records directly instead of copying them
+into items, so a row costs a list slot and a dict entry, and the view
+only asks for the cells it paints.
+
+The queue's ``job_added``/``job_changed``/``job_removed`` signals only
+mark jobs; a single-shot timer folds everything that happened within
+``flush_interval`` into one insert, one ``dataChanged`` span and a few
+removals. Sorting and filtering run in Python over the records with
+``list.sort`` and a comprehension instead of a QSortFilterProxyModel,
+whose per-comparison ``data()`` calls do not keep up with tens of
+thousands of rows. While the view is sorted or filtered by a column that
+changes as jobs run, it is refreshed at most every ``refresh_interval``
+seconds so rows do not jump around on every progress tick.
+"""
+import time
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt, QTimer, pyqtSignal
+
+COLUMNS = ['URL', 'Format', 'State', 'Progress', 'Status']
+STATE_ORDER = {'running': 0, 'queued': 1, 'failed': 2, 'cancelled': 3, 'done': 4}
+
+# Sort keys per column; ties keep submission order
+SORT_KEYS = [
+    lambda job: job.url,
+    lambda job: job.format_option,
+    lambda job: STATE_ORDER.get(job.state, 5),
+    lambda job: job.progress,
+    lambda job: job.message.lower(),
+]
+# Columns whose values change while a job runs
+VOLATILE_COLUMNS = {2, 3, 4}
+
+# More separate row runs than this to insert or remove at once reset the model instead
+MAX_RUNS = 64
+
+
+class JobTableModel(QAbstractTableModel):
+    # Emitted after a flush with the id of the last job that changed
+    updated = pyqtSignal(int)
+
+    def __init__(self, job_queue, flush_interval=0.1, refresh_interval=1.0, parent=None):
+        super().__init__(parent)
+        self.job_queue = job_queue
+        self.refresh_interval = refresh_interval
+        self._records = {}
+        self._order = []  # All job ids in submission order
+        self._rows = []  # Ids of the displayed rows, in display order
+        self._row_of = {}
+        self._added = []
+        self._dirty = set()
+        self._removed = set()
+        self._last_changed = None
+        self._sort_column = -1
+        self._sort_order = Qt.AscendingOrder
+        self._filter_text = ''
+        self._filter_state = None
+        self._stale = False
+        self._refreshed = 0.0
+        # Overall progress: sum of the jobs' shares and how many count
+        self._shares = {}
+        self._share_sum = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(int(flush_interval * 1000))
+        self._timer.timeout.connect(self.flush)
+        job_queue.job_added.connect(self._on_added)
+        job_queue.job_changed.connect(self._on_changed)
+        job_queue.job_removed.connect(self._on_removed)
+
+    # QAbstractTableModel interface
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role not in (Qt.DisplayRole, Qt.ToolTipRole) or not index.isValid():
+            return None
+        job = self._records.get(self._rows[index.row()])
+        if job is None:
+            return None
+        column = index.column()
+        if column == 0:
+            return job.url
+        if role == Qt.ToolTipRole:
+            return None
+        if column == 1:
+            return job.format_option
+        if column == 2:
+            return job.state
+        if column == 3:
+            return f'{job.progress}%'
+        return job.message
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section]
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._sort_column = column
+        self._sort_order = order
+        self._apply(self._visible_ids())
+
+    # Queries
+
+    def job_id(self, row):
+        return self._rows[row]
+
+    def row_of(self, job_id):
+        return self._row_of.get(job_id)
+
+    def overall_progress(self):
+        """Average progress of the listed jobs that were not cancelled, in percent."""
+        return self._share_sum / len(self._shares) if self._shares else 0
+
+    def set_filter(self, text=None, state=None):
+        """Show only jobs whose URL or status contains ``text`` and, if given, in ``state``."""
+        self._filter_text = (text or '').lower()
+        self._filter_state = state
+        self._apply(self._visible_ids())
+
+    # Updates
+
+    def _on_added(self, job_id):
+        self._added.append(job_id)
+        self._schedule()
+
+    def _on_changed(self, job_id):
+        self._dirty.add(job_id)
+        self._last_changed = job_id
+        self._schedule()
+
+    def _on_removed(self, job_id):
+        self._removed.add(job_id)
+        self._schedule()
+
+    def _schedule(self):
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        """Apply the queued additions, changes and removals to the view."""
+        added, self._added = self._added, []
+        dirty, self._dirty = self._dirty, set()
+        removed, self._removed = self._removed, set()
+        jobs = self.job_queue.jobs
+        for job_id in added:
+            job = jobs.get(job_id)
+            if job is not None and job_id not in removed:
+                self._records[job_id] = job
+                self._order.append(job_id)
+                dirty.add(job_id)
+        for job_id in dirty:
+            if job_id in self._records:
+                self._update_share(job_id)
+        if removed:
+            for job_id in removed:
+                self._records.pop(job_id, None)
+                self._drop_share(job_id)
+            self._order = [job_id for job_id in self._order if job_id not in removed]
+
+        volatile = self._sort_column in VOLATILE_COLUMNS or self._filter_state or self._filter_text
+        if dirty and volatile:
+            self._stale = True
+        if added or removed or (self._stale and time.monotonic() - self._refreshed >= self.refresh_interval):
+            self._apply(self._visible_ids(), only_append=not self._stale and not self._is_sorted())
+        elif self._stale:
+            self._timer.start()  # Come back once the refresh interval is over
+        rows = [self._row_of[job_id] for job_id in dirty if job_id in self._row_of]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), 2), self.index(max(rows), len(COLUMNS) - 1))
+        if self._last_changed is not None and (dirty or added):
+            self.updated.emit(self._last_changed)
+
+    def _update_share(self, job_id):
+        job = self._records[job_id]
+        share = None if job.state == 'cancelled' else (100 if job.state in ('done', 'failed') else job.progress)
+        self._drop_share(job_id)
+        if share is not None:
+            self._shares[job_id] = share
+            self._share_sum += share
+
+    def _drop_share(self, job_id):
+        share = self._shares.pop(job_id, None)
+        if share is not None:
+            self._share_sum -= share
+
+    # Sorting and filtering
+
+    def _is_sorted(self):
+        return 0 <= self._sort_column < len(SORT_KEYS)
+
+    def _matches(self, job):
+        if self._filter_state and job.state != self._filter_state:
+            return False
+        text = self._filter_text
+        return not text or text in job.url.lower() or text in job.message.lower()
+
+    def _visible_ids(self):
+        records = self._records
+        if self._filter_text or self._filter_state:
+            ids = [job_id for job_id in self._order if self._matches(records[job_id])]
+        else:
+            ids = list(self._order)
+        if self._is_sorted():
+            key = SORT_KEYS[self._sort_column]
+            # Stable sort over the submission order keeps ties in that order
+            ids.sort(key=lambda job_id: key(records[job_id]), reverse=self._sort_order == Qt.DescendingOrder)
+        return ids
+
+    def _apply(self, new_rows, only_append=False):
+        """Turn the displayed rows into ``new_rows`` with as few view updates as possible."""
+        self._stale = False
+        self._refreshed = time.monotonic()
+        old_rows = self._rows
+        new_set = set(new_rows)
+        removed_rows = [row for row, job_id in enumerate(old_rows) if job_id not in new_set]
+        if only_append and not removed_rows and new_rows[:len(old_rows)] == old_rows:
+            start = len(old_rows)
+            if len(new_rows) > start:
+                self.beginInsertRows(QModelIndex(), start, len(new_rows) - 1)
+                self._rows = new_rows
+                for row in range(start, len(new_rows)):
+                    self._row_of[new_rows[row]] = row
+                self.endInsertRows()
+            return
+
+        removal_runs = _runs(removed_rows)
+        kept = [job_id for job_id in old_rows if job_id in new_set]
+        kept_set = set(kept)
+        added_rows = [row for row, job_id in enumerate(new_rows) if job_id not in kept_set]
+        insertion_runs = _runs(added_rows)
+        if len(removal_runs) > MAX_RUNS or len(insertion_runs) > MAX_RUNS:
+            self.beginResetModel()
+            self._set_rows(new_rows)
+            self.endResetModel()
+            return
+
+        # Remove from the bottom up so the earlier row numbers stay valid
+        for first, last in reversed(removal_runs):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self._set_rows(self._rows[:first] + self._rows[last + 1:])
+            self.endRemoveRows()
+
+        # Reorder what is left, moving the persistent indexes (e.g. the selection) along
+        reordered = [job_id for job_id in new_rows if job_id in kept_set]
+        if reordered != self._rows:
+            self.layoutAboutToBeChanged.emit()
+            persistent = self.persistentIndexList()
+            ids = [self._rows[index.row()] for index in persistent]
+            self._set_rows(reordered)
+            self.changePersistentIndexList(persistent, [self.index(self._row_of[job_id], index.column())
+                                                        for job_id, index in zip(ids, persistent)])
+            self.layoutChanged.emit()
+
+        for first, last in insertion_runs:
+            self.beginInsertRows(QModelIndex(), first, last)
+            self._set_rows(self._rows[:first] + new_rows[first:last + 1] + self._rows[first:])
+            self.endInsertRows()
+
+    def _set_rows(self, rows):
+        self._rows = rows
+        self._row_of = {job_id: row for row, job_id in enumerate(rows)}
+
+
+def _runs(rows):
+    """Group ascending row numbers into (first, last) runs of consecutive rows."""
+    runs = []
+    for row in rows:
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return [tuple(run) for run in runs]
@@ -0,0 +1,283 @@
+"""Conversion of media files that are already on disk.
+
+Dropped files and folders are expanded by ``collect_files`` into one
+``LocalConversion`` per media file. A conversion has the same
+``convert(threads)`` method as a downloaded ``ConversionEngine``, so the
+front ends run it on their ``pipeline.ConversionStage``: a CPU-sized pool
+whose encodes share the cores. Like a download, it probes the codecs and
+follows ``remux_planner`` plans, writing every requested format in one
+ffmpeg run.
+
+Re-running over a large library only converts new or changed files.
+With an ``output_index`` a file's outputs are recorded under a key made
+of its path, size and mtime, and a lookup only hits while the output is
+still intact (see ``output_index``); replacing or editing the source
+changes the key. Without an index, a file is up to date when all its
+outputs exist and are newer than the source.
+
+With a ``journal`` the conversion records its phase there like a
+download does; a file job that was interrupted is simply converted again.
+
+A job with a ``split`` is cut into a folder of parts instead (see
+``splitter``); ``'chapters'`` uses the chapters stored in the file. Split
+jobs are always converted again.
+"""
+import os
+import shutil
+import subprocess
+import time
+from collections import Counter
+
+import remux_planner
+import toolchain as toolchain_module
+from converter_engine import (OUTPUT_EXTENSIONS, ConversionCancelled, ConversionError, check_toolchain,
+                              parse_targets, target_quality)
+from splitter import SPLIT_CHAPTERS, SegmentSplitter, SplitError, probe_chapters, split_segments
+
+MEDIA_EXTENSIONS = frozenset([
+    'mp3', 'm4a', 'aac', 'wav', 'flac', 'ogg', 'oga', 'opus', 'wma', 'aiff', 'aif',
+    'mp4', 'm4v', 'mkv', 'webm', 'mov', 'avi', 'flv', 'wmv', 'mpg', 'mpeg', 'ts', '3gp',
+])
+
+
+def is_media_file(path):
+    return os.path.splitext(path)[1][1:].lower() in MEDIA_EXTENSIONS
+
+
+def collect_files(paths, output_path):
+    """Yield ``(source, output_dir, name)`` for every media file in ``paths``.
+
+    Folders are walked recursively (skipping hidden folders such as the
+    jobs' workspaces) and their structure is repeated below ``output_path``.
+    ``name`` is the file name of the outputs without extension: the
+    source's, or its full name if another file in the folder shares the stem.
+    """
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isfile(path):
+            if is_media_file(path):
+                yield path, output_path, file_output_name(path)
+            continue
+        base = os.path.join(output_path, os.path.basename(path.rstrip(os.sep)))
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+            target_dir = os.path.normpath(os.path.join(base, os.path.relpath(root, path)))
+            media = sorted(name for name in files if is_media_file(name))
+            stems = Counter(os.path.splitext(name)[0] for name in media)
+            for name in media:
+                stem = os.path.splitext(name)[0]
+                yield os.path.join(root, name), target_dir, stem if stems[stem] == 1 else name
+
+
+def file_output_name(path):
+    """The ``name`` that ``collect_files`` gives the outputs of the file ``path``."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    siblings = [name for name in os.listdir(os.path.dirname(path))
+                if is_media_file(name) and os.path.splitext(name)[0] == stem]
+    return stem if len(siblings) <= 1 else os.path.basename(path)
+
+
+class LocalConversion:
+    """Converts one file on disk (``job.url`` is its path) into the job's formats."""
+
+    def __init__(self, job, name=None, toolchain=None, output_index=None, on_status=None, journal=None,
+                 journal_id=None):
+        self.job = job
+        self.name = name or os.path.splitext(os.path.basename(job.url))[0]
+        self.toolchain = toolchain
+        self.output_index = output_index
+        self.journal = journal
+        self.journal_id = journal_id
+        self.on_status = on_status or (lambda message: None)
+        self.workspace_path = None  # Nothing to resume, unlike a download
+        self.conversions = []
+        self._process = None
+        self._splitter = None
+        self._cancel_requested = False
+        self._suspended = False
+
+    def cancel(self):
+        self._cancel_requested = True
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.kill()
+        if self._splitter is not None:
+            self._splitter.cancel()
+
+    def suspend(self):
+        """Stop like ``cancel`` but leave the job unfinished in the journal."""
+        self._suspended = True
+        self.cancel()
+
+    def output_file(self, target):
+        """Path of the ``target`` output; never the source itself, even in the source's own folder."""
+        ext = OUTPUT_EXTENSIONS[target]
+        path = os.path.join(self.job.output_path, f'{self.name}.{ext}')
+        if os.path.realpath(path) == os.path.realpath(self.job.url):
+            # Named like a file whose stem another file shares (see collect_files)
+            path = os.path.join(self.job.output_path, f'{os.path.basename(self.job.url)}.{ext}')
+        return path
+
+    def index_keys(self, target):
+        """``output_index`` keys of the ``target`` output; they change with the file."""
+        stat = os.stat(self.job.url)
+        quality = target_quality(self.job, target) or ''
+        return [f'file {os.path.realpath(self.job.url)} {stat.st_size} {stat.st_mtime_ns} {target} {quality} '
+                f'{os.path.realpath(self.output_file(target))}']
+
+    def up_to_date(self):
+        """Whether every output already exists for the file as it is now."""
+        job = self.job
+        if job.split:
+            return False
+        try:
+            source_mtime = os.stat(job.url).st_mtime_ns
+            for target in parse_targets(job.format_option):
+                if self.output_index is not None:
+                    if self.output_index.lookup(self.index_keys(target)) is None:
+                        return False
+                elif os.stat(self.output_file(target)).st_mtime_ns < source_mtime:
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def skip(self):
+        """The result of a file that ``up_to_date`` found converted already."""
+        result = self._result([self.output_file(target) for target in parse_targets(self.job.format_option)],
+                              {}, skipped=True)
+        self._journal(phase='done', output_file=result['output_file'])
+        return result
+
+    def convert(self, threads=None):
+        self._journal(phase='converting')
+        try:
+            result = self._convert(threads)
+        except ConversionCancelled:
+            if not self._suspended:
+                self._journal(phase='cancelled')
+            raise
+        except ConversionError as e:
+            self._journal(phase='failed', error=str(e))
+            raise
+        except OSError as e:
+            error = ConversionError(f'Could not convert {os.path.basename(self.job.url)}: {e}')
+            self._journal(phase='failed', error=str(error))
+            raise error from e
+        self._journal(phase='done', output_file=result['output_file'])
+        return result
+
+    def _journal(self, **fields):
+        if self.journal is not None and self.journal_id is not None:
+            self.journal.update(self.journal_id, **fields)
+
+    def _convert(self, threads):
+        job = self.job
+        started = time.monotonic()
+        if self._cancel_requested:
+            raise ConversionCancelled('Cancelled')
+        toolchain = self.toolchain or toolchain_module.get_toolchain()
+        check_toolchain(toolchain, job.format_option)
+        source_ext = os.path.splitext(job.url)[1][1:].lower()
+        video_codec, audio_codec = remux_planner.probe_streams(job.url, toolchain)
+        if not video_codec and not audio_codec:
+            raise ConversionError(f'{os.path.basename(job.url)} has no audio or video stream.')
+        os.makedirs(job.output_path, exist_ok=True)
+        if job.split:
+            result = self._split(toolchain, source_ext, video_codec, audio_codec, threads, started)
+            if result is not None:
+                return result
+
+        targets = parse_targets(job.format_option)
+        outputs = []
+        for target in targets:
+            plan = remux_planner.plan_conversion(target, source_ext, video_codec, audio_codec,
+                                                 target_quality(job, target), toolchain)
+            path = self.output_file(target)
+            temp_path = f'{os.path.splitext(path)[0]}.temp.{plan.ext}'
+            if not plan.needs_ffmpeg:
+                # Already in the target format: a copy will do
+                shutil.copy2(job.url, temp_path)
+                os.replace(temp_path, path)
+                os.utime(path, None)
+                self.conversions.append(dict(plan.summary(), size=os.path.getsize(path), seconds=0.0))
+                continue
+            args = plan.args + ['-threads', str(threads)] if threads else plan.args
+            if plan.ext in ('mp4', 'm4a'):
+                args = args + ['-movflags', '+faststart']
+            outputs.append((plan, path, temp_path, args))
+
+        if outputs:
+            names = ', '.join(plan.target for plan, _, _, _ in outputs)
+            self.on_status(f'Converting {os.path.basename(job.url)} to {names}')
+            cmd = [toolchain.ffmpeg, '-y', '-hide_banner', '-nostdin', '-loglevel', 'error', '-i', job.url]
+            for _, _, temp_path, args in outputs:
+                cmd += args + [temp_path]
+            encode_started = time.monotonic()
+            try:
+                self._process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                                 stderr=subprocess.PIPE)
+                if self._cancel_requested:
+                    self._process.kill()
+                _, stderr = self._process.communicate()
+                if self._cancel_requested:
+                    raise ConversionCancelled('Cancelled')
+                if self._process.returncode != 0:
+                    lines = stderr.decode('utf-8', 'replace').strip().splitlines()
+                    raise ConversionError(f'FFmpeg could not convert {os.path.basename(job.url)}: '
+                                          f"{lines[-1] if lines else f'exit code {self._process.returncode}'}")
+            except BaseException:
+                for _, _, temp_path, _ in outputs:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                raise
+            finally:
+                self._process = None
+            seconds = round(time.monotonic() - encode_started, 3)
+            for plan, path, temp_path, _ in outputs:
+                os.replace(temp_path, path)
+                self.conversions.append(dict(plan.summary(), size=os.path.getsize(path), seconds=seconds))
+
+        files = [self.output_file(target) for target in targets]
+        if self.output_index is not None:
+            title = os.path.splitext(os.path.basename(job.url))[0]
+            for target, path in zip(targets, files):
+                self.output_index.put(self.index_keys(target), path, title)
+        self.on_status('Conversion completed successfully!')
+        return self._result(files, {'total': round(time.monotonic() - started, 3)})
+
+    def _split(self, toolchain, source_ext, video_codec, audio_codec, threads, started):
+        job = self.job
+        chapters = probe_chapters(job.url, toolchain) if job.split == SPLIT_CHAPTERS else None
+        segments = split_segments(job.split, chapters=chapters)
+        if not segments:
+            self.on_status('No chapters or cues to split at, converting the whole file')
+            return None
+        targets = {target: target_quality(job, target) for target in parse_targets(job.format_option)}
+        self._splitter = SegmentSplitter(toolchain, targets, threads, self.on_status)
+        if self._cancel_requested:
+            raise ConversionCancelled('Cancelled')
+        try:
+            files, sizes = self._splitter.split(job.url, segments, os.path.join(job.output_path, self.name),
+                                                source_ext, video_codec, audio_codec)
+        except SplitError as e:
+            if self._cancel_requested:
+                raise ConversionCancelled('Cancelled') from e
+            raise ConversionError(f'FFmpeg could not split {os.path.basename(job.url)}: {e}') from e
+        seconds = round(time.monotonic() - started, 3)
+        for plan, size in sizes:
+            self.conversions.append(dict(plan.summary(), size=size, seconds=seconds, parts=len(segments)))
+        self.on_status('Conversion completed successfully!')
+        return self._result(files, {'total': seconds})
+
+    def _result(self, files, timings, skipped=False):
+        return {
+            'url': self.job.url,
+            'title': os.path.splitext(os.path.basename(self.job.url))[0],
+            'format': self.job.format_option,
+            'output_file': files[0],
+            'output_files': files,
+            'timings': timings,
+            'conversion': self.conversions,
+            'skipped': skipped,
+        }
@@ -0,0 +1,112 @@
+"""Cache of extracted yt-dlp metadata keyed by URL.
+
+Holds the *unprocessed* extractor result (``extract_info(..., process=False)``)
+so the same entry can be reused for any output format or quality; format
+selection happens later in ``process_ie_result``. Entries expire after
+``ttl`` seconds because the media URLs inside them are signed and stop
+working after a while. The in-memory part is an LRU bounded by
+``max_entries``; with ``path`` set, entries are also written to a SQLite
+database so they survive restarts and can be shared by the GUI and the CLI.
+"""
+import copy
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MetadataCache:
+    def __init__(self, ttl=1800, max_entries=256, path=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS metadata '
+                             '(url TEXT PRIMARY KEY, stored REAL NOT NULL, info TEXT NOT NULL)')
+            self._db.commit()
+
+    @staticmethod
+    def cacheable(info):
+        # Playlists carry lazy entry generators and are cheap to re-list anyway
+        return isinstance(info, dict) and info.get('_type', 'video') == 'video'
+
+    def get(self, url):
+        """Return a private copy of the cached info for ``url`` or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._entries[url]
+                entry = None
+            if entry is None and self._db is not None:
+                entry = self._load(url, now)
+                if entry is not None:
+                    self._remember(url, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(url)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def put(self, url, info):
+        if not self.cacheable(info):
+            return
+        entry = (time.time(), copy.deepcopy(info))
+        with self._lock:
+            self._remember(url, entry)
+            if self._db is not None:
+                try:
+                    data = json.dumps(info, default=str)
+                except (TypeError, ValueError):
+                    return
+                self._db.execute('INSERT OR REPLACE INTO metadata (url, stored, info) VALUES (?, ?, ?)',
+                                 (url, entry[0], data))
+                self._db.commit()
+
+    def invalidate(self, url):
+        with self._lock:
+            self._entries.pop(url, None)
+            if self._db is not None:
+                self._db.execute('DELETE FROM metadata WHERE url = ?', (url,))
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM metadata')
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, url, entry):
+        self._entries[url] = entry
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, url, now):
+        row = self._db.execute('SELECT stored, info FROM metadata WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        if now - row[0] > self.ttl:
+            self._db.execute('DELETE FROM metadata WHERE url = ?', (url,))
+            self._db.commit()
+            return None
+        return row[0], json.loads(row[1])
@@ -0,0 +1,120 @@
+"""Persistent index of finished outputs, so repeated jobs can be skipped.
+
+Like yt-dlp's download archive (``--download-archive``) entries are keyed
+by extractor and video id, but the key also carries the output format,
+quality, time range and output directory, and every entry points at the
+file that was produced together with its size, mtime and a fast content
+hash. A lookup only counts as a hit while that file is still there and
+unchanged: a missing file, a different size, or a changed mtime whose hash
+no longer matches drops the entry and the job runs normally.
+
+The fast hash reads the first and last 64 KiB plus the size instead of the
+whole file, which is enough to notice a re-encoded or replaced output.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from app_paths import data_dir
+
+HASH_CHUNK = 64 * 1024
+
+
+def default_index_path():
+    return os.path.join(data_dir(), 'outputs.sqlite3')
+
+
+def fast_hash(path):
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(HASH_CHUNK))
+        if size > 2 * HASH_CHUNK:
+            f.seek(-HASH_CHUNK, os.SEEK_END)
+            digest.update(f.read(HASH_CHUNK))
+    return digest.hexdigest()
+
+
+class IndexEntry:
+    __slots__ = ('key', 'output_file', 'title', 'size', 'mtime_ns', 'hash', 'stored')
+
+    def __init__(self, row):
+        for name, value in zip(self.__slots__, row):
+            setattr(self, name, value)
+
+
+class OutputIndex:
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS outputs (key TEXT PRIMARY KEY, output_file TEXT NOT NULL, '
+                         'title TEXT, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash TEXT NOT NULL, '
+                         'stored REAL NOT NULL)')
+        self._db.commit()
+
+    def lookup(self, keys):
+        """Return the IndexEntry of the first key whose output is still intact, or None."""
+        for key in keys:
+            with self._lock:
+                row = self._db.execute('SELECT * FROM outputs WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                continue
+            entry = IndexEntry(row)
+            if self._verify(entry):
+                self.hits += 1
+                return entry
+            self.invalidate(entry.output_file)
+        self.misses += 1
+        return None
+
+    def put(self, keys, output_file, title=None):
+        """Record ``output_file`` as the result for every key in ``keys``."""
+        stat = os.stat(output_file)
+        digest = fast_hash(output_file)
+        now = time.time()
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                 [(key, output_file, title, stat.st_size, stat.st_mtime_ns, digest, now)
+                                  for key in keys])
+            self._db.commit()
+
+    def invalidate(self, output_file):
+        """Drop all entries pointing at ``output_file``."""
+        with self._lock:
+            self._db.execute('DELETE FROM outputs WHERE output_file = ?', (output_file,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _verify(self, entry):
+        try:
+            stat = os.stat(entry.output_file)
+        except OSError:
+            return False
+        if stat.st_size != entry.size:
+            return False
+        if stat.st_mtime_ns == entry.mtime_ns:
+            return True
+        # Touched (e.g. copied back from a backup): fall back to the content hash
+        try:
+            if fast_hash(entry.output_file) != entry.hash:
+                return False
+        except OSError:
+            return False
+        with self._lock:
+            self._db.execute('UPDATE outputs SET mtime_ns = ? WHERE output_file = ?',
+                             (stat.st_mtime_ns, entry.output_file))
+            self._db.commit()
+        return True
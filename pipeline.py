@@ -0,0 +1,122 @@
+"""Conversion stage of the download → convert pipeline.
+
+Downloads are network-bound and conversions CPU-bound, so they get
+separate pools: the front ends run ``ConversionEngine.download`` on their
+I/O workers and hand the engine to a ``ConversionStage``, whose own worker
+threads run ``ConversionEngine.convert``. Each of those workers drives one
+ffmpeg process at a time, so at most ``workers`` encodes run at once.
+
+Between the stages sits a bounded buffer of ``buffer_size`` downloaded
+jobs. ``submit`` blocks while it is full, which holds back the download
+worker (and with it the next download) instead of piling up files that
+wait for an encoder.
+
+ffmpeg starts as many threads as there are cores for every encode, so a
+handful of parallel encodes would oversubscribe the CPU many times over.
+The stage instead splits ``thread_budget`` (the core count by default)
+between the encodes: each one gets ``-threads`` set to its share of the
+budget for the number of encodes running or about to run when it starts.
+"""
+import os
+import queue
+import threading
+import time
+
+
+def default_workers():
+    """Parallel encodes for this machine: half the cores, at least one."""
+    return max(1, (os.cpu_count() or 1) // 2)
+
+
+class ConversionStage:
+    def __init__(self, workers=None, thread_budget=None, buffer_size=None):
+        self.workers = workers or default_workers()
+        self.thread_budget = thread_budget or os.cpu_count() or 1
+        self.buffer_size = buffer_size or self.workers * 2
+        self._queue = queue.Queue(self.buffer_size)
+        self._lock = threading.Lock()
+        self._running = 0
+        self.encodes = 0
+        self.busy_seconds = 0.0
+        self.max_waiting = 0
+        self._threads = [threading.Thread(target=self._work, name=f'convert-{i}', daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, engine, callback):
+        """Queue a downloaded ``engine`` for conversion; blocks while the buffer is full.
+
+        ``callback(result, error)`` is called on the worker thread with the
+        result of ``engine.convert`` or the ``ConversionError`` /
+        ``ConversionCancelled`` it raised; any other exception is passed on
+        wrapped in a ``ConversionError``.
+        """
+        self._queue.put((engine, callback))
+        waiting = self._queue.qsize()
+        with self._lock:
+            self.max_waiting = max(self.max_waiting, waiting)
+
+    @property
+    def waiting(self):
+        return self._queue.qsize()
+
+    @property
+    def running(self):
+        return self._running
+
+    def threads_per_encode(self):
+        """Encoder threads for an encode starting now."""
+        with self._lock:
+            return self._threads_per_encode()
+
+    def _threads_per_encode(self):
+        # Encodes that will share the CPU: the running ones plus the queued
+        # ones that will start as soon as a worker is free
+        concurrent = min(self.workers, self._running + self._queue.qsize()) or 1
+        return max(1, self.thread_budget // concurrent)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'thread_budget': self.thread_budget,
+                'encodes': self.encodes,
+                'busy_seconds': round(self.busy_seconds, 3),
+                'max_waiting': self.max_waiting,
+            }
+
+    def close(self):
+        """Finish the queued conversions and stop the workers."""
+        threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            # Not imported with the module: front ends set up their stage before loading yt-dlp
+            from converter_engine import ConversionCancelled, ConversionError
+            engine, callback = item
+            with self._lock:
+                self._running += 1
+                threads = self._threads_per_encode()
+            started = time.monotonic()
+            result = error = None
+            try:
+                result = engine.convert(threads)
+            except (ConversionError, ConversionCancelled) as e:
+                error = e
+            except Exception as e:
+                # A bug in one job must neither kill the worker nor leave the job unanswered
+                error = ConversionError(f'Conversion failed: {e}')
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self.encodes += 1
+                    self.busy_seconds += time.monotonic() - started
+                callback(result, error)
@@ -0,0 +1,147 @@
+"""Lazy expansion of playlist and channel URLs into one job per video.
+
+``PlaylistExpander.expand`` extracts a URL with ``extract_flat`` and
+without processing, then walks the playlist's entries as the extractor
+produces them, page by page, and yields each video's URL right away. The
+caller decides how fast to pull: a queue that stops pulling while it is
+full also stops yt-dlp from fetching further pages, so the first video can
+start within seconds and memory stays bounded for channels of any size.
+
+URLs whose extractor only handles single videos are yielded without any
+network request. Any other URL that turns out to be a single video yields
+itself, and its extracted metadata goes into the ``metadata_cache`` so the job does not extract it a
+second time. Playlists of playlists (e.g. the tabs of a channel) are
+expanded recursively up to ``MAX_DEPTH`` levels. With a ``ydl_pool`` (see
+``ydl_pool``) the extraction borrows a warm YoutubeDL.
+"""
+import yt_dlp
+
+from yt_dlp.extractor import gen_extractor_classes
+from yt_dlp.utils import PagedList
+
+MAX_DEPTH = 3
+
+
+def iter_entries(entries):
+    """Iterate playlist entries without keeping the ones already consumed."""
+    if isinstance(entries, PagedList):
+        # PagedList caches every page it fetched; walk it uncached instead
+        entries._use_cache = False
+        return entries._getslice(0, None)
+    return iter(entries)
+
+
+def is_single_video(url):
+    """True/False if the extractor for ``url`` can tell from the URL alone, else None."""
+    for ie in gen_extractor_classes():
+        if ie.suitable(url):
+            return ie.is_single_video(url)
+    return None
+
+
+def entry_url(entry):
+    """URL a job can be started from for a playlist entry, or None."""
+    url = entry.get('webpage_url') or entry.get('url')
+    if url:
+        return url
+    formats = entry.get('formats') or []
+    if len(formats) == 1 and formats[0].get('url'):
+        # Media embedded in a page: the file itself is the job's URL
+        return formats[0]['url']
+    return None
+
+
+class PlaylistExpander:
+    def __init__(self, verbose=False, metadata_cache=None, ydl_pool=None):
+        self.metadata_cache = metadata_cache
+        self.ydl_pool = ydl_pool
+        self.ydl_opts = {
+            # Built like the jobs' YoutubeDLs, so a pool can lend the same instances
+            'verbose': verbose,
+            'no_color': True,
+            'quiet': not verbose,
+            'no_warnings': not verbose,
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True,
+            'skip_download': True,
+        }
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def expand(self, url):
+        """Yield the URL of every video behind ``url``."""
+        if is_single_video(url):
+            yield url
+            return
+        ydl = self.ydl_pool.acquire(self.ydl_opts) if self.ydl_pool is not None else yt_dlp.YoutubeDL(self.ydl_opts)
+        try:
+            yield from self._expand_with(ydl, url)
+        finally:
+            if self.ydl_pool is not None:
+                self.ydl_pool.release(ydl)
+            else:
+                ydl.close()
+
+    def _expand_with(self, ydl, url):
+        try:
+            ie_result = ydl.extract_info(url, download=False, process=False)
+        except yt_dlp.utils.YoutubeDLError:
+            # Let the job itself run into the error and report it
+            yield url
+            return
+        if not ie_result:
+            yield url
+            return
+        if ie_result.get('_type', 'video') == 'video':
+            if self.metadata_cache is not None:
+                self.metadata_cache.put(url, ie_result)
+            yield url
+        elif ie_result['_type'] in ('playlist', 'multi_video'):
+            listed = False
+            for video_url in self._walk(ydl, ie_result, 0):
+                if video_url is None:
+                    if listed:
+                        # A job for the whole playlist would repeat the videos yielded already
+                        continue
+                    # Entries that cannot be addressed on their own:
+                    # leave the whole playlist to a single job
+                    yield url
+                    return
+                listed = True
+                yield video_url
+        else:
+            yield url  # A redirect; the job follows it
+
+    def _walk(self, ydl, playlist, depth):
+        parent = playlist.get('extractor_key') or playlist.get('ie_key')
+        entries = playlist.get('entries')
+        # Not ``or []``: truth-testing a PagedList fetches its first page
+        for entry in iter_entries(entries if entries is not None else []):
+            if self._cancelled:
+                return
+            if not entry:
+                continue
+            entry_type = entry.get('_type', 'video')
+            if entry_type in ('playlist', 'multi_video') and depth < MAX_DEPTH:
+                yield from self._walk(ydl, entry, depth + 1)
+            elif entry_type in ('url', 'url_transparent') and entry.get('ie_key') == parent and depth < MAX_DEPTH:
+                # Handled by the playlist's own extractor: a nested playlist
+                try:
+                    nested = ydl.extract_info(entry['url'], ie_key=entry.get('ie_key'),
+                                              download=False, process=False)
+                except yt_dlp.utils.YoutubeDLError:
+                    continue
+                if nested and nested.get('_type') in ('playlist', 'multi_video'):
+                    yield from self._walk(ydl, nested, depth + 1)
+                    continue
+                if nested and nested.get('_type', 'video') == 'video' and self.metadata_cache is not None:
+                    self.metadata_cache.put(entry['url'], nested)
+                yield entry['url']
+            else:
+                yield entry_url(entry)
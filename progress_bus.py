@@ -0,0 +1,159 @@
+"""Coalescing progress aggregator shared by the GUI and headless front ends.
+
+yt-dlp calls its progress hooks for every chunk, which can be hundreds of
+times a second per job. ``ProgressBus.update`` only stores the latest
+values for the job; consumers see at most one snapshot per job per
+publish interval, either by pulling with ``drain()`` (the GUI does this
+from a QTimer) or by subscribing to the background publisher started with
+``start()``.
+"""
+import threading
+import time
+
+_monotonic = time.monotonic
+
+
+class ProgressSnapshot:
+    __slots__ = ('job_id', 'phase', 'downloaded_bytes', 'total_bytes', 'speed', 'eta',
+                 'postprocessor', 'message', 'updated')
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.phase = 'queued'
+        self.downloaded_bytes = 0
+        self.total_bytes = None
+        self.speed = None
+        self.eta = None
+        self.postprocessor = None
+        self.message = None
+        self.updated = 0.0
+
+    @property
+    def percent(self):
+        if self.phase == 'done':
+            return 100.0
+        if self.phase != 'downloading' or not self.total_bytes:
+            return 0.0
+        return min(100.0, self.downloaded_bytes * 100.0 / self.total_bytes)
+
+    def describe(self):
+        """Short human readable status line."""
+        if self.phase == 'downloading':
+            text = f'Downloading: {self.percent:.1f}%' if self.total_bytes else 'Downloading...'
+            if self.speed:
+                text += f' at {self.speed / (1024 * 1024):.1f} MB/s'
+            if self.eta is not None:
+                text += f', ETA {int(self.eta)}s'
+            return text
+        if self.phase == 'converting':
+            return f'Converting: {self.postprocessor or "unknown"}'
+        return self.message or self.phase.capitalize()
+
+    def copy(self):
+        clone = ProgressSnapshot.__new__(ProgressSnapshot)
+        for name in self.__slots__:
+            setattr(clone, name, getattr(self, name))
+        return clone
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['percent'] = round(self.percent, 1)
+        return data
+
+
+class ProgressBus:
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self._snapshots = {}
+        self._dirty = set()
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def update(self, job_id, **fields):
+        """Record the latest progress fields of a job; cheap enough for every chunk."""
+        with self._lock:
+            snapshot = self._snapshots.get(job_id)
+            if snapshot is None:
+                snapshot = self._snapshots[job_id] = ProgressSnapshot(job_id)
+            for name, value in fields.items():
+                setattr(snapshot, name, value)
+            snapshot.updated = time.monotonic()
+            self._dirty.add(job_id)
+
+    def update_download(self, job_id, downloaded_bytes, total_bytes, speed, eta):
+        """Fast path of ``update`` for the per-chunk download callback."""
+        with self._lock:
+            snapshot = self._snapshots.get(job_id)
+            if snapshot is None:
+                snapshot = self._snapshots[job_id] = ProgressSnapshot(job_id)
+            snapshot.phase = 'downloading'
+            snapshot.downloaded_bytes = downloaded_bytes
+            snapshot.total_bytes = total_bytes
+            snapshot.speed = speed
+            snapshot.eta = eta
+            snapshot.postprocessor = None
+            snapshot.updated = _monotonic()
+            self._dirty.add(job_id)
+
+    def snapshot(self, job_id):
+        with self._lock:
+            snapshot = self._snapshots.get(job_id)
+            return snapshot.copy() if snapshot is not None else None
+
+    def remove(self, job_id):
+        with self._lock:
+            self._snapshots.pop(job_id, None)
+            self._dirty.discard(job_id)
+
+    def drain(self):
+        """Return copies of the snapshots changed since the last drain."""
+        with self._lock:
+            changed = [self._snapshots[job_id].copy() for job_id in self._dirty
+                       if job_id in self._snapshots]
+            self._dirty.clear()
+        return changed
+
+    def subscribe(self, callback):
+        """Call ``callback(snapshots)`` from the publisher thread on every tick with changes."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def set_interval(self, interval):
+        self.interval = max(0.01, interval)
+
+    def publish(self):
+        changed = self.drain()
+        if not changed:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(changed)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='progress-bus', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the publisher after delivering any pending changes."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.publish()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.publish()
@@ -0,0 +1,206 @@
+"""Decide how a downloaded file becomes the requested output format.
+
+``plan_conversion`` looks at the codecs of the downloaded streams and the
+target container and only transcodes the streams the container (or the
+requested format) cannot carry as they are; everything else is copied. A
+plan whose streams are all copied is a *remux*, which costs I/O but almost
+no CPU. If the downloaded file already is the target, no ffmpeg run is
+needed at all.
+
+Format selection (``FORMAT_SORT`` below) steers yt-dlp towards sources
+that can be copied, so most jobs end up as remuxes.
+"""
+import json
+import re
+import subprocess
+
+# Canonical ffmpeg codec names for the codec strings yt-dlp reports
+_CODEC_PATTERNS = [
+    (r'^(avc[1-4]|h\.?264)', 'h264'),
+    (r'^(hev1|hvc1|h\.?265|hevc)', 'hevc'),
+    (r'^(av01|av1)', 'av1'),
+    (r'^(vp0?9)', 'vp9'),
+    (r'^(vp0?8)', 'vp8'),
+    (r'^(mp4a\.40\.34|mp4a\.6b|mp3)$', 'mp3'),
+    (r'^(mp4a|aac)', 'aac'),
+    (r'^opus', 'opus'),
+    (r'^vorbis', 'vorbis'),
+    (r'^flac', 'flac'),
+    (r'^(pcm_s16le|wav)$', 'pcm_s16le'),
+]
+
+# Output extension and the codecs the target container can take unchanged
+TARGETS = {
+    'MP4': {'ext': 'mp4', 'video': {'h264', 'hevc', 'av1', 'vp9'}, 'audio': {'aac', 'mp3'}},
+    'MP3': {'ext': 'mp3', 'video': None, 'audio': {'mp3'}},
+    'AAC': {'ext': 'm4a', 'video': None, 'audio': {'aac'}},
+    'WAV': {'ext': 'wav', 'video': None, 'audio': {'pcm_s16le'}},
+}
+
+# yt-dlp format_sort per target: at equal quality prefer copyable codecs
+FORMAT_SORT = {
+    'MP4': ['vcodec:h264', 'acodec:aac'],
+    'MP3': ['acodec:mp3'],
+    'AAC': ['acodec:aac'],
+    'WAV': [],
+}
+
+# Encoders in order of preference, filtered by what the toolchain offers
+VIDEO_ENCODERS = ['libx264', 'h264', 'mpeg4']
+AUDIO_ENCODERS = {
+    'MP4': ['libfdk_aac', 'aac'],
+    'AAC': ['libfdk_aac', 'aac'],
+    'MP3': ['libmp3lame'],
+    'WAV': ['pcm_s16le'],
+}
+
+
+def normalize_codec(codec):
+    """Map a yt-dlp/ffprobe codec string to an ffmpeg codec name.
+
+    Returns None for a missing stream ('none'), and the lower-cased input
+    when the codec is not one the planner knows about.
+    """
+    if not codec or codec == 'none':
+        return None
+    codec = codec.lower()
+    for pattern, name in _CODEC_PATTERNS:
+        if re.match(pattern, codec):
+            return name
+    return codec
+
+
+def _pick_encoder(candidates, toolchain):
+    if toolchain is None:
+        return candidates[-1]
+    for encoder in candidates:
+        if toolchain.has_encoder(encoder):
+            return encoder
+    return candidates[-1]
+
+
+class StreamPlan:
+    def __init__(self, kind, source_codec, action, encoder=None):
+        self.kind = kind
+        self.source_codec = source_codec
+        self.action = action
+        self.encoder = encoder
+
+    def __repr__(self):
+        return f'StreamPlan({self.kind!r}, {self.source_codec!r}, {self.action!r})'
+
+
+class ConversionPlan:
+    def __init__(self, target, source_ext, ext, streams, args):
+        self.target = target
+        self.source_ext = source_ext
+        self.ext = ext
+        self.streams = streams
+        self.args = args
+
+    @property
+    def needs_ffmpeg(self):
+        return self.source_ext != self.ext or any(s.action == 'transcode' for s in self.streams)
+
+    @property
+    def mode(self):
+        if not self.needs_ffmpeg:
+            return 'none'
+        if any(s.action == 'transcode' for s in self.streams):
+            return 'transcode'
+        return 'remux'
+
+    def summary(self):
+        summary = {'target': self.target, 'mode': self.mode}
+        for stream in self.streams:
+            summary[stream.kind] = f'{stream.action} {stream.source_codec}' + (
+                f' -> {stream.encoder}' if stream.action == 'transcode' else '')
+        return summary
+
+    def __repr__(self):
+        return f'ConversionPlan({self.target!r}, mode={self.mode!r}, streams={self.streams!r})'
+
+
+def _audio_quality_args(target, quality):
+    if target == 'MP3':
+        return ['-b:a', f'{quality or 192}k']
+    if target == 'WAV':
+        return []
+    return ['-b:a', '192k', '-ar', '48000']
+
+
+def plan_conversion(target, source_ext, video_codec, audio_codec, quality=None, toolchain=None,
+                    copy_video=True):
+    """Return the ConversionPlan turning a ``source_ext`` file into ``target``.
+
+    ``video_codec``/``audio_codec`` are the codecs of the downloaded file as
+    reported by yt-dlp or ``probe_streams``; None means the stream is absent.
+    Without ``copy_video`` the video is re-encoded even if it could be copied,
+    e.g. when it has to be cut between keyframes.
+    """
+    spec = TARGETS[target]
+    video_codec = normalize_codec(video_codec)
+    audio_codec = normalize_codec(audio_codec)
+    streams = []
+    args = []
+
+    if spec['video'] is not None and video_codec:
+        if video_codec in spec['video'] and copy_video:
+            streams.append(StreamPlan('video', video_codec, 'copy'))
+            args += ['-map', '0:v:0', '-c:v', 'copy']
+        else:
+            encoder = _pick_encoder(VIDEO_ENCODERS, toolchain)
+            streams.append(StreamPlan('video', video_codec, 'transcode', encoder))
+            args += ['-map', '0:v:0', '-c:v', encoder]
+            if encoder == 'libx264':
+                args += ['-preset', 'veryfast', '-crf', '20', '-pix_fmt', 'yuv420p']
+    else:
+        args += ['-vn']
+
+    if audio_codec:
+        if audio_codec in spec['audio']:
+            streams.append(StreamPlan('audio', audio_codec, 'copy'))
+            args += ['-map', '0:a:0', '-c:a', 'copy']
+            if audio_codec == 'aac' and spec['ext'] in ('mp4', 'm4a'):
+                args += ['-bsf:a', 'aac_adtstoasc']
+        else:
+            encoder = _pick_encoder(AUDIO_ENCODERS[target], toolchain)
+            streams.append(StreamPlan('audio', audio_codec, 'transcode', encoder))
+            args += ['-map', '0:a:0', '-c:a', encoder]
+            args += _audio_quality_args(target, quality)
+
+    return ConversionPlan(target, source_ext, spec['ext'], streams, args)
+
+
+def probe_streams(path, toolchain, head=None):
+    """Return ``(video_codec, audio_codec)`` of the first streams in ``path``.
+
+    With ``head`` the given first bytes of a file are probed instead of
+    ``path``. Uses ffprobe when available and falls back to parsing
+    ``ffmpeg -i``.
+    """
+    source = 'pipe:0' if head is not None else path
+    if toolchain.ffprobe:
+        result = subprocess.run(
+            [toolchain.ffprobe, '-v', 'error', '-show_entries', 'stream=codec_type,codec_name',
+             '-of', 'json', source], input=head, capture_output=True)
+        try:
+            streams = json.loads(result.stdout.decode('utf-8', 'replace')).get('streams', [])
+        except ValueError:
+            streams = []
+        codecs = {}
+        for stream in streams:
+            if stream.get('codec_name') in ('mjpeg', 'png'):
+                continue  # Cover art
+            codecs.setdefault(stream.get('codec_type'), stream.get('codec_name'))
+        return codecs.get('video'), codecs.get('audio')
+
+    result = subprocess.run([toolchain.ffmpeg, '-hide_banner', '-i', source], input=head, capture_output=True)
+    codecs = {}
+    stderr = result.stderr.decode('utf-8', 'replace')
+    for kind, codec in re.findall(r'Stream #\d+:\d+[^:]*: (Video|Audio): ([0-9a-z_]+)', stderr):
+        # Cover art is reported as a video stream
+        if kind == 'Video' and codec in ('mjpeg', 'png'):
+            continue
+        codecs.setdefault(kind.lower(), codec)
+    return codecs.get('video'), codecs.get('audio')
@@ -0,0 +1,380 @@
+"""Cut one media file into per-chapter or per-cue files.
+
+A job's ``split`` is either ``'chapters'`` (the chapter list of the
+extracted info dict, or of the file itself for files on disk) or the text
+of a cue list: a CUE sheet, or one ``[hh:]mm:ss Title`` line per part as
+found in video descriptions. ``split_segments`` turns it into ``Segment``s.
+
+``SegmentSplitter`` writes every part of every target format from the one
+downloaded file. Targets whose streams are copied (see ``remux_planner``)
+are cut in a single ffmpeg run over the whole file with the segment
+muxer, one output per target. Copied video can only be cut on keyframes,
+so a target only copies its video if every cut point is on one; otherwise
+its video is re-encoded. Targets that need re-encoding are encoded per part
+instead, in parallel ffmpeg runs that each seek to their own part, so the
+file is still read about once while the encodes use all the threads the
+conversion stage granted.
+"""
+import bisect
+import itertools
+import json
+import os
+import re
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import remux_planner
+
+SPLIT_CHAPTERS = 'chapters'
+
+# CUE sheets count 75 frames per second
+_CUE_FRAMES = 75
+_TIMESTAMP = r'(\d+:)?\d{1,2}:\d{2}(?:\.\d+)?'
+_LEADING_RE = re.compile(rf'^\s*(?:\d+[.)]\s+)?[\[(]?(?P<time>{_TIMESTAMP})[\])]?\s*(?:[-–—:|]\s*)?(?P<title>.*)$')
+_TRAILING_RE = re.compile(rf'^(?P<title>.*?)\s*(?:[-–—:|]\s*)?[\[(]?(?P<time>{_TIMESTAMP})[\])]?\s*$')
+_UNSAFE_RE = re.compile(r'[\x00-\x1f<>:"/\\|?*]')
+# How far a cut point may be from a keyframe for copied video to be cut there
+KEYFRAME_TOLERANCE = 0.05
+# Distinguishes the temporary files of splits running side by side
+_runs = itertools.count(1)
+
+
+class Segment:
+    __slots__ = ('start', 'end', 'title')
+
+    def __init__(self, start, end=None, title=None):
+        self.start = start
+        self.end = end
+        self.title = title
+
+    @property
+    def duration(self):
+        return None if self.end is None else self.end - self.start
+
+    def __repr__(self):
+        return f'Segment({self.start!r}, {self.end!r}, {self.title!r})'
+
+
+def parse_timestamp(text):
+    """Seconds of ``'1:02:03.5'``, ``'02:03'`` or ``'123'``."""
+    seconds = 0.0
+    for part in text.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_cues(text):
+    """Return the ``Segment``s of a CUE sheet or a list of timestamped lines, in order."""
+    if re.search(r'(?im)^\s*INDEX\s+01\s', text):
+        return _parse_cue_sheet(text)
+    segments = []
+    for line in text.splitlines():
+        match = _LEADING_RE.match(line) or _TRAILING_RE.match(line)
+        if match:
+            segments.append(Segment(parse_timestamp(match.group('time')), None,
+                                    match.group('title').strip() or None))
+    return segments
+
+
+def _parse_cue_sheet(text):
+    segments = []
+    title = performer = None
+    for line in text.splitlines():
+        keyword, _, value = line.strip().partition(' ')
+        keyword = keyword.upper()
+        value = value.strip()
+        if keyword == 'TRACK':
+            title = performer = None
+        elif keyword in ('TITLE', 'PERFORMER'):
+            value = value.strip('"')
+            if keyword == 'TITLE':
+                title = value
+            else:
+                performer = value
+        elif keyword == 'INDEX' and value.startswith('01 '):
+            minutes, seconds, frames = (int(part) for part in value[3:].strip().split(':'))
+            name = f'{performer} - {title}' if performer and title else title
+            segments.append(Segment(minutes * 60 + seconds + frames / _CUE_FRAMES, None, name))
+    return segments
+
+
+def chapter_segments(chapters):
+    """``Segment``s of yt-dlp's ``chapters`` list."""
+    return [Segment(float(chapter.get('start_time') or 0),
+                    None if chapter.get('end_time') is None else float(chapter['end_time']),
+                    chapter.get('title'))
+            for chapter in chapters or []]
+
+
+def normalize_segments(segments, duration=None):
+    """Sort ``segments``, end each one where the next starts and drop empty ones."""
+    segments = sorted(segments, key=lambda segment: segment.start)
+    result = []
+    for index, segment in enumerate(segments):
+        following = segments[index + 1].start if index + 1 < len(segments) else duration
+        end = segment.end
+        if end is None or (following is not None and end > following):
+            end = following
+        if duration is not None and segment.start >= duration:
+            break
+        if end is not None and end <= segment.start:
+            continue
+        result.append(Segment(segment.start, end, segment.title))
+    return result
+
+
+def split_segments(split, info=None, chapters=None):
+    """The parts for a job's ``split``, given the extracted ``info`` or the file's ``chapters``."""
+    info = info or {}
+    if split == SPLIT_CHAPTERS:
+        segments = chapter_segments(info.get('chapters') if chapters is None else chapters)
+    else:
+        segments = parse_cues(split)
+    return normalize_segments(segments, info.get('duration'))
+
+
+def probe_chapters(path, toolchain):
+    """Return the chapters stored in the file ``path`` like yt-dlp lists them."""
+    if toolchain.ffprobe:
+        result = subprocess.run([toolchain.ffprobe, '-v', 'error', '-show_chapters', '-of', 'json', path],
+                                capture_output=True)
+        try:
+            chapters = json.loads(result.stdout.decode('utf-8', 'replace')).get('chapters', [])
+        except ValueError:
+            return []
+        return [{'start_time': float(chapter['start_time']), 'end_time': float(chapter['end_time']),
+                 'title': (chapter.get('tags') or {}).get('title')} for chapter in chapters]
+
+    result = subprocess.run([toolchain.ffmpeg, '-hide_banner', '-i', path], capture_output=True)
+    chapters = []
+    for line in result.stderr.decode('utf-8', 'replace').splitlines():
+        match = re.match(r'\s*Chapter #\d+:\d+: start (-?[\d.]+), end ([\d.]+)', line)
+        if match:
+            chapters.append({'start_time': float(match.group(1)), 'end_time': float(match.group(2)),
+                             'title': None})
+            continue
+        match = re.match(r'\s*title\s*: (.*)$', line)
+        if match and chapters and chapters[-1]['title'] is None:
+            chapters[-1]['title'] = match.group(1).strip()
+    return chapters
+
+
+def keyframe_times(path, toolchain):
+    """Return the end of the first video stream of ``path`` and the sorted times of its keyframes.
+
+    Reads the packets without decoding them; (None, []) if there is no video.
+    """
+    # framecrc lists one packet per line and flags the ones that are not keyframes with F=0x...
+    result = subprocess.run([toolchain.ffmpeg, '-hide_banner', '-nostdin', '-loglevel', 'error', '-i', path,
+                             '-map', '0:v:0?', '-c', 'copy', '-f', 'framecrc', '-'], capture_output=True)
+    time_base = None
+    packets = []
+    lines = result.stdout.decode('utf-8', 'replace').splitlines()
+    if '#media_type 0: video' not in lines:
+        return None, []
+    for line in lines:
+        if line.startswith('#tb 0:'):
+            numerator, denominator = line.split(':', 1)[1].strip().split('/')
+            time_base = int(numerator) / int(denominator)
+        elif not line.startswith('#') and time_base is not None:
+            fields = [field.strip() for field in line.split(',')]
+            if len(fields) < 6:
+                continue
+            flags = next((field[2:] for field in fields[6:] if field.startswith('F=')), None)
+            key = flags is None or int(flags, 16) & 1
+            packets.append((int(fields[2]), int(fields[3]), key))
+    if not packets:
+        return None, []
+    first = min(pts for pts, _, _ in packets)
+    end = max(pts + duration for pts, duration, _ in packets)
+    return (end - first) * time_base, sorted((pts - first) * time_base for pts, _, key in packets if key)
+
+
+def on_keyframes(cuts, keyframes, end):
+    """Whether every time in ``cuts`` before ``end`` is within ``KEYFRAME_TOLERANCE`` of a keyframe."""
+    for cut in cuts:
+        if end is not None and cut >= end - KEYFRAME_TOLERANCE:
+            continue
+        index = bisect.bisect_left(keyframes, cut)
+        near = keyframes[max(0, index - 1):index + 1]
+        if not any(abs(keyframe - cut) <= KEYFRAME_TOLERANCE for keyframe in near):
+            return False
+    return True
+
+
+def segment_names(segments):
+    """File names (without extension) of the parts: ``'01 - Title'``."""
+    width = max(2, len(str(len(segments))))
+    names = []
+    for number, segment in enumerate(segments, 1):
+        title = _UNSAFE_RE.sub('_', segment.title or '').strip(' .')
+        names.append(f'{number:0{width}d} - {title}' if title else f'{number:0{width}d}')
+    return names
+
+
+class SplitError(Exception):
+    pass
+
+
+class SegmentSplitter:
+    """Writes the parts of one file for every target of ``targets`` (target -> quality).
+
+    ``threads`` is the encoder thread budget of the conversion; re-encoded
+    parts run side by side within it. ``cancel`` may be called from any
+    thread and kills the running ffmpeg processes.
+    """
+
+    def __init__(self, toolchain, targets, threads=None, on_status=None):
+        self.toolchain = toolchain
+        self.targets = targets
+        self.threads = threads or os.cpu_count() or 1
+        self.on_status = on_status or (lambda message: None)
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._error = None
+        self.cancelled = False
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+        self._kill()
+
+    def _kill(self):
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+
+    def split(self, path, segments, output_dir, source_ext, video_codec, audio_codec):
+        """Cut ``path`` into ``output_dir``; returns ``(files, [(plan, bytes)])``.
+
+        ``files`` lists the written parts of each target, target by target.
+        Raises ``SplitError`` if ffmpeg fails, with its last error line, if
+        a part was not written, or if the split was cancelled.
+        """
+        plans = self._plans(path, segments, source_ext, video_codec, audio_codec)
+        names = segment_names(segments)
+        os.makedirs(output_dir, exist_ok=True)
+        run = f'{os.getpid()}-{next(_runs)}'
+        copied = [plan for plan in plans if plan.mode != 'transcode']
+        encoded = [plan for plan in plans if plan.mode == 'transcode']
+        # Final path and temporary path of every part of every target
+        outputs = {plan.target: [(os.path.join(output_dir, f'{name}.{plan.ext}'),
+                                  os.path.join(output_dir, f'.{name}.{run}.temp.{plan.ext}')) for name in names]
+                   for plan in plans}
+        self.on_status(f'Splitting into {len(segments)} parts'
+                       + (f", copying to {', '.join(plan.target for plan in copied)}" if copied else '')
+                       + (f", encoding to {', '.join(plan.target for plan in encoded)}" if encoded else ''))
+
+        commands = []
+        # Pieces start at 0 and at every segment boundary; gaps become pieces of their own
+        boundaries = sorted({0.0} | {segment.start for segment in segments}
+                            | {segment.end for segment in segments if segment.end is not None})
+        pieces = {plan.target: os.path.join(output_dir, f'.piece-{run}-{plan.target}-') for plan in copied}
+        if copied:
+            cmd = self._base_cmd() + ['-i', path]
+            for plan in copied:
+                cmd += plan.args + ['-f', 'segment', '-reset_timestamps', '1',
+                                    '-segment_time_delta', str(KEYFRAME_TOLERANCE),
+                                    '-segment_times', ','.join(f'{time:.3f}' for time in boundaries[1:])]
+                if plan.ext in ('mp4', 'm4a'):
+                    cmd += ['-segment_format_options', 'movflags=+faststart']
+                cmd.append(pieces[plan.target].replace('%', '%%') + f'%05d.{plan.ext}')
+            commands.append(cmd)
+        if encoded:
+            workers = min(len(segments), self.threads)
+            per_run = str(max(1, self.threads // workers))
+            for index, segment in enumerate(segments):
+                cmd = self._base_cmd() + ['-ss', f'{segment.start:.3f}', '-i', path]
+                for plan in encoded:
+                    if segment.duration is not None:
+                        cmd += ['-t', f'{segment.duration:.3f}']
+                    cmd += plan.args + ['-threads', per_run]
+                    if plan.ext in ('mp4', 'm4a'):
+                        cmd += ['-movflags', '+faststart']
+                    cmd.append(outputs[plan.target][index][1])
+                commands.append(cmd)
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(len(commands), self.threads + 1)) as pool:
+                for future in [pool.submit(self._run, cmd) for cmd in commands]:
+                    future.result()
+            if self.cancelled:
+                raise SplitError('Cancelled')
+            if self._error is not None:
+                raise SplitError(self._error)
+            for plan in copied:
+                self._collect_pieces(pieces[plan.target], plan, segments, boundaries, outputs[plan.target])
+            for plan in plans:
+                for (final_path, temp_path), name in zip(outputs[plan.target], names):
+                    if not os.path.exists(temp_path):
+                        raise SplitError(f'{plan.target}: part "{name}" was not written')
+            files = []
+            for plan in plans:
+                for final_path, temp_path in outputs[plan.target]:
+                    os.replace(temp_path, final_path)
+                    files.append(final_path)
+        finally:
+            # Only this run's files: another job may be splitting into the same folder
+            leftovers = [temp_path for plan in plans for _, temp_path in outputs[plan.target]]
+            for plan in copied:
+                leftovers += [f'{pieces[plan.target]}{index:05d}.{plan.ext}' for index in range(len(boundaries) + 1)]
+            for leftover in leftovers:
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        sizes = [(plan, sum(os.path.getsize(final_path) for final_path, _ in outputs[plan.target]))
+                 for plan in plans]
+        return files, sizes
+
+    def _plans(self, path, segments, source_ext, video_codec, audio_codec):
+        plans = [remux_planner.plan_conversion(target, source_ext, video_codec, audio_codec, quality,
+                                               self.toolchain)
+                 for target, quality in self.targets.items()]
+        copies_video = [plan for plan in plans if plan.mode != 'transcode'
+                        and any(stream.kind == 'video' for stream in plan.streams)]
+        if not copies_video:
+            return plans
+        cuts = {segment.start for segment in segments if segment.start > 0}
+        cuts |= {segment.end for segment in segments if segment.end is not None}
+        end, keyframes = keyframe_times(path, self.toolchain)
+        if on_keyframes(sorted(cuts), keyframes, end):
+            return plans
+        self.on_status(f"Cut points are not on keyframes, re-encoding the video of "
+                       f"{', '.join(plan.target for plan in copies_video)}")
+        return [remux_planner.plan_conversion(plan.target, source_ext, video_codec, audio_codec,
+                                              self.targets[plan.target], self.toolchain, copy_video=False)
+                if plan in copies_video else plan
+                for plan in plans]
+
+    def _base_cmd(self):
+        return [self.toolchain.ffmpeg, '-y', '-hide_banner', '-nostdin', '-loglevel', 'error']
+
+    def _run(self, cmd):
+        with self._lock:
+            if self.cancelled or self._error is not None:
+                return
+            process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.PIPE)
+            self._processes.add(process)
+        try:
+            _, stderr = process.communicate()
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+        if process.returncode != 0:
+            lines = stderr.decode('utf-8', 'replace').strip().splitlines()
+            with self._lock:
+                if self.cancelled or self._error is not None:
+                    return  # Killed
+                self._error = lines[-1] if lines else f'exit code {process.returncode}'
+            # The other parts are of no use now
+            self._kill()
+
+    def _collect_pieces(self, prefix, plan, segments, boundaries, outputs):
+        # Piece n covers boundaries[n]..boundaries[n + 1]; unused pieces (gaps) are dropped
+        for segment, (_, temp_path) in zip(segments, outputs):
+            piece = f'{prefix}{boundaries.index(segment.start):05d}.{plan.ext}'
+            if os.path.exists(piece):
+                os.replace(piece, temp_path)
@@ -0,0 +1,143 @@
+"""Transcoding while downloading: media bytes go straight into ffmpeg.
+
+For audio targets and a source that is a single progressive HTTP file,
+``ConversionEngine`` can skip the intermediate file: it reads the response
+on the job's thread and hands the chunks to a ``StreamingTranscoder``,
+whose feeder thread writes them to ffmpeg's stdin. The two are decoupled
+by a bounded buffer of ``buffer_chunks`` chunks, so a short stall on
+either side does not stop the other, while a slow encode eventually holds
+back the download instead of filling memory.
+
+Not every source can be read front to back. ``moov_first`` tells from the
+first bytes of an MP4/M4A file whether its index precedes the media data;
+if it does not, or ffmpeg fails on the stream, the engine falls back to
+the regular download-then-convert path.
+"""
+import collections
+import queue
+import struct
+import subprocess
+import threading
+
+# Bytes read from the response per chunk, and chunks the buffer may hold
+STREAM_CHUNK = 64 * 1024
+BUFFER_CHUNKS = 64
+
+# How far into an MP4 file to look for its index
+HEAD_LIMIT = 1024 * 1024
+
+MP4_EXTS = ('mp4', 'm4a', 'm4v', 'mov', '3gp')
+
+
+class StreamError(Exception):
+    """ffmpeg could not transcode the stream."""
+
+
+def stream_source(info):
+    """True if the selected format of ``info`` is one progressive HTTP(S) file with audio."""
+    if info.get('_type', 'video') != 'video' or info.get('requested_formats'):
+        return False
+    return (info.get('protocol') in ('http', 'https') and bool(info.get('url'))
+            and info.get('acodec') != 'none')
+
+
+def moov_first(head):
+    """Whether an MP4 file starting with ``head`` has its moov box before mdat.
+
+    None if ``head`` is too short to tell.
+    """
+    pos = 0
+    while pos + 8 <= len(head):
+        size, box = struct.unpack('>I4s', head[pos:pos + 8])
+        if box == b'moov':
+            return True
+        if box == b'mdat':
+            return False
+        if size == 1:
+            if pos + 16 > len(head):
+                return None
+            size = struct.unpack('>Q', head[pos + 8:pos + 16])[0]
+        elif size == 0:
+            return False  # The box runs to the end of the file
+        if size < 8:
+            return False
+        pos += size
+    return None
+
+
+class StreamingTranscoder:
+    """One ffmpeg process reading from stdin and writing ``outputs`` (``(path, args)`` pairs)."""
+
+    def __init__(self, ffmpeg, outputs, buffer_chunks=BUFFER_CHUNKS):
+        cmd = [ffmpeg, '-y', '-hide_banner', '-nostats', '-loglevel', 'error', '-i', 'pipe:0']
+        for path, args in outputs:
+            cmd += list(args) + ['-movflags', '+faststart', path]
+        self.cmd = cmd
+        self.bytes_written = 0
+        self._buffer = queue.Queue(buffer_chunks)
+        self._stderr = collections.deque(maxlen=20)
+        self._process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.PIPE)
+        self._broken = False
+        self._threads = [threading.Thread(target=self._feed, daemon=True),
+                         threading.Thread(target=self._drain_stderr, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def write(self, chunk):
+        """Queue ``chunk`` for ffmpeg; blocks while the buffer is full."""
+        while True:
+            if self._broken or self._process.poll() is not None:
+                raise StreamError(self._error())
+            try:
+                self._buffer.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self):
+        """Close ffmpeg's input and wait for it; raises StreamError if it failed."""
+        self.write(None)
+        for thread in self._threads:
+            thread.join()
+        if self._process.wait() != 0 or self._broken:
+            raise StreamError(self._error())
+
+    def abort(self):
+        if self._process.poll() is None:
+            self._process.kill()
+        self._broken = True
+        # Unblock the feeder if it waits for data
+        try:
+            self._buffer.put_nowait(None)
+        except queue.Full:
+            pass
+        self._process.wait()
+        for thread in self._threads:
+            thread.join()
+
+    def _feed(self):
+        stdin = self._process.stdin
+        try:
+            while True:
+                chunk = self._buffer.get()
+                if chunk is None or self._broken:
+                    break
+                stdin.write(chunk)
+                self.bytes_written += len(chunk)
+        except OSError:
+            # ffmpeg exited early (e.g. it could not read the input)
+            self._broken = True
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
+
+    def _drain_stderr(self):
+        for line in self._process.stderr:
+            self._stderr.append(line.decode('utf-8', 'replace').rstrip())
+
+    def _error(self):
+        lines = [line for line in self._stderr if line]
+        return lines[-1] if lines else f'ffmpeg exited with code {self._process.poll()}'
@@ -0,0 +1,255 @@
+"""Structured instrumentation: per-job phase traces and aggregate metrics.
+
+``ConversionEngine`` records a ``JobTrace`` of every job: one span per
+phase (toolchain probe, extraction, download, each postprocessor,
+conversion, publishing, cleanup), each with the thread it ran on. A trace
+exports as Chrome trace-event JSON, which chrome://tracing and Perfetto
+open directly.
+
+``Telemetry`` hands out the traces and, once a job is over, folds its
+spans into process-wide ``Metrics``: counters and latency histograms
+that a ``MetricsServer`` exposes in the Prometheus text format on a
+local port. Recording a span is a tuple append and a job produces a few
+dozen of them, so the instrumentation stays on all the time.
+"""
+import bisect
+import contextlib
+import http.server
+import json
+import os
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class JobTrace:
+    """Timed spans of one job, on whichever threads ran it."""
+
+    def __init__(self, job_id=None, label=None):
+        self.job_id = job_id
+        self.label = label
+        self.origin = time.monotonic()
+        # (name, category, start, end, thread id, thread name, args)
+        self.spans = []
+        self._open = {}
+
+    @contextlib.contextmanager
+    def span(self, name, category='phase', **args):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.monotonic(), category, **args)
+
+    def add(self, name, start, end, category='phase', **args):
+        """Record a span from ``time.monotonic`` timestamps."""
+        thread = threading.current_thread()
+        self.spans.append((name, category, start, end, thread.ident, thread.name, args))
+
+    def begin(self, name, category='phase', **args):
+        """Open a span that ``end`` closes, for phases reported by callbacks."""
+        self._open[category, name] = (time.monotonic(), args)
+
+    def end(self, name, category='phase'):
+        opened = self._open.pop((category, name), None)
+        if opened is not None:
+            start, args = opened
+            self.add(name, start, time.monotonic(), category, **args)
+
+    def chrome_trace(self):
+        """The spans as a Chrome trace-event document."""
+        pid = os.getpid()
+        events = [{'ph': 'M', 'name': 'process_name', 'pid': pid, 'tid': 0,
+                   'args': {'name': self.label or f'job {self.job_id}'}}]
+        threads = {}
+        for name, category, start, end, ident, thread_name, args in self.spans:
+            if ident not in threads:
+                threads[ident] = len(threads) + 1
+                events.append({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': threads[ident],
+                               'args': {'name': thread_name}})
+            events.append({
+                'ph': 'X', 'name': name, 'cat': category, 'pid': pid, 'tid': threads[ident],
+                'ts': round((start - self.origin) * 1e6), 'dur': round((end - start) * 1e6),
+                'args': args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+class Counter:
+    def __init__(self, name, help_text, registry_lock):
+        self.name = name
+        self.help = help_text
+        self.type = 'counter'
+        self._lock = registry_lock
+        self._values = {}
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield self.name, key, value
+
+
+class Histogram:
+    def __init__(self, name, help_text, registry_lock, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.type = 'histogram'
+        self.buckets = tuple(buckets)
+        self._lock = registry_lock
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', key + (('le', str(bound)),), cumulative
+            yield f'{self.name}_sum', key, total
+            yield f'{self.name}_count', key, cumulative
+
+
+class Metrics:
+    """A registry of counters and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text, self._lock)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, self._lock, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for metric in self._metrics:
+                lines.append(f'# HELP {metric.name} {metric.help}')
+                lines.append(f'# TYPE {metric.name} {metric.type}')
+                for name, labels, value in metric.samples():
+                    if labels:
+                        label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+                        name = f'{name}{{{label_text}}}'
+                    lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Telemetry:
+    """Traces for new jobs and the metrics of the finished ones.
+
+    With a ``trace_dir`` every job's trace is written there as
+    ``job-<id>.trace.json`` when the job is over.
+    """
+
+    def __init__(self, metrics=None, trace_dir=None):
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.trace_dir = trace_dir
+        if trace_dir:
+            os.makedirs(trace_dir, exist_ok=True)
+        m = self.metrics
+        self.jobs = m.counter('funlight_jobs_total', 'Finished jobs by outcome.')
+        self.failures = m.counter('funlight_job_failures_total', 'Failed jobs by error category.')
+        self.downloaded_bytes = m.counter('funlight_downloaded_bytes_total', 'Bytes downloaded.')
+        self.output_bytes = m.counter('funlight_output_bytes_total', 'Bytes of published output files.')
+        self.job_seconds = m.histogram('funlight_job_seconds', 'Duration of finished jobs.')
+        self.phase_seconds = m.histogram('funlight_phase_seconds', 'Duration of job phases.')
+        self.postprocessor_seconds = m.histogram('funlight_postprocessor_seconds',
+                                                 'Duration of yt-dlp postprocessor runs.')
+
+    def new_trace(self, job_id=None, label=None):
+        return JobTrace(job_id, label)
+
+    def job_finished(self, trace, outcome, category=None, downloaded_bytes=0, output_bytes=0):
+        """Record a job that ended as ``outcome`` (done, skipped, failed, cancelled, interrupted)."""
+        self.jobs.inc(outcome=outcome)
+        if category is not None:
+            self.failures.inc(category=category)
+        if downloaded_bytes:
+            self.downloaded_bytes.inc(downloaded_bytes)
+        if output_bytes:
+            self.output_bytes.inc(output_bytes)
+        for name, category, start, end, _, _, _ in trace.spans:
+            if category == 'postprocessor':
+                self.postprocessor_seconds.observe(end - start, postprocessor=name)
+            else:
+                self.phase_seconds.observe(end - start, phase=name)
+        self.job_seconds.observe(time.monotonic() - trace.origin, outcome=outcome)
+        if self.trace_dir:
+            name = f'job-{trace.job_id}.trace.json' if trace.job_id is not None else f'job-{id(trace)}.trace.json'
+            try:
+                trace.write(os.path.join(self.trace_dir, name))
+            except OSError:
+                pass
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer(http.server.ThreadingHTTPServer):
+    """Serves ``metrics`` at ``/metrics`` on a local port from a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, metrics, port=9464, host='127.0.0.1'):
+        super().__init__((host, port), _MetricsHandler)
+        self.metrics = metrics
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/metrics'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='metrics', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self.shutdown()
+            self._thread = None
+        self.server_close()
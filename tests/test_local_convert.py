@@ -0,0 +1,52 @@
+"""Converting a file into its own folder must never touch the file itself."""
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import toolchain
+from converter_engine import ConversionJob
+from local_convert import LocalConversion
+
+
+def md5(path):
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+@unittest.skipUnless(shutil.which(os.environ.get('FUNLIGHT_FFMPEG') or 'ffmpeg'), 'needs ffmpeg')
+class ConvertIntoSourceFolderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='funlight-local-')
+        self.source = os.path.join(self.directory, 'a.mp4')
+        # MPEG-4 Part 2 video, which the MP4 target re-encodes
+        subprocess.run([toolchain.get_toolchain().ffmpeg, '-loglevel', 'error', '-f', 'lavfi',
+                        '-i', 'testsrc=size=160x120:rate=10:duration=1', '-f', 'lavfi', '-i', 'sine=duration=1',
+                        '-c:v', 'mpeg4', '-c:a', 'aac', '-shortest', self.source], check=True)
+        self.checksum = md5(self.source)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def conversion(self, format_option):
+        return LocalConversion(ConversionJob(self.source, self.directory, format_option), 'a')
+
+    def test_output_is_not_the_source(self):
+        conversion = self.conversion('MP4,MP3')
+        self.assertNotEqual(os.path.realpath(conversion.output_file('MP4')), os.path.realpath(self.source))
+        self.assertFalse(conversion.up_to_date())
+
+        result = conversion.convert()
+        self.assertEqual(md5(self.source), self.checksum)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['a.mp3', 'a.mp4', 'a.mp4.mp4'])
+        self.assertEqual(result['output_file'], os.path.join(self.directory, 'a.mp4.mp4'))
+        self.assertTrue(self.conversion('MP4,MP3').up_to_date())
+
+
+if __name__ == '__main__':
+    unittest.main()
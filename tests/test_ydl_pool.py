@@ -0,0 +1,133 @@
+"""A YoutubeDL borrowed from the pool must behave like a freshly built one.
+
+The pool reconfigures instances through yt-dlp internals; these tests fail
+when an upgrade of yt-dlp changes what those internals do.
+"""
+import io
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+
+from ydl_pool import PoolCompatibilityError, YoutubeDLPool, check_compatibility
+
+INFO = {
+    'id': 'abc123', 'title': 'A "title"/with: odd chars', 'ext': 'webm', 'extractor': 'generic',
+    'extractor_key': 'Generic', 'webpage_url': 'https://example.com/watch/abc123', 'upload_date': '20231230',
+}
+FORMATS = [
+    {'format_id': 'a-low', 'ext': 'm4a', 'acodec': 'mp4a.40.2', 'vcodec': 'none', 'abr': 64, 'url': 'https://a/1'},
+    {'format_id': 'a-high', 'ext': 'webm', 'acodec': 'opus', 'vcodec': 'none', 'abr': 160, 'url': 'https://a/2'},
+    {'format_id': 'v-360', 'ext': 'mp4', 'acodec': 'none', 'vcodec': 'avc1', 'height': 360, 'url': 'https://v/1'},
+    {'format_id': 'v-720', 'ext': 'webm', 'acodec': 'none', 'vcodec': 'vp9', 'height': 720, 'url': 'https://v/2'},
+    {'format_id': 'av-360', 'ext': 'mp4', 'acodec': 'mp4a.40.2', 'vcodec': 'avc1', 'height': 360,
+     'url': 'https://av/1'},
+]
+
+
+def job_params(directory, format_spec, codec, hook=None):
+    """Options like those ``ConversionEngine`` gives a job."""
+    params = {
+        'quiet': True,
+        'no_warnings': True,
+        'format': format_spec,
+        'outtmpl': os.path.join(directory, '%(title)s [%(id)s].%(ext)s'),
+        'postprocessors': [
+            {'key': 'FFmpegExtractAudio', 'preferredcodec': codec, 'preferredquality': '192'},
+            {'key': 'FFmpegMetadata', 'add_metadata': True},
+            {'key': 'FFmpegConcat', 'only_multi_video': True, 'when': 'playlist'},
+        ],
+    }
+    if hook is not None:
+        params['progress_hooks'] = [hook]
+        params['postprocessor_hooks'] = [hook]
+    return params
+
+
+def selected(ydl):
+    formats = [dict(f) for f in FORMATS]
+    ctx = {'formats': formats, 'incomplete_formats': False,
+           'has_merged_format': any('none' not in (f['acodec'], f['vcodec']) for f in formats)}
+    return [f['format_id'] for f in ydl.format_selector(ctx)]
+
+
+def postprocessors(ydl):
+    return {when: [(type(pp).__name__, pp._downloader is ydl) for pp in pps] for when, pps in ydl._pps.items()}
+
+
+class YoutubeDLPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='funlight-ydl-pool-')
+        self.pool = YoutubeDLPool(max_idle=1, cachedir=os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        self.pool.close()
+
+    def assert_like_fresh(self, borrowed, params):
+        fresh = yt_dlp.YoutubeDL(dict(params, cachedir=self.pool.cachedir))
+        try:
+            self.assertEqual(borrowed.prepare_filename(dict(INFO)), fresh.prepare_filename(dict(INFO)))
+            self.assertEqual(selected(borrowed), selected(fresh))
+            self.assertEqual(postprocessors(borrowed), postprocessors(fresh))
+        finally:
+            fresh.close()
+
+    def test_borrowed_instance_matches_a_fresh_one(self):
+        first = job_params(os.path.join(self.directory, 'one'), 'bestaudio/best', 'mp3')
+        ydl = self.pool.acquire(first)
+        self.assert_like_fresh(ydl, first)
+        self.pool.release(ydl)
+
+        # The same instance again, with other options
+        second = job_params(os.path.join(self.directory, 'two'), 'bestvideo[height<=480]+bestaudio', 'wav')
+        ydl_again = self.pool.acquire(second)
+        self.assertIs(ydl_again, ydl)
+        self.assert_like_fresh(ydl_again, second)
+        self.pool.release(ydl_again)
+
+    def test_release_drops_the_jobs_hooks(self):
+        calls = []
+        ydl = self.pool.acquire(job_params(self.directory, 'best', 'mp3', hook=calls.append))
+        self.assertEqual(ydl._progress_hooks, [calls.append])
+        self.pool.release(ydl)
+        self.assertEqual(ydl._progress_hooks, [])
+        self.assertEqual(ydl._postprocessor_hooks, [])
+        self.assertEqual(ydl._post_hooks, [])
+        self.assertFalse(any(ydl._pps.values()))
+
+        ydl = self.pool.acquire(job_params(self.directory, 'best', 'mp3'))
+        self.assertEqual(ydl._progress_hooks, [])
+        self.assertEqual(ydl._postprocessor_hooks, [])
+        self.pool.release(ydl)
+
+    def test_check_rejects_other_versions(self):
+        ydl = self.pool.acquire({'quiet': True})
+        try:
+            check_compatibility(ydl, yt_dlp.version.__version__)
+            with self.assertRaises(PoolCompatibilityError):
+                check_compatibility(ydl, '2099.01.01')
+        finally:
+            self.pool.release(ydl)
+
+    def test_other_yt_dlp_version_gets_unpooled_instances(self):
+        params = job_params(self.directory, 'bestaudio/best', 'mp3')
+        with mock.patch.object(yt_dlp.version, '__version__', '2099.01.01'), \
+                mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            first = self.pool.acquire(params)
+            self.assert_like_fresh(first, params)
+            self.pool.release(first)
+            second = self.pool.acquire(params)
+            self.pool.release(second)
+        self.assertFalse(self.pool.supported)
+        self.assertIsNot(second, first)
+        self.assertEqual(stderr.getvalue().count('Warning'), 1)
+        self.assertEqual(self.pool.stats()['idle'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,244 @@
+"""FFmpeg toolchain registry.
+
+Resolves ffmpeg/ffprobe once per process and records what the build can
+do (version, encoders, muxers, bitstream filters). The probe result is
+cached on disk keyed by the binary's real path, mtime and size, so after
+the first run jobs start without spawning any probe subprocess.
+
+Lookup order for ffmpeg: explicit override (``set_override`` or the
+``--ffmpeg`` CLI flag), the ``FUNLIGHT_FFMPEG`` environment variable, PATH,
+then the usual Windows install folders. An override may name the binary
+or the directory containing it.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+from app_paths import cache_dir
+
+OVERRIDE_ENV = 'FUNLIGHT_FFMPEG'
+CACHE_VERSION = 1
+
+_WINDOWS_LOCATIONS = [
+    r'C:\ffmpeg\bin',
+    r'C:\Program Files\ffmpeg\bin',
+    os.path.expanduser('~\\AppData\\Local\\Microsoft\\WinGet\\Packages\\Gyan.FFmpeg_Microsoft.Winget.Source_8wekyb3d8bbwe\\ffmpeg-7.1-full_build\\bin'),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ffmpeg', 'bin'),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'venv', 'Scripts'),
+]
+
+_override = None
+_registry = {}
+_lock = threading.Lock()
+
+
+class Toolchain:
+    def __init__(self, ffmpeg, ffprobe, version, banner, encoders, muxers, bsfs):
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.version = version
+        self.banner = banner
+        self.encoders = frozenset(encoders)
+        self.muxers = frozenset(muxers)
+        self.bsfs = frozenset(bsfs)
+
+    def __repr__(self):
+        return f'Toolchain({self.ffmpeg!r}, version={self.version!r})'
+
+    def has_encoder(self, name):
+        return name in self.encoders
+
+    def has_muxer(self, name):
+        return name in self.muxers
+
+    @property
+    def features(self):
+        # Same keys yt-dlp derives from ``ffmpeg -bsfs``
+        mobj = re.search(r'(?m)^\s+libavformat\s+(?:[0-9. ]+)\s+/\s+(?P<runtime>[0-9. ]+)', self.banner)
+        runtime = tuple(int(part) for part in mobj.group('runtime').split('.')) if mobj else None
+        return {
+            'fdk': '--enable-libfdk-aac' in self.banner,
+            'setts': 'setts' in self.bsfs,
+            'needs_adtstoasc': runtime is not None and runtime < (57, 56, 100),
+        }
+
+    def seed_yt_dlp(self):
+        """Prime yt-dlp's per-process ffmpeg version cache with our probe.
+
+        yt-dlp otherwise runs ``ffmpeg -bsfs`` and ``ffprobe -bsfs`` the first
+        time a postprocessor is used. Jobs must pass ``self.ffmpeg`` as
+        ``ffmpeg_location`` for the cache keys to match.
+        """
+        try:
+            from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+            from yt_dlp.utils import detect_exe_version
+        except ImportError:
+            return
+        version = detect_exe_version(self.banner) or False
+        FFmpegPostProcessor._version_cache[self.ffmpeg] = version
+        FFmpegPostProcessor._features_cache[self.ffmpeg] = self.features
+        if self.ffprobe:
+            FFmpegPostProcessor._version_cache.setdefault(self.ffprobe, version)
+
+    def to_dict(self):
+        return {
+            'ffmpeg': self.ffmpeg,
+            'ffprobe': self.ffprobe,
+            'version': self.version,
+            'banner': self.banner,
+            'encoders': sorted(self.encoders),
+            'muxers': sorted(self.muxers),
+            'bsfs': sorted(self.bsfs),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['ffmpeg'], data.get('ffprobe'), data['version'], data['banner'],
+                   data['encoders'], data['muxers'], data['bsfs'])
+
+
+def set_override(location):
+    """Use ``location`` (binary or directory) instead of searching for ffmpeg."""
+    global _override
+    with _lock:
+        _override = location or None
+
+
+def _binary_in(directory, name):
+    for candidate in (name, name + '.exe'):
+        path = os.path.join(directory, candidate)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def locate_ffmpeg(override=None):
+    """Return the path of the ffmpeg binary to use, or None."""
+    for location in (override, _override, os.environ.get(OVERRIDE_ENV)):
+        if not location:
+            continue
+        if os.path.isdir(location):
+            return _binary_in(location, 'ffmpeg')
+        return location if os.path.isfile(location) else None
+
+    path = shutil.which('ffmpeg')
+    if path:
+        return os.path.abspath(path)
+    for directory in _WINDOWS_LOCATIONS:
+        path = _binary_in(directory, 'ffmpeg')
+        if path:
+            return path
+    return None
+
+
+def locate_ffprobe(ffmpeg):
+    directory, filename = os.path.split(ffmpeg)
+    sibling = os.path.join(directory, filename.replace('ffmpeg', 'ffprobe'))
+    if sibling != ffmpeg and os.path.isfile(sibling):
+        return sibling
+    path = shutil.which('ffprobe')
+    return os.path.abspath(path) if path else None
+
+
+def _run(ffmpeg, *args):
+    result = subprocess.run([ffmpeg, *args], capture_output=True, text=True, errors='replace')
+    return result.stdout + result.stderr
+
+
+def _parse_listing(output, pattern):
+    # Entries follow a "---" separator line; the header explains the flags
+    _, _, body = output.partition('\n ---')
+    if not body:
+        _, _, body = output.partition('\n---')
+    return {m.group(1) for m in re.finditer(pattern, body)}
+
+
+def probe(ffmpeg):
+    """Run the probe subprocesses for ``ffmpeg`` and return a Toolchain."""
+    banner = _run(ffmpeg, '-bsfs')
+    mobj = re.search(r'(?:ffmpeg|avconv) version\s+(\S+)', banner)
+    version = mobj.group(1) if mobj else None
+    _, _, bsf_list = banner.partition('Bitstream filters:')
+    bsfs = {line.strip() for line in bsf_list.splitlines() if line.strip()}
+    encoders = _parse_listing(_run(ffmpeg, '-hide_banner', '-encoders'),
+                              r'(?m)^ [VAS][.A-Z]{5} (\S+)')
+    muxers = set()
+    for names in _parse_listing(_run(ffmpeg, '-hide_banner', '-muxers'),
+                                r'(?m)^ [D ]E[d ]? +(\S+)'):
+        muxers.update(names.split(','))
+    return Toolchain(ffmpeg, locate_ffprobe(ffmpeg), version, banner, encoders, muxers, bsfs)
+
+
+def _cache_key(ffmpeg):
+    real = os.path.realpath(ffmpeg)
+    stat = os.stat(real)
+    return f'{real}|{stat.st_mtime_ns}|{stat.st_size}'
+
+
+def _cache_file():
+    return os.path.join(cache_dir(), 'toolchain.json')
+
+
+def _load_cached(key):
+    try:
+        with open(_cache_file(), encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get('cache_version') != CACHE_VERSION:
+        return None
+    entry = data.get('entries', {}).get(key)
+    return Toolchain.from_dict(entry) if entry else None
+
+
+def _store_cached(key, toolchain):
+    path = _cache_file()
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('cache_version') != CACHE_VERSION:
+            raise ValueError('stale cache')
+    except (OSError, ValueError):
+        data = {'cache_version': CACHE_VERSION, 'entries': {}}
+    data['entries'][key] = toolchain.to_dict()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # The cache is only an optimisation
+
+
+def get_toolchain(override=None, refresh=False):
+    """Return the Toolchain for this process, or None if ffmpeg is missing.
+
+    The result is memoised per resolved binary; ``refresh`` forces a new
+    probe (e.g. after the user installed another ffmpeg).
+    """
+    ffmpeg = locate_ffmpeg(override)
+    if ffmpeg is None:
+        return None
+    with _lock:
+        toolchain = None if refresh else _registry.get(ffmpeg)
+        if toolchain is not None:
+            return toolchain
+        try:
+            key = _cache_key(ffmpeg)
+        except OSError:
+            return None
+        toolchain = None if refresh else _load_cached(key)
+        if toolchain is not None and toolchain.ffmpeg != ffmpeg:
+            # Same binary reached through another path (e.g. a symlink)
+            toolchain.ffmpeg, toolchain.ffprobe = ffmpeg, locate_ffprobe(ffmpeg)
+        if toolchain is None:
+            toolchain = probe(ffmpeg)
+            if toolchain.version is None:
+                return None
+            _store_cached(key, toolchain)
+        _registry[ffmpeg] = toolchain
+        return toolchain
@@ -0,0 +1,94 @@
+"""Per-job scratch directories with atomic publishing.
+
+Every job downloads and converts inside its own scratch directory, so
+concurrent jobs never see (or clean up) each other's ``.part``/``.frag``
+files, and half-written outputs never appear in the output directory.
+Finished files are moved into place with ``os.replace``; when the scratch
+root lives on another filesystem (e.g. a tmpfs) the file is first copied
+to a hidden temporary name next to the destination and then renamed, so
+the publish is still atomic. Cleanup removes the job's directory only.
+
+The scratch root defaults to a hidden ``.funlight-tmp`` folder inside the
+output directory (same filesystem, so publishing is a plain rename) and
+can be moved with ``FUNLIGHT_SCRATCH`` or the ``scratch_root`` argument.
+Passing the ``path`` of an earlier workspace reopens it, so a resumed job
+finds the partial files it left behind.
+"""
+import os
+import shutil
+import tempfile
+
+SCRATCH_ENV = 'FUNLIGHT_SCRATCH'
+DEFAULT_SCRATCH_NAME = '.funlight-tmp'
+
+
+def default_scratch_root(output_path):
+    return os.environ.get(SCRATCH_ENV) or os.path.join(output_path, DEFAULT_SCRATCH_NAME)
+
+
+class JobWorkspace:
+    def __init__(self, output_path, scratch_root=None, prefix='job-', path=None):
+        self.output_path = output_path
+        self.scratch_root = os.path.dirname(path) if path else scratch_root or default_scratch_root(output_path)
+        self._owns_root = self.scratch_root == os.path.join(output_path, DEFAULT_SCRATCH_NAME)
+        self.published = []
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self.path = path
+            return
+        while True:
+            os.makedirs(self.scratch_root, exist_ok=True)
+            try:
+                self.path = tempfile.mkdtemp(prefix=prefix, dir=self.scratch_root)
+                break
+            except FileNotFoundError:
+                continue  # Another job's cleanup removed the empty root meanwhile
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
+
+    def partial_bytes(self):
+        """Size of the partial downloads (``.part`` files and fragments) left in the workspace."""
+        total = 0
+        for root, _, files in os.walk(self.path):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files
+                         if name.endswith('.part') or '.part-Frag' in name)
+        return total
+
+    def publish(self, src, name=None):
+        """Move ``src`` from the workspace into the output directory and return the new path.
+
+        ``name`` may include subfolders, which are created as needed.
+        """
+        dest = os.path.join(self.output_path, name or os.path.basename(src))
+        if name and os.path.dirname(name):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            os.replace(src, dest)
+        except OSError:
+            # Different filesystem: copy next to the destination, then rename
+            fd, tmp_path = tempfile.mkstemp(prefix='.publish-', dir=self.output_path)
+            os.close(fd)
+            try:
+                shutil.copyfile(src, tmp_path)
+                shutil.copystat(src, tmp_path)
+                os.replace(tmp_path, dest)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            os.remove(src)
+        self.published.append(dest)
+        return dest
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        if self._owns_root:
+            try:
+                # Drop the hidden default root once the last job is gone
+                os.rmdir(self.scratch_root)
+            except OSError:
+                pass
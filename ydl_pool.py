@@ -0,0 +1,225 @@
+"""Pool of long-lived YoutubeDL instances that jobs borrow.
+
+Building a ``yt_dlp.YoutubeDL`` per job instantiates the extractors again,
+opens fresh HTTP connections and forgets whatever the extractors kept in
+memory (e.g. YouTube's player and signature functions). A
+``YoutubeDLPool`` keeps idle instances around and hands one to each job
+with the job's own options: ``acquire(params)`` swaps in the params and
+rebuilds what YoutubeDL derives from them (output template, format
+selector, hooks, postprocessors), ``release`` returns the instance.
+
+Only options in ``CONNECTION_PARAMS`` are fixed when an instance is
+built; instances built with the same values share one request director
+and cookie jar, so keep-alive connections are reused across jobs and
+threads. yt-dlp's on-disk cache (signature functions, tokens) lives in
+``cachedir``, by default below the application's cache directory.
+
+yt-dlp is only imported once the first instance is built, so a front end
+can set up its pool without waiting for that import.
+
+Rebuilding an instance in place relies on YoutubeDL internals, which
+change between releases. The pool therefore only reuses instances with
+the yt-dlp version it was tested against (``YT_DLP_VERSION``, as pinned in
+requirements.txt) when all of ``YDL_INTERNALS`` are present. With any
+other version it warns once and hands out a new, unpooled YoutubeDL per
+``acquire`` instead, so updating yt-dlp never stops the jobs.
+"""
+import os
+import sys
+import threading
+
+from app_paths import cache_dir
+
+YT_DLP_VERSION = '2023.12.30'
+# YoutubeDL attributes and methods outside its public API that the pool reads or replaces
+YDL_INTERNALS = (
+    '_request_director', '_progress_hooks', '_postprocessor_hooks', '_post_hooks', '_pps',
+    '_download_retcode', '_num_downloads', '_num_videos', '_playlist_level', '_playlist_urls',
+    '_printed_messages', '_parse_outtmpl', 'format_selector', 'build_format_selector',
+)
+
+# Options YoutubeDL consumes when it is built (console, networking,
+# cookies, cache); all others, e.g. ``quiet``, are read per job
+CONNECTION_PARAMS = frozenset([
+    'verbose', 'no_color', 'logtostderr', 'debug_printtraffic', 'compat_opts', 'cachedir',
+    'cookiefile', 'cookiesfrombrowser', 'http_headers', 'proxy', 'geo_verification_proxy',
+    'source_address', 'nocheckcertificate', 'legacyserverconnect', 'socket_timeout',
+    'client_certificate', 'client_certificate_key', 'client_certificate_password',
+    'restrictfilenames', 'download_archive',
+])
+
+
+class PoolCompatibilityError(RuntimeError):
+    """The installed yt-dlp is not the one the pool's use of its internals was tested against."""
+
+
+def default_cachedir():
+    return os.path.join(cache_dir(), 'yt-dlp')
+
+
+def check_compatibility(ydl, version):
+    """Raise ``PoolCompatibilityError`` unless a pool can safely reconfigure ``ydl``."""
+    if version != YT_DLP_VERSION:
+        raise PoolCompatibilityError(f'yt-dlp {version} is installed, but the YoutubeDL pool was only '
+                                     f'tested with {YT_DLP_VERSION}')
+    missing = [name for name in YDL_INTERNALS if not hasattr(ydl, name)]
+    # A cached property: the pool sets the instance's value directly
+    if 'cookiejar' not in type(ydl).__dict__:
+        missing.append('cookiejar')
+    if missing:
+        raise PoolCompatibilityError(f'YoutubeDL lacks {", ".join(missing)}, which the pool relies on')
+
+
+class YoutubeDLPool:
+    """Idle YoutubeDL instances, at most ``max_idle`` per set of connection options.
+
+    Borrowing never waits: without an idle instance a new one is built.
+    ``supported`` is False once the installed yt-dlp turned out to be one
+    the pool cannot reuse instances of. Thread safe.
+    """
+
+    def __init__(self, max_idle=8, cachedir=None):
+        self.max_idle = max_idle
+        self.cachedir = cachedir or default_cachedir()
+        os.makedirs(self.cachedir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._idle = {}
+        # Connection key -> (request director, cookie jar) of the first instance
+        self._shared = {}
+        # Borrowed instance -> (connection key, its params as built), or None if not pooled
+        self._lent = {}
+        self._closed = False
+        self.supported = None
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, params):
+        """Borrow a YoutubeDL configured with ``params``; give it back with ``release``."""
+        if self.supported is False:
+            return self._unpooled(params)
+        connection = {key: value for key, value in params.items() if key in CONNECTION_PARAMS}
+        connection.setdefault('cachedir', self.cachedir)
+        key = repr(sorted(connection.items()))
+        with self._lock:
+            idle = self._idle.get(key)
+            entry = idle.pop() if idle else None
+            if entry is not None:
+                self.reused += 1
+        if entry is None:
+            entry = self._build(key, connection)
+            if entry is None:
+                return self._unpooled(params)
+        ydl, base = entry
+        _configure(ydl, base, {key: value for key, value in params.items() if key not in CONNECTION_PARAMS})
+        with self._lock:
+            self._lent[ydl] = (key, base)
+        return ydl
+
+    def release(self, ydl):
+        """Return a borrowed instance; it is dropped if enough are idle already."""
+        with self._lock:
+            lent = self._lent.pop(ydl)
+        if lent is None:
+            ydl.close()
+            return
+        key, base = lent
+        # Drop the job's hooks so they do not outlive it
+        _configure(ydl, base, {})
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if not self._closed and len(idle) < self.max_idle:
+                idle.append((ydl, base))
+                return
+            shared = self._shared.get(key)
+        if shared is None or ydl._request_director is not shared[0]:
+            ydl.close()
+
+    def stats(self):
+        with self._lock:
+            return {'created': self.created, 'reused': self.reused,
+                    'idle': sum(len(idle) for idle in self._idle.values()), 'lent': len(self._lent)}
+
+    def close(self):
+        """Close the shared connections; borrowed instances keep working until released."""
+        with self._lock:
+            self._closed = True
+            self._idle.clear()
+            shared, self._shared = list(self._shared.values()), {}
+        for director, _ in shared:
+            director.close()
+
+    def _build(self, key, connection):
+        import yt_dlp
+        ydl = yt_dlp.YoutubeDL(dict(connection))
+        if not self._check(ydl, yt_dlp.version.__version__):
+            ydl.close()
+            return None
+        with self._lock:
+            self.created += 1
+            shared = self._shared.get(key)
+            if shared is None and not self._closed:
+                self._shared[key] = (ydl._request_director, ydl.cookiejar)
+        if shared is not None:
+            # Use the connection pool and cookies of the first instance
+            ydl._request_director.close()
+            ydl._request_director = shared[0]
+            ydl.__dict__['cookiejar'] = shared[1]
+        return ydl, dict(ydl.params)
+
+    def _check(self, ydl, version):
+        # On the first build only; the installed yt-dlp does not change while running
+        with self._lock:
+            if self.supported is None:
+                try:
+                    check_compatibility(ydl, version)
+                    self.supported = True
+                except PoolCompatibilityError as e:
+                    self.supported = False
+                    print(f'Warning: {e}; every job builds its own YoutubeDL instead', file=sys.stderr)
+            return self.supported
+
+    def _unpooled(self, params):
+        import yt_dlp
+        ydl = yt_dlp.YoutubeDL(dict(params, cachedir=params.get('cachedir', self.cachedir)))
+        with self._lock:
+            self.created += 1
+            self._lent[ydl] = None
+        return ydl
+
+
+def _configure(ydl, base, job_params):
+    """Give ``ydl`` the params ``base`` + ``job_params`` as if it had been built with them."""
+    from yt_dlp.postprocessor import get_postprocessor
+    from yt_dlp.utils import POSTPROCESS_WHEN
+
+    params = dict(base)
+    params['http_headers'] = base['http_headers'].copy()
+    params['outtmpl'] = dict(base['outtmpl'])
+    params.update(job_params)
+    params.setdefault('forceprint', {})
+    params.setdefault('print_to_file', {})
+    ydl.params = params
+    ydl._parse_outtmpl()
+    format_spec = params.get('format')
+    ydl.format_selector = (format_spec if format_spec in (None, '-') or callable(format_spec)
+                           else ydl.build_format_selector(format_spec))
+    ydl._progress_hooks = []
+    ydl._postprocessor_hooks = []
+    ydl._post_hooks = []
+    for hook in params.get('progress_hooks', []):
+        ydl.add_progress_hook(hook)
+    for hook in params.get('postprocessor_hooks', []):
+        ydl.add_postprocessor_hook(hook)
+    for hook in params.get('post_hooks', []):
+        ydl.add_post_hook(hook)
+    ydl._pps = {when: [] for when in POSTPROCESS_WHEN}
+    for pp_def in params.get('postprocessors', []):
+        pp_def = dict(pp_def)
+        when = pp_def.pop('when', 'post_process')
+        ydl.add_post_processor(get_postprocessor(pp_def.pop('key'))(ydl, **pp_def), when=when)
+    ydl._download_retcode = 0
+    ydl._num_downloads = 0
+    ydl._num_videos = 0
+    ydl._playlist_level = 0
+    ydl._playlist_urls = set()
+    ydl._printed_messages = set()